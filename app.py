@@ -1,14 +1,55 @@
 import time
-from typing import Dict
+import asyncio
+import contextlib
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
 import uvicorn
 from errors.handlers import register_exception_handlers
+from config.settings import get_settings
 from routes import api_router
+from routes.v1 import latest, live, product_types
+from services import metrics
+from services.cache.results import get_result_cache
+from services.db import warmup
+from services.db.resilience import deadline
+from services.db.connector import close_connections, shutdown_executor
 from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    settings = get_settings()
+
+    # Opened before serving, so a result cache file the service cannot trust stops startup.
+    get_result_cache()
+
+    # Warm-up, the latest-value index and the product type directory run in the
+    # background: /healthcheck answers at once, /readiness once the warehouse does,
+    # /latest once the index has loaded. Until the directory has loaded, product types
+    # are looked up per request.
+    tasks = []
+    if settings.warmup_enabled:
+        tasks.append(asyncio.create_task(warmup.run(settings.databricks_warehouse_id)))
+    if settings.latest_index_enabled:
+        tasks.append(asyncio.create_task(latest.run(settings.databricks_warehouse_id)))
+    if settings.product_type_cache_enabled:
+        tasks.append(asyncio.create_task(product_types.run(settings.databricks_warehouse_id)))
+
+    yield
+
+    for task in tasks:
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+    await live.hub.close()
+    shutdown_executor()
+    close_connections()
 
 app = FastAPI(
     title="FastAPI & Databricks Apps",
     description="A simple FastAPI application example for Databricks Apps runtime",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 register_exception_handlers(app)
@@ -22,12 +63,41 @@ async def root() -> Dict[str, str]:
         "docs": "/docs",
     }
 
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics() -> PlainTextResponse:
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+def request_timeout(request: Request) -> Optional[float]:
+    """The configured request deadline, shortened by an X-Request-Timeout header (seconds)."""
+
+    timeout = get_settings().request_timeout_seconds
+    try:
+        requested = float(request.headers.get("x-request-timeout", ""))
+    except ValueError:
+        return timeout
+    return min(timeout, requested) if requested > 0 else timeout
+
 @app.middleware("http")
 async def add_process_time_header(request: Request, call_next):
-    start_time = time.time()
-    response = await call_next(request)
-    process_time = time.time() - start_time
+    start_time = time.monotonic()
+    timings = metrics.begin(request.url.path)
+    status = 500
+    try:
+        with deadline(request_timeout(request)):
+            response = await call_next(request)
+        status = response.status_code
+    finally:
+        process_time = time.monotonic() - start_time
+        # Unknown paths share one series instead of each getting their own.
+        route = request.url.path if "route" in request.scope else "unmatched"
+        metrics.REQUEST_SECONDS.observe(
+            process_time, route=route, method=request.method, status=str(status)
+        )
     response.headers["X-Process-Time"] = str(process_time)
+    if get_settings().server_timing:
+        response.headers["Server-Timing"] = ", ".join(
+            filter(None, [timings.server_timing(), f"total;dur={process_time * 1000:.1f}"])
+        )
     return response
 
 if __name__ == "__main__":
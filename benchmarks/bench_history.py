@@ -0,0 +1,203 @@
+"""Load-test /api/v1/deviceHistory against the fake warehouse and report latency
+percentiles, throughput and memory for each product type, window size and concurrency.
+
+    python -m benchmarks.bench_history [--windows 1h,6h,1d,7d,28d] [--concurrency 1,8,32]
+        [--requests 50] [--devices 5] [--latency-ms 0] [--failure-rate 0] [--no-cache]
+        [--json results.json] [--url http://localhost:8000]
+
+By default the app runs in process (httpx ASGI transport, WAREHOUSE_BACKEND=fake).
+With --url the requests go to a running server instead, which must itself use the fake
+backend with the same FAKE_WAREHOUSE_DEVICES; RSS is then that of this client only.
+Request i of a case reads device i % devices over a window ending i % 60 minutes before
+now, so cached results are reused about as often as under real traffic.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import resource
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+WINDOWS = {
+    "1h": timedelta(hours=1),
+    "6h": timedelta(hours=6),
+    "1d": timedelta(days=1),
+    "7d": timedelta(days=7),
+    "28d": timedelta(days=28),
+}
+
+# Table names as deployed (app.yaml); only used where the environment sets none.
+ENVIRONMENT = {
+    "DATABRICKS_CATALOG": "bench",
+    "DATABRICKS_SCHEMA": "rcs_device_curated",
+    "DATABRICKS_TABLE_MODE": "rcs_da_mode_curated",
+    "DATABRICKS_TABLE_USAGE": "usage",
+    "DATABRICKS_TABLE_1MIN": "rcs_da_1min_curated",
+    "DATABRICKS_TABLE_5MIN": "rcs_da_5min_curated",
+    "DATABRICKS_TABLE_15MIN": "rcs_da_15min_curated",
+    "DATABRICKS_TABLE_1HOUR": "rcs_da_1hr_curated",
+    "DATABRICKS_TABLE_6HOUR": "rcs_da_6hr_curated",
+    "DATABRICKS_TABLE_1DAY": "rcs_da_daily_curated",
+    "DATABRICKS_TABLE_1WEEK": "rcs_da_weekly_curated",
+    "DATABRICKS_WAREHOUSE_ID": "fake",
+}
+
+
+def configure(args) -> None:
+    """Point the app at the fake warehouse; must run before the app is imported."""
+
+    for name, value in ENVIRONMENT.items():
+        os.environ.setdefault(name, value)
+
+    os.environ.update(
+        WAREHOUSE_BACKEND="fake",
+        WARMUP_ENABLED="false",
+        FAKE_WAREHOUSE_DEVICES=str(args.devices),
+        FAKE_WAREHOUSE_LATENCY_MS=str(args.latency_ms),
+        FAKE_WAREHOUSE_FAILURE_RATE=str(args.failure_rate),
+    )
+    if args.no_cache:
+        os.environ["RESULT_CACHE_ENABLED"] = "false"
+        os.environ["WINDOW_CACHE_ENABLED"] = "false"
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """Nearest-rank percentile of already sorted values."""
+
+    if not sorted_values:
+        return float("nan")
+    rank = max(math.ceil(p / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+def rss_mb() -> Optional[float]:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def peak_rss_mb() -> float:
+    # kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if peak > 1 << 32 else peak / 1024
+
+
+def request_params(product_type: str, macs: List[str], window: timedelta, now: datetime, i: int) -> Dict[str, str]:
+    end = now - timedelta(minutes=i % 60)
+    return {
+        "mac_address": macs[i % len(macs)],
+        "product_type": product_type,
+        "from": (end - window).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "to": end.strftime("%Y-%m-%dT%H:%M:%SZ"),
+    }
+
+
+async def run_case(client, product_type: str, macs: List[str], window: timedelta, concurrency: int, requests: int) -> Dict[str, Any]:
+    now = datetime.now(timezone.utc).replace(second=0, microsecond=0)
+    pending = iter(range(requests))
+    latencies: List[float] = []
+    errors: Dict[int, int] = {}
+
+    async def worker():
+        for i in pending:
+            params = request_params(product_type, macs, window, now, i)
+            start = time.perf_counter()
+            response = await client.get("/api/v1/deviceHistory", params=params)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors[response.status_code] = errors.get(response.status_code, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": requests,
+        "errors": errors,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "throughput_rps": requests / elapsed,
+        "rss_mb": rss_mb(),
+    }
+
+
+async def run(args) -> List[Dict[str, Any]]:
+    import httpx
+    from services.db import fake
+
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=None)
+    else:
+        import app
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app.app), base_url="http://bench", timeout=None)
+
+    results = []
+    async with client:
+        devices = fake.devices(args.devices)
+
+        # Seed the fake warehouse and open pooled connections outside the measurements.
+        for product_type, macs in devices.items():
+            now = datetime.now(timezone.utc)
+            await client.get("/api/v1/deviceHistory", params=request_params(product_type, macs, WINDOWS["1h"], now, 0))
+
+        for product_type, macs in devices.items():
+            for window in args.windows:
+                for concurrency in args.concurrency:
+                    result = await run_case(client, product_type, macs, WINDOWS[window], concurrency, args.requests)
+                    result.update(product_type=product_type, window=window, concurrency=concurrency)
+                    results.append(result)
+                    print(
+                        f"{product_type:<24} {window:>4} c={concurrency:<3} "
+                        f"p50 {result['p50_ms']:8.1f} ms  p99 {result['p99_ms']:8.1f} ms  "
+                        f"{result['throughput_rps']:8.1f} req/s  "
+                        f"rss {result['rss_mb'] or float('nan'):6.0f} MB"
+                        + (f"  errors {result['errors']}" if result["errors"] else "")
+                    )
+
+    if not args.url:
+        from services.db.connector import close_connections, shutdown_executor
+        shutdown_executor()
+        close_connections()
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--windows", default="1h,6h,1d,7d,28d", help=f"comma-separated, from {', '.join(WINDOWS)}")
+    parser.add_argument("--concurrency", default="1,8,32", help="comma-separated concurrent clients per case")
+    parser.add_argument("--requests", type=int, default=50, help="requests per case")
+    parser.add_argument("--devices", type=int, default=5, help="fake devices per product type")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="mean added latency per warehouse statement")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="fraction of statements failing transiently")
+    parser.add_argument("--no-cache", action="store_true", help="disable the result and window caches")
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--url", help="benchmark a running server instead of the app in process")
+    args = parser.parse_args()
+
+    args.windows = [w for w in args.windows.split(",") if w]
+    unknown = [w for w in args.windows if w not in WINDOWS]
+    if unknown:
+        parser.error(f"unknown windows: {', '.join(unknown)}")
+    args.concurrency = [int(c) for c in args.concurrency.split(",") if c]
+
+    configure(args)
+    results = asyncio.run(run(args))
+
+    print(f"peak rss: {peak_rss_mb():.0f} MB")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
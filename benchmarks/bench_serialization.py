@@ -0,0 +1,84 @@
+"""Compare the pydantic round-trip used by the buffered deviceHistory renderer with the
+orjson fast path on synthetic payloads.
+
+    python -m benchmarks.bench_serialization [--windows 2000] [--attributes 15] [--repeat 5]
+"""
+import argparse
+import json
+import time
+from datetime import datetime, timedelta, timezone
+from fastapi.encoders import jsonable_encoder
+from models.tables import TableResponse, MixedResponse
+from routes.v1.utils import serialization
+
+
+def synthetic_payload(windows: int, attributes: int):
+    start = datetime(2025, 9, 1, tzinfo=timezone.utc)
+    rows = [
+        {
+            "start_timestamp": start + timedelta(hours=i),
+            "end_timestamp": start + timedelta(hours=i + 1),
+            "min_val": 40.0 + i % 7,
+            "max_val": 60.0 + i % 5,
+            "median_val": 50.0 + i % 3,
+        }
+        for i in range(windows)
+    ]
+    usage = [dict(row, consumption=0.5) for row in rows[: windows // 10]]
+    for row in usage:
+        row.pop("median_val")
+
+    return {
+        "AA:BB:CC:DD:EE:FF": {
+            "agg_attributes": {
+                "aggregation_level": "1 Hour",
+                "attributes": {f"ATTR{a:04d}": rows for a in range(attributes)},
+            },
+            "usage_attributes": {
+                "aggregation_level": "dynamic",
+                "attributes": {"TOTALKWH": usage},
+            },
+        }
+    }
+
+
+def pydantic_path(payload) -> bytes:
+    dumped = TableResponse.model_validate(payload).model_dump(by_alias=True, exclude_none=True)
+    # What FastAPI does with a returned dict before JSONResponse renders it.
+    return json.dumps(jsonable_encoder(dumped), separators=(",", ":")).encode()
+
+
+def fast_path(payload) -> bytes:
+    return serialization.dumps(serialization.shape_sections(payload))
+
+
+def timed(fn, payload, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(payload)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--windows", type=int, default=2000)
+    parser.add_argument("--attributes", type=int, default=15)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    payload = synthetic_payload(args.windows, args.attributes)
+    assert json.loads(pydantic_path(payload)) == json.loads(fast_path(payload))
+
+    slow = timed(pydantic_path, payload, args.repeat)
+    fast = timed(fast_path, payload, args.repeat)
+    rows = args.windows * args.attributes
+
+    print(f"rows: {rows}")
+    print(f"pydantic round-trip: {slow * 1000:8.1f} ms")
+    print(f"orjson fast path:    {fast * 1000:8.1f} ms  ({slow / fast:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import json
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Sequence
+from config.settings import get_settings
+from errors.exceptions import ConfigurationError
+
+# Attributes each history table holds, keyed by the table's source name. A file named
+# by ATTRIBUTE_REGISTRY_PATH ({"agg": [...], "usage": [...], "mode": [...]}) replaces
+# the list of every source it names, so new sensor attributes need no code change.
+DEFAULT_ATTRIBUTES: Dict[str, List[str]] = {
+    "agg": [
+        "UPHTRTMP", "LOHTRTMP", "TEMP__IN", "TEMP_OUT", "SUB_COOL", "TEMP_OST", "TEMP_SST", "TEMP_OLT",
+        "OAT_TEMP", "FLOW_GPM", "PRES_SUC", "PRES_LIQ", "ISACINPC", "ISCSPEED", "INVSPEED",
+    ],
+    "usage": ["TOTALKWH", "CHE_GASU", "GAS_KBTU", "CHE_GALS", "WTR_USED"],
+    "mode": ["HVACMODE", "STATMODE"],
+}
+
+
+class AttributeRegistry:
+
+    def __init__(self, tables: Dict[str, Iterable[str]]):
+        self._tables = {source: list(dict.fromkeys(attributes)) for source, attributes in tables.items()}
+        self._members = {source: set(attributes) for source, attributes in self._tables.items()}
+
+    def attributes(self, source: str) -> List[str]:
+        return list(self._tables.get(source, []))
+
+    def split(
+        self, attributes: Optional[Sequence[str]], sources: Sequence[str]
+    ) -> Dict[str, Optional[List[str]]]:
+        """The requested attributes each source can hold, in request order.
+
+        Without requested attributes every source reads unfiltered (None). Sources none
+        of the requested attributes belong to are left out, so they are never queried.
+        """
+
+        if not attributes:
+            return {source: None for source in sources}
+
+        requested = list(dict.fromkeys(attributes))
+        subsets = {}
+        for source in sources:
+            members = self._members.get(source, set())
+            subset = [attribute for attribute in requested if attribute in members]
+            if subset:
+                subsets[source] = subset
+
+        return subsets
+
+
+def load_registry(path: Optional[str]) -> AttributeRegistry:
+
+    tables = {source: list(attributes) for source, attributes in DEFAULT_ATTRIBUTES.items()}
+    if not path:
+        return AttributeRegistry(tables)
+
+    try:
+        with open(path) as f:
+            overrides = json.load(f)
+    except (OSError, ValueError) as e:
+        raise ConfigurationError(
+            message=f"Could not load the attribute registry: {e}",
+            details={"setting": "attribute_registry_path", "path": path},
+        )
+
+    if not isinstance(overrides, dict) or not all(
+        isinstance(attributes, list) and all(isinstance(a, str) for a in attributes)
+        for attributes in overrides.values()
+    ):
+        raise ConfigurationError(
+            message="The attribute registry must map source names to lists of attribute names",
+            details={"setting": "attribute_registry_path", "path": path},
+        )
+
+    tables.update(overrides)
+    return AttributeRegistry(tables)
+
+
+@lru_cache(maxsize=1)
+def get_attribute_registry() -> AttributeRegistry:
+    return load_registry(get_settings().attribute_registry_path)
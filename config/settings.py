@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import List, Optional
 from pydantic import Field
 from pydantic_settings import BaseSettings
 
@@ -18,6 +18,306 @@ class Settings(BaseSettings):
         description="Maximum number of records that can be returned in a single request",
     )
 
+    max_batch_devices: int = Field(
+        default=100,
+        description="Maximum number of MAC addresses accepted by one batch history request",
+    )
+
+    max_fleet_devices: int = Field(
+        default=1000,
+        description="Maximum number of MAC addresses a fleet aggregate may be restricted to",
+    )
+
+    result_cache_enabled: bool = Field(
+        default=True,
+        description="Cache deviceHistory query results in process",
+    )
+
+    result_cache_backend: str = Field(
+        default="memory",
+        description="Result cache storage: 'memory' (per worker) or 'sqlite' (shared file)",
+    )
+
+    result_cache_path: str = Field(
+        default="/tmp/cx_dva/result_cache.sqlite",
+        description="sqlite file used when result_cache_backend is 'sqlite'; the file and its directory must be owned by the service and writable by it alone",
+    )
+
+    result_cache_max_entries: int = Field(
+        default=2048,
+        description="Maximum number of cached query results",
+    )
+
+    result_cache_max_rows: int = Field(
+        default=2_000_000,
+        description="Maximum number of rows held across all cached query results",
+    )
+
+    window_cache_enabled: bool = Field(
+        default=True,
+        description="Reuse already fetched rollup ranges and only query the missing gaps",
+    )
+
+    window_cache_max_rows: int = Field(
+        default=1_000_000,
+        description="Maximum number of rollup rows kept by the window cache",
+    )
+
+    window_cache_settle_seconds: int = Field(
+        default=900,
+        description="Rows of buckets closing less than this many seconds ago are always re-read",
+    )
+
+    stream_chunk_size: int = Field(
+        default=5000,
+        description="Rows fetched from the warehouse per chunk when streaming a response",
+    )
+
+    fast_serialization: bool = Field(
+        default=True,
+        description="Encode deviceHistory responses directly with orjson instead of a pydantic validate/dump round-trip",
+    )
+
+    columnar_responses: bool = Field(
+        default=False,
+        description="Fetch deviceHistory results as Arrow and serialize them column-wise",
+    )
+
+    warehouse_backend: str = Field(
+        default="databricks",
+        description="Where statements run: 'databricks' (the SQL warehouse) or 'fake' (a seeded local sqlite stand-in)",
+    )
+
+    fake_warehouse_path: str = Field(
+        default="/tmp/cx_dva/fake_warehouse.sqlite",
+        description="sqlite file the fake warehouse is seeded into when a process first connects",
+    )
+
+    fake_warehouse_devices: int = Field(
+        default=5,
+        description="Synthetic devices the fake warehouse holds per product type",
+    )
+
+    fake_warehouse_latency_ms: float = Field(
+        default=0.0,
+        description="Mean added latency of each fake warehouse statement; actual delays vary by +/-50%",
+    )
+
+    fake_warehouse_failure_rate: float = Field(
+        default=0.0,
+        description="Fraction of fake warehouse statements failing with a transient 'Temporarily Unavailable' error",
+    )
+
+    db_executor_workers: int = Field(
+        default=16,
+        description="Maximum number of threads running blocking warehouse calls",
+    )
+
+    single_flight: bool = Field(
+        default=True,
+        description="Share one warehouse execution between identical concurrent queries",
+    )
+
+    db_pool_size: int = Field(
+        default=5,
+        description="Number of warehouse connections kept open in the pool",
+    )
+
+    db_max_overflow: int = Field(
+        default=10,
+        description="Extra connections that may be opened above db_pool_size under load",
+    )
+
+    db_pool_timeout: float = Field(
+        default=10.0,
+        description="Seconds to wait for a free pooled connection before failing",
+    )
+
+    db_pool_recycle_interval: float = Field(
+        default=3600.0,
+        description="Maximum age in seconds of a pooled connection before it is replaced",
+    )
+
+    db_pool_pre_ping_interval: float = Field(
+        default=30.0,
+        description="Idle seconds after which a pooled connection is health-checked before reuse",
+    )
+
+    request_timeout_seconds: float = Field(
+        default=60.0,
+        description="Deadline for the warehouse work of one HTTP request; an X-Request-Timeout header may shorten it",
+    )
+
+    query_timeout_seconds: float = Field(
+        default=60.0,
+        description="Deadline, retries included, for a warehouse statement run outside an HTTP request",
+    )
+
+    db_retry_backoff_initial: float = Field(
+        default=0.8,
+        description="Seconds before the first retry of a statement that failed with a transient error",
+    )
+
+    db_retry_backoff_max: float = Field(
+        default=5.0,
+        description="Longest delay between two retries of a statement",
+    )
+
+    db_breaker_threshold: int = Field(
+        default=5,
+        description="Consecutive transient warehouse failures after which statements fail fast",
+    )
+
+    db_breaker_cooldown_seconds: float = Field(
+        default=30.0,
+        description="Seconds statements fail fast before a trial statement is let through again",
+    )
+
+    attribute_registry_path: Optional[str] = Field(
+        default=None,
+        description="JSON file mapping agg/usage/mode to the attributes each table holds; replaces the built-in lists it names",
+    )
+
+    combined_queries: bool = Field(
+        default=True,
+        description="Read the rollup table and the usage or mode table in one UNION ALL statement",
+    )
+
+    latest_index_enabled: bool = Field(
+        default=True,
+        description="Keep the latest window of every device in memory and serve /latest from it",
+    )
+
+    latest_refresh_seconds: float = Field(
+        default=30.0,
+        description="Seconds between bulk refreshes of the latest-value index",
+    )
+
+    latest_max_staleness_seconds: float = Field(
+        default=120.0,
+        description="/latest answers 503 once the last complete index refresh started longer ago than this",
+    )
+
+    latest_lookback_seconds: float = Field(
+        default=21600.0,
+        description="History read on the first refresh; windows that ended longer ago than this are evicted",
+    )
+
+    latest_overlap_seconds: float = Field(
+        default=300.0,
+        description="Each refresh re-reads this far behind the newest indexed window, to pick up late rows",
+    )
+
+    product_type_cache_enabled: bool = Field(
+        default=True,
+        description="Resolve a missing product_type from an in-memory MAC to product type directory",
+    )
+
+    product_type_refresh_seconds: float = Field(
+        default=300.0,
+        description="Seconds between incremental refreshes of the product type directory",
+    )
+
+    product_type_lookback_seconds: float = Field(
+        default=365 * 86400.0,
+        description="Devices that reported within this long are loaded into the directory at startup",
+    )
+
+    conditional_requests: bool = Field(
+        default=True,
+        description="Send ETag, Last-Modified and Cache-Control on deviceHistory and answer matching conditional GETs with 304",
+    )
+
+    watermark_ttl_seconds: float = Field(
+        default=15.0,
+        description="Seconds a table's newest end_timestamp is reused when validating requests for open windows",
+    )
+
+    etag_unconditional_requests: bool = Field(
+        default=False,
+        description="Read table watermarks to send an ETag on requests without If-None-Match/If-Modified-Since; otherwise they get one only when the watermarks are cached",
+    )
+
+    immutable_max_age_seconds: int = Field(
+        default=86400,
+        description="Cache-Control max-age of responses whose window closed more than window_cache_settle_seconds ago and that every table read has later windows for",
+    )
+
+    live_poll_seconds: float = Field(
+        default=10.0,
+        description="Seconds between reads of new windows for each device watched through /deviceHistory/live",
+    )
+
+    live_lookback_seconds: float = Field(
+        default=900.0,
+        description="History sent when a device starts being watched",
+    )
+
+    live_overlap_seconds: float = Field(
+        default=120.0,
+        description="Each live read re-reads this far behind the newest window sent, to pick up late rows",
+    )
+
+    live_heartbeat_seconds: float = Field(
+        default=15.0,
+        description="Idle live streams send a comment this often so proxies keep them open",
+    )
+
+    live_max_subscribers: int = Field(
+        default=500,
+        description="Open live streams across all devices; further subscriptions get 503",
+    )
+
+    live_queue_size: int = Field(
+        default=64,
+        description="Updates buffered per live stream; a client falling further behind is disconnected",
+    )
+
+    warmup_enabled: bool = Field(
+        default=True,
+        description="Open pooled connections and probe the warehouse at startup, then keep it warm",
+    )
+
+    warmup_max_wait_seconds: float = Field(
+        default=300.0,
+        description="How long a warm-up or keep-alive probe waits for a stopped warehouse to start",
+    )
+
+    keepalive_interval_seconds: float = Field(
+        default=240.0,
+        description="Seconds between keep-alive probes; keep below the warehouse auto-stop time",
+    )
+
+    keepalive_hours: Optional[str] = Field(
+        default="06-20",
+        description="Hours (HH-HH, in keepalive_timezone) during which the warehouse is kept warm; empty for always",
+    )
+
+    keepalive_timezone: str = Field(
+        default="UTC",
+        description="Time zone of keepalive_hours",
+    )
+
+    max_points_limit: int = Field(
+        default=10000,
+        description="Largest max_points a history request may ask for",
+    )
+
+    downsample_oversampling: int = Field(
+        default=4,
+        description="Rows per requested point a rollup table may return before a coarser one is used",
+    )
+
+    server_timing: bool = Field(
+        default=False,
+        description="Add a Server-Timing header with per-stage durations to responses",
+    )
+
+    metric_product_types: List[str] = Field(
+        default=["heatpumpWaterHeaterGen5", "econetControlCenter", "econetZoneController"],
+        description="product_type label values kept on stage metrics; any other value is recorded as \"other\"",
+    )
+
     model_config = {
         "env_file": ".env",
         "case_sensitive": False,
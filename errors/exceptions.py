@@ -38,4 +38,21 @@ class ValidationError(BaseAppException):
         message: str = "Validation error",
         details: Optional[Dict[str, Any]] = None,
     ):
-        super().__init__(message=message, status_code=400, details=details)
\ No newline at end of file
+        super().__init__(message=message, status_code=400, details=details)
+
+class ServiceUnavailableError(BaseAppException):
+    def __init__(
+        self,
+        message: str = "Service temporarily unavailable",
+        details: Optional[Dict[str, Any]] = None,
+    ):
+        super().__init__(message=message, status_code=503, details=details)
+
+
+class DeadlineExceededError(BaseAppException):
+    def __init__(
+        self,
+        message: str = "Request deadline exceeded",
+        details: Optional[Dict[str, Any]] = None,
+    ):
+        super().__init__(message=message, status_code=504, details=details)
@@ -1,3 +1,4 @@
+import math
 from fastapi import FastAPI, Request
 from fastapi.responses import JSONResponse
 from pydantic import ValidationError as PydanticValidationError
@@ -16,6 +17,9 @@ def register_exception_handlers(app: FastAPI) -> None:
     async def handle_base_app_exception(
         request: Request, exc: BaseAppException
     ) -> JSONResponse:
+        headers = None
+        if exc.details.get("retry_after") is not None:
+            headers = {"Retry-After": str(math.ceil(exc.details["retry_after"]))}
         return JSONResponse(
             status_code=exc.status_code,
             content={
@@ -23,6 +27,7 @@ def register_exception_handlers(app: FastAPI) -> None:
                 "message": exc.message,
                 "details": exc.details,
             },
+            headers=headers,
         )
 
     @app.exception_handler(PydanticValidationError)
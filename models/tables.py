@@ -1,5 +1,5 @@
-from typing import Dict, List, Optional
-from pydantic import BaseModel, Field, RootModel, model_validator
+from typing import Dict, List, Literal, Optional
+from pydantic import BaseModel, Field, RootModel
 from datetime import datetime
 
 class HistoryTable(BaseModel):
@@ -12,6 +12,38 @@ class HistoryTable(BaseModel):
         "populate_by_name": True
     }
 
+class BatchHistoryTable(BaseModel):
+    from_: datetime = Field(..., alias="from", description="start date, ej. 2025-09-01T00:00:00Z")
+    to: datetime = Field(..., description="end date, ej. 2025-09-01T00:00:00Z")
+    mac_addresses: List[str] = Field(..., min_length=1, description="MAC_Addresses of the devices")
+    attributes: Optional[List[str]] = Field(None, description="sensor type")
+    product_type: Optional[str] = Field(None, description="device type shared by every MAC; looked up per MAC when omitted")
+    product_types: Dict[str, str] = Field(default_factory=dict, description="per-MAC device type, overrides product_type")
+    max_points: Optional[int] = Field(None, ge=2, description="downsample every series to at most this many windows")
+    downsample: Literal["minmax", "lttb"] = Field("minmax", description="minmax merges windows per bucket, lttb keeps the most significant ones")
+    model_config = {
+        "populate_by_name": True
+    }
+
+    def product_type_of(self, mac_address: str) -> Optional[str]:
+        return self.product_types.get(mac_address, self.product_type)
+
+class FleetWindow(BaseModel):
+    start_timestamp: datetime
+    end_timestamp: datetime
+    min_val: Optional[float] = None
+    p25_val: Optional[float] = None
+    median_val: Optional[float] = None
+    p75_val: Optional[float] = None
+    max_val: Optional[float] = None
+    mean_val: Optional[float] = None
+    devices: int = Field(..., description="devices with a window in this bucket")
+
+class FleetResponse(BaseModel):
+    product_type: str
+    aggregation_level: str
+    attributes: Dict[str, List[FleetWindow]]
+
 class ValueWindow(BaseModel):
     from_: datetime = Field(..., alias="start_timestamp")
     to: datetime = Field(..., alias="end_timestamp")
@@ -115,4 +147,21 @@ class MixedPayload(BaseModel):
     mode_attributes: MixedModeAttributes = Field(default_factory=MixedModeAttributes)
 
 class MixedResponse(RootModel[Dict[str, MixedPayload]]):
-    root: Dict[str, MixedPayload]
\ No newline at end of file
+    root: Dict[str, MixedPayload]
+
+
+#-----------------------------------------------------------------------------------------------------
+#-----------------------------------------------------------------------------------------------------
+#------------------------------------------Latest value models------------------------------------------
+#-----------------------------------------------------------------------------------------------------
+#-----------------------------------------------------------------------------------------------------
+
+class LatestDevice(BaseModel):
+    product_type: Optional[str] = None
+    agg_attributes: Optional[Dict[str, MixedAggWindow]] = None
+    usage_attributes: Optional[Dict[str, UsageAggWindow]] = None
+    mode_attributes: Optional[Dict[str, ModeValueWindow]] = None
+
+class LatestResponse(BaseModel):
+    refreshed_at: datetime
+    devices: Dict[str, LatestDevice]
\ No newline at end of file
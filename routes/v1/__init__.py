@@ -1,7 +1,11 @@
 from fastapi import APIRouter
 from .healthcheck import router as healthcheck_router
 from .db import router as db_router
+from .latest import router as latest_router
+from .live import router as live_router
 
 router = APIRouter()
 router.include_router(healthcheck_router)
-router.include_router(db_router)
\ No newline at end of file
+router.include_router(db_router)
+router.include_router(latest_router)
+router.include_router(live_router)
\ No newline at end of file
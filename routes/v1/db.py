@@ -1,19 +1,40 @@
 import os
+import json
+import time
+import asyncio
 import logging
-from fastapi import APIRouter, Depends, Query, HTTPException
+from functools import partial
+from itertools import groupby
+from operator import itemgetter
+from pydantic import TypeAdapter
+from fastapi import APIRouter, Depends, Query, HTTPException, Request
 from config.settings import Settings, get_settings
-from errors.exceptions import ConfigurationError
-from models.tables import HistoryTable, TableResponse, ModeResponse, MixedResponse
-from services.db.connector import   query
-from typing import List, Dict, Any, Union, Optional
+from config.attributes import get_attribute_registry
+from errors.exceptions import ConfigurationError, DeadlineExceededError, ServiceUnavailableError
+from models.tables import HistoryTable, BatchHistoryTable, TableResponse, ModeResponse, MixedResponse, FleetResponse
+from models.tables import ValueWindow, UsageAggWindow, ModeValueWindow, MixedAggWindow, MixedModeWindow
+from services import metrics
+from services.db.connector import aquery, astream
+from services.cache.results import get_result_cache, bucket_seconds, normalize_window, ttl_for
+from services.cache.watermarks import get_watermark_cache
+from services.cache.windows import get_window_cache, to_epoch, from_epoch
+from typing import List, Dict, Any, Union, Literal, Optional, Sequence, Tuple, Awaitable, Callable, AsyncIterator
 from datetime import datetime, timezone
-from .utils.utils import calculate_aggregation_level
+from .utils.utils import calculate_aggregation_level, aggregation_level_for_points
 from .utils.utils import is_valid_mac_address
+from .utils import columnar, conditional, downsample, formats, pagination, query_builder, serialization
+from . import product_types
 
 from .utils.queries import AGG_QUERY_WITH_ATTR, AGG_QUERY_NO_ATTR, USAGE_QUERY_WITH_ATTR, USAGE_QUERY_NO_ATTR, MODE_QUERY_WITH_ATTR, MODE_QUERY_NO_ATTR
+from .utils.queries import AGG_BATCH_QUERY_WITH_ATTR, AGG_BATCH_QUERY_NO_ATTR, USAGE_BATCH_QUERY_WITH_ATTR, USAGE_BATCH_QUERY_NO_ATTR, MODE_BATCH_QUERY_WITH_ATTR, MODE_BATCH_QUERY_NO_ATTR
+from .utils.queries import AGG_USAGE_QUERY_WITH_ATTR, AGG_USAGE_QUERY_NO_ATTR, AGG_MODE_QUERY_WITH_ATTR, AGG_MODE_QUERY_NO_ATTR
+from .utils.queries import AGG_USAGE_BATCH_QUERY_WITH_ATTR, AGG_USAGE_BATCH_QUERY_NO_ATTR, AGG_MODE_BATCH_QUERY_WITH_ATTR, AGG_MODE_BATCH_QUERY_NO_ATTR
+from .utils.queries import FLEET_QUERY, FLEET_MACS_QUERY, WATERMARK_QUERY
+from .utils.queries import AGG_PAGE_QUERY_WITH_ATTR, AGG_PAGE_QUERY_NO_ATTR, USAGE_PAGE_QUERY_WITH_ATTR, USAGE_PAGE_QUERY_NO_ATTR, MODE_PAGE_QUERY_WITH_ATTR, MODE_PAGE_QUERY_NO_ATTR, SEEK_PREDICATE
+from .utils.queries import AGG_STREAM_QUERY_WITH_ATTR, AGG_STREAM_QUERY_NO_ATTR, USAGE_STREAM_QUERY_WITH_ATTR, USAGE_STREAM_QUERY_NO_ATTR, MODE_STREAM_QUERY_WITH_ATTR, MODE_STREAM_QUERY_NO_ATTR
 
 from fastapi.encoders import jsonable_encoder
-from fastapi.responses import JSONResponse
+from fastapi.responses import Response, StreamingResponse
 
 router = APIRouter(tags=["tables"])
 
@@ -25,378 +46,1359 @@ DBPATH = f"{CATALOG}.{SCHEMA}"
 MODETABLE = os.getenv("DATABRICKS_TABLE_MODE")
 USAGETABLE = os.getenv("DATABRICKS_TABLE_USAGE")
 
-usage_list = ["TOTALKWH", "CHE_GASU", "GAS_KBTU", "CHE_GALS", "WTR_USED"]
-agg_list = ["UPHTRTMP", "LOHTRTMP", "TEMP__IN", "TEMP_OUT", "SUB_COOL", "TEMP_OST","TEMP_SST", "TEMP_OLT","OAT_TEMP", "FLOW_GPM", "PRES_SUC", "PRES_LIQ", "ISACINPC","ISCSPEED", "INVSPEED"]
-mode_list = ["HVACMODE","STATMODE"]
+MODE_TYPES = "econetZoneController"
+MIXED_TYPES = "econetControlCenter"
+
+# Raised by the connector with their own status (503 / 504); not wrapped as read errors.
+WAREHOUSE_UNAVAILABLE = (ServiceUnavailableError, DeadlineExceededError)
+
+# Every table the history endpoints read from: the column rows are grouped by,
+# the (with attributes, without attributes) templates for one MAC, for many, for
+# keyset pages and for streaming, and the window columns its rows carry, in select order. The
+# attributes each table holds come from the attribute registry.
+SOURCES = {
+    "agg": {
+        "key": "attribute",
+        "single": (AGG_QUERY_WITH_ATTR, AGG_QUERY_NO_ATTR),
+        "batch": (AGG_BATCH_QUERY_WITH_ATTR, AGG_BATCH_QUERY_NO_ATTR),
+        "paged": (AGG_PAGE_QUERY_WITH_ATTR, AGG_PAGE_QUERY_NO_ATTR),
+        "stream": (AGG_STREAM_QUERY_WITH_ATTR, AGG_STREAM_QUERY_NO_ATTR),
+        "columns": ("start_timestamp", "end_timestamp", "min_val", "max_val", "median_val"),
+    },
+    "usage": {
+        "key": "attribute",
+        "single": (USAGE_QUERY_WITH_ATTR, USAGE_QUERY_NO_ATTR),
+        "batch": (USAGE_BATCH_QUERY_WITH_ATTR, USAGE_BATCH_QUERY_NO_ATTR),
+        "paged": (USAGE_PAGE_QUERY_WITH_ATTR, USAGE_PAGE_QUERY_NO_ATTR),
+        "stream": (USAGE_STREAM_QUERY_WITH_ATTR, USAGE_STREAM_QUERY_NO_ATTR),
+        "columns": ("start_timestamp", "end_timestamp", "min_val", "max_val", "consumption"),
+    },
+    "mode": {
+        "key": "mode_attr",
+        "single": (MODE_QUERY_WITH_ATTR, MODE_QUERY_NO_ATTR),
+        "batch": (MODE_BATCH_QUERY_WITH_ATTR, MODE_BATCH_QUERY_NO_ATTR),
+        "paged": (MODE_PAGE_QUERY_WITH_ATTR, MODE_PAGE_QUERY_NO_ATTR),
+        "stream": (MODE_STREAM_QUERY_WITH_ATTR, MODE_STREAM_QUERY_NO_ATTR),
+        "columns": (
+            "mode_value", "start_timestamp", "end_timestamp", "window_duration_S",
+            "HEATSETP_min", "HEATSETP_max", "HEATSETP_median",
+            "COOLSETP_min", "COOLSETP_max", "COOLSETP_median",
+            "SPT_min", "SPT_max", "SPT_median",
+        ),
+    },
+}
+
+# Source pairs read in one UNION ALL statement: (with attributes, without attributes)
+# templates for one MAC and for many.
+COMBINED = {
+    ("agg", "usage"): {
+        "single": (AGG_USAGE_QUERY_WITH_ATTR, AGG_USAGE_QUERY_NO_ATTR),
+        "batch": (AGG_USAGE_BATCH_QUERY_WITH_ATTR, AGG_USAGE_BATCH_QUERY_NO_ATTR),
+    },
+    ("agg", "mode"): {
+        "single": (AGG_MODE_QUERY_WITH_ATTR, AGG_MODE_QUERY_NO_ATTR),
+        "batch": (AGG_MODE_BATCH_QUERY_WITH_ATTR, AGG_MODE_BATCH_QUERY_NO_ATTR),
+    },
+}
+
+def _sources_for(product_type: str, attributes: Optional[List[str]]) -> Dict[str, Optional[List[str]]]:
+    """Tables to read for a product type, each with the requested attributes it can hold
+    (None when unfiltered). Tables that cannot hold any of them are not read at all."""
+
+    if product_type == MODE_TYPES:
+        sources = ["mode"]
+    else:
+        sources = ["agg", "mode" if product_type == MIXED_TYPES else "usage"]
+
+    return get_attribute_registry().split(attributes, sources)
+
+
+def _table_path(source: str, agg_table: Optional[str]) -> str:
+
+    if source == "mode":
+        return f"{DBPATH}.{MODETABLE}"
+    if source == "usage":
+        return f"{DBPATH}.{USAGETABLE}"
+    return f"{DBPATH}.{agg_table}"
+
+
+def _build_query(
+    source: str,
+    table_path: str,
+    mac_addresses: List[str],
+    product_type: str,
+    attributes: Optional[List[str]],
+    from_: datetime,
+    to: datetime,
+    limit: Optional[int] = None,
+    after: Optional[Tuple[str, datetime]] = None,
+    stream: bool = False,
+) -> Tuple[str, Tuple[Any, ...]]:
+    """SQL and parameters for one table read. With a limit the read is a keyset page
+    that resumes after the (attribute, start_timestamp) in `after`; a stream read comes
+    ordered by attribute first."""
+
+    macs = query_builder.canonical(mac_addresses)
+    attrs = query_builder.canonical(attributes)
+
+    if limit is not None:
+        variant = "paged"
+    elif stream:
+        variant = "stream"
+    else:
+        variant = "batch" if len(macs) > 1 else "single"
+    template_with_attr, template_no_attr = SOURCES[source][variant]
+    seek = SEEK_PREDICATE.format(key=SOURCES[source]["key"]) if after else ""
 
-@router.get("/deviceHistory")
-async def table(
-    mac_address: str = Query(..., description="MAC Address of device"),
-    product_type: str = Query(..., description="Device type, ex: heatpumpWaterHeaterGen5, econetControlCenter"),
-    from_: datetime = Query(..., alias="from", description="start date, ej. 2025-09-01T00:00:00Z"),
-    to: datetime = Query(..., description="end date, ej. 2025-09-01T00:00:00Z"),
-    attributes: Optional[List[str]] = Query(None, description="One or more attributes, ex: LOHTRTMP, UPHTRTMP"),
-    settings: Settings = Depends(get_settings),
-):
+    q = query_builder.build(
+        template_with_attr if attrs else template_no_attr, table_path,
+        macs=len(macs), attributes=len(attrs), seek=seek, limit=limit
+    )
+    args = (
+        *macs,
+        *attrs,
+        product_type,
+        to.astimezone(timezone.utc),
+        from_.astimezone(timezone.utc)
+    )
 
-    #if not is_valid_mac_address(mac_address):
-    #    raise HTTPException(status_code=422, detail="Invalid MAC address format")
-    
-    if from_ > to:
-        raise HTTPException(status_code=400, detail="The FROM date must be earlier than TO date")
-        
-    params = HistoryTable(
-        from_=from_,
-        to=to,
-        mac_address=mac_address,
-        attributes=attributes,
-        product_type=product_type,
+    if after:
+        args = (*args, after[0], after[0], after[1])
+
+    return q, args
+
+
+def _build_combined_query(
+    sources: Tuple[str, str],
+    table_paths: Tuple[str, str],
+    mac_addresses: List[str],
+    product_type: str,
+    attributes: Tuple[Optional[List[str]], Optional[List[str]]],
+    from_: datetime,
+    to: datetime,
+) -> Tuple[str, Tuple[Any, ...]]:
+    """SQL and parameters reading both sources at once; `attributes` holds each
+    source's own subset, both None when unfiltered."""
+
+    macs = query_builder.canonical(mac_addresses)
+    agg_attrs, other_attrs = (query_builder.canonical(subset) for subset in attributes)
+
+    template_with_attr, template_no_attr = COMBINED[sources]["batch" if len(macs) > 1 else "single"]
+    q = query_builder.build(
+        template_with_attr if agg_attrs else template_no_attr, *table_paths,
+        macs=len(macs), attributes=len(agg_attrs), other_attributes=len(other_attrs)
     )
 
-    warehouse_id = settings.databricks_warehouse_id
-    if not warehouse_id:
-        raise ConfigurationError(
-            message="SQL warehouse ID not configured",
-            details={"setting": "databricks_warehouse_id"},
+    args = ()
+    for attrs in (agg_attrs, other_attrs):
+        args += (
+            *macs,
+            *attrs,
+            product_type,
+            to.astimezone(timezone.utc),
+            from_.astimezone(timezone.utc)
         )
 
-    mode_types = "econetZoneController"
-    mixed_types = "econetControlCenter"
-    if params.attributes != None and params.attributes != [] and params.attributes != "":
-        in_placeholders = ",".join(["?"] * len(params.attributes))
+    return q, args
 
-    if params.product_type == mode_types :
 
-        table_path = f"{DBPATH}.{MODETABLE}"
+def _build_fleet_query(
+    table_path: str,
+    mac_addresses: Optional[List[str]],
+    product_type: str,
+    attributes: List[str],
+    from_: datetime,
+    to: datetime,
+) -> Tuple[str, Tuple[Any, ...]]:
 
-        if params.attributes != None and params.attributes != [] and params.attributes != "":
+    macs = query_builder.canonical(mac_addresses)
+    attrs = query_builder.canonical(attributes)
 
-            q= MODE_QUERY_WITH_ATTR.format(table_path=table_path, in_placeholders=in_placeholders)
-            
-            params = (
-                params.mac_address,
-                *params.attributes,
-                params.product_type,
-                params.to.astimezone(timezone.utc),
-                params.from_.astimezone(timezone.utc)
-            )
+    q = query_builder.build(
+        FLEET_MACS_QUERY if macs else FLEET_QUERY, table_path, macs=len(macs), attributes=len(attrs)
+    )
+    args = (
+        *macs,
+        *attrs,
+        product_type,
+        to.astimezone(timezone.utc),
+        from_.astimezone(timezone.utc)
+    )
 
-        else:
+    return q, args
 
-            q= MODE_QUERY_NO_ATTR.format(table_path=table_path)
-            
-            params = (
-                params.mac_address,
-                params.product_type,
-                params.to.astimezone(timezone.utc),
-                params.from_.astimezone(timezone.utc)
-            )
-        
-        try:
-            q_results : List[Dict[str, Any]] = query(q, warehouse_id, params)
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Error while reading database: {e}")
-        
-        grouped: Dict[str, List[Dict[str, Any]]] = {}
-
-        for row in q_results:
-            key = row["mode_attr"]
-            item = dict(row)
-            item.pop("mac_address")
-            item.pop("mode_attr")
-            grouped.setdefault(key, []).append(item)
-
-        result = {
-            mac_address: {
-                "attributes": grouped
-            }
-        }
 
-        payload = jsonable_encoder(
-            result, by_alias=True, custom_encoder={}
+def _demux_rows(
+    rows: List[Dict[str, Any]], sources: Sequence[str]
+) -> Dict[str, Dict[str, Dict[str, List[Dict[str, Any]]]]]:
+    """Split combined rows on their `source` column into {source: {mac: {attribute: windows}}},
+    keeping only the columns each source really has."""
+
+    grouped: Dict[str, Dict[str, Dict[str, List[Dict[str, Any]]]]] = {source: {} for source in sources}
+
+    for row in rows:
+        source = row["source"]
+        window = {column: row[column] for column in SOURCES[source]["columns"]}
+        grouped[source].setdefault(row["mac_address"], {}).setdefault(row["attribute"], []).append(window)
+
+    return grouped
+
+
+def _group_rows(rows: List[Dict[str, Any]], key: str) -> Dict[str, Dict[str, List[Dict[str, Any]]]]:
+    """Group rows as {mac_address: {attribute: [window, ...]}}, keeping query order."""
+
+    grouped: Dict[str, Dict[str, List[Dict[str, Any]]]] = {}
+
+    for row in rows:
+        item = dict(row)
+        attr = item.pop(key)
+        mac = item.pop("mac_address", None)
+        grouped.setdefault(mac, {}).setdefault(attr, []).append(item)
+
+    return grouped
+
+
+async def _fetch_grouped(
+    label: str, q: str, args: Sequence[Any], key: str, warehouse_id: str
+) -> Dict[str, Dict[str, List[Dict[str, Any]]]]:
+
+    try:
+        q_results : List[Dict[str, Any]] = await aquery(q, warehouse_id, args)
+    except WAREHOUSE_UNAVAILABLE:
+        raise
+    except Exception as e:
+        logger.error("%s query failed: %s", label, e)
+        raise HTTPException(status_code=500, detail=f"Error while reading database: {e}")
+
+    with metrics.stage("group"):
+        return _group_rows(q_results, key)
+
+
+def _row_count(result: Any) -> int:
+    if hasattr(result, "num_rows"):
+        return result.num_rows
+    return sum(len(windows) for attrs in result.values() for windows in attrs.values())
+
+
+async def _fetch_cached(
+    cache_key: Optional[str],
+    level: Optional[str],
+    load: Callable[[], Awaitable[Dict[str, Dict[str, List[Dict[str, Any]]]]]],
+) -> Dict[str, Dict[str, List[Dict[str, Any]]]]:
+
+    cache = get_result_cache() if cache_key else None
+    if cache is not None:
+        cached = await cache.aget(cache_key)
+        if cached is not None:
+            return cached
+
+    return await _load_and_store(cache_key, level, load)
+
+
+async def _load_and_store(
+    cache_key: Optional[str],
+    level: Optional[str],
+    load: Callable[[], Awaitable[Dict[str, Dict[str, List[Dict[str, Any]]]]]],
+) -> Dict[str, Dict[str, List[Dict[str, Any]]]]:
+
+    grouped = await load()
+
+    cache = get_result_cache() if cache_key else None
+    if cache is not None:
+        await cache.aset(cache_key, grouped, level, weight=max(_row_count(grouped), 1))
+
+    return grouped
+
+
+async def _ready(value: Any) -> Any:
+    return value
+
+
+def _settled_until(level: str) -> float:
+    """Only buckets that closed a while ago are final; later ones are always re-read."""
+
+    bucket = bucket_seconds(level)
+    settled_until = time.time() - get_settings().window_cache_settle_seconds
+    return settled_until - settled_until % bucket
+
+
+async def _fetch_windowed(
+    source: str,
+    table_path: str,
+    mac_addresses: List[str],
+    product_type: str,
+    attributes: Optional[List[str]],
+    from_: datetime,
+    to: datetime,
+    level: str,
+    warehouse_id: str,
+) -> Dict[str, Dict[str, List[Dict[str, Any]]]]:
+    """Read a rollup table through the window cache, querying only uncovered ranges."""
+
+    window_cache = get_window_cache()
+    table = (table_path, product_type)
+    key = SOURCES[source]["key"]
+    start, end = to_epoch(from_), to_epoch(to)
+
+    gaps = window_cache.gaps(table, mac_addresses, attributes, start, end)
+    if not gaps:
+        outcome = "hit"
+    elif len(gaps) == 1 and tuple(gaps[0]) == (start, end):
+        outcome = "miss"
+    else:
+        outcome = "partial"
+    metrics.CACHE_LOOKUPS.inc(cache="window", result=outcome)
+
+    fetches = {}
+    for gap_start, gap_end in gaps:
+        q, args = _build_query(
+            source, table_path, mac_addresses, product_type, attributes,
+            from_epoch(gap_start), from_epoch(gap_end)
         )
+        fetches[(gap_start, gap_end)] = _fetch_grouped(source, q, args, key, warehouse_id)
+
+    fetched = await _gather(fetches)
 
-        return ModeResponse(root=result)
+    grouped = window_cache.fill(
+        table, mac_addresses, attributes, start, end, list(fetched.items()), _settled_until(level)
+    )
+    if grouped is not None:
+        return grouped
 
-    elif params.product_type == mixed_types:
+    # Segments were evicted between planning and stitching: fall back to one full read.
+    q, args = _build_query(source, table_path, mac_addresses, product_type, attributes, from_, to)
+    return await _fetch_grouped(source, q, args, key, warehouse_id)
 
-        mac_address = str(mac_address)
 
-        env_table, level = calculate_aggregation_level(from_, to)
-        TABLE = os.getenv(env_table)
+async def _gather(fetches: Dict[Any, Awaitable[Any]]) -> Dict[Any, Any]:
+    """Run independent sub-queries concurrently; if one fails the others are cancelled."""
+
+    tasks = {name: asyncio.ensure_future(fetch) for name, fetch in fetches.items()}
 
-        table_path1 = f"{DBPATH}.{TABLE}"
-        table_path3 = f"{DBPATH}.{MODETABLE}"
+    try:
+        await asyncio.gather(*tasks.values())
+    except BaseException:
+        for task in tasks.values():
+            task.cancel()
+        raise
 
-        common = []
-        common3 = []
+    return {name: task.result() for name, task in tasks.items()}
 
-        if params.attributes != None and params.attributes != [] and params.attributes != "":
 
-            common = any(att in params.attributes for att in agg_list)
+async def _fetch_combined(
+    sources: Tuple[str, str],
+    table_paths: Tuple[str, str],
+    mac_addresses: List[str],
+    product_type: str,
+    attributes: Tuple[Optional[List[str]], Optional[List[str]]],
+    from_: datetime,
+    to: datetime,
+    level: Optional[str],
+    warehouse_id: str,
+) -> Dict[str, Dict[str, Dict[str, List[Dict[str, Any]]]]]:
+    """Read both sources in one statement. The rollup rows also seed the window cache,
+    exactly as a windowed read of the full range would."""
+
+    q, args = _build_combined_query(
+        sources, table_paths, mac_addresses, product_type, attributes, from_, to
+    )
 
-            q = AGG_QUERY_WITH_ATTR.format(table_path=table_path1, in_placeholders=in_placeholders)
+    try:
+        rows: List[Dict[str, Any]] = await aquery(q, warehouse_id, args)
+    except WAREHOUSE_UNAVAILABLE:
+        raise
+    except Exception as e:
+        logger.error("%s query failed: %s", "+".join(sources), e)
+        raise HTTPException(status_code=500, detail=f"Error while reading database: {e}")
+
+    with metrics.stage("group"):
+        grouped = _demux_rows(rows, sources)
+
+    window_cache = get_window_cache()
+    if window_cache is not None and bucket_seconds(level):
+        start, end = to_epoch(from_), to_epoch(to)
+        window_cache.fill(
+            (table_paths[0], product_type), mac_addresses, attributes[0], start, end,
+            [((start, end), grouped["agg"])], _settled_until(level)
+        )
 
-            params1 = (
-                params.mac_address,
-                *params.attributes,
-                params.product_type,
-                params.to.astimezone(timezone.utc),
-                params.from_.astimezone(timezone.utc)
+    return grouped
+
+
+class _SharedFetch:
+    """One load whose result several planned fetches pick their part from."""
+
+    def __init__(self, load: Callable[[], Awaitable[Dict[str, Any]]]):
+        self._load = load
+        self._task: Optional[asyncio.Future] = None
+
+    async def part(self, name: str) -> Any:
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._load())
+        return (await self._task)[name]
+
+
+async def _plan_fetches(
+    product_type: str,
+    mac_addresses: List[str],
+    attributes: Optional[List[str]],
+    from_: datetime,
+    to: datetime,
+    agg_table: Optional[str],
+    level: Optional[str],
+    warehouse_id: str,
+) -> Dict[str, Awaitable[Any]]:
+
+    fetches = {}
+    misses = {}
+    cache = get_result_cache()
+    window_cache = get_window_cache()
+    windowed = set()
+    sources = _sources_for(product_type, attributes)
+
+    for source, source_attributes in sources.items():
+        table_path = _table_path(source, agg_table)
+        # Usage and mode windows are not tied to the rollup level.
+        source_level = level if source == "agg" else None
+
+        cache_key = None
+        if cache is not None:
+            cache_key = cache.make_key(
+                table_path, mac_addresses, product_type, source_attributes, from_, to, source_level
+            )
+            cached = await cache.aget(cache_key)
+            if cached is not None:
+                fetches[source] = _ready(cached)
+                continue
+
+        if window_cache is not None and bucket_seconds(source_level):
+            windowed.add(source)
+            load = partial(
+                _fetch_windowed, source, table_path, mac_addresses, product_type,
+                source_attributes, from_, to, source_level, warehouse_id
             )
         else:
+            q, args = _build_query(
+                source, table_path, mac_addresses, product_type, source_attributes, from_, to
+            )
+            load = partial(_fetch_grouped, source, q, args, SOURCES[source]["key"], warehouse_id)
+
+        misses[source] = (table_path, cache_key, source_level, load)
+
+    pair = tuple(misses)
+    if pair in COMBINED and get_settings().combined_queries and (
+        "agg" not in windowed
+        or _uncovered(window_cache, misses["agg"][0], product_type, mac_addresses, sources["agg"], from_, to)
+    ):
+        shared = _SharedFetch(partial(
+            _fetch_combined, pair, tuple(misses[source][0] for source in pair), mac_addresses,
+            product_type, tuple(sources[source] for source in pair), from_, to, level, warehouse_id
+        ))
+        misses = {
+            source: (table_path, cache_key, source_level, partial(shared.part, source))
+            for source, (table_path, cache_key, source_level, _) in misses.items()
+        }
 
-            common = agg_list
+    for source, (_, cache_key, source_level, load) in misses.items():
+        fetches[source] = _load_and_store(cache_key, source_level, load)
+
+    return {source: fetches[source] for source in sources}
+
+
+def _uncovered(
+    window_cache: Any,
+    table_path: str,
+    product_type: str,
+    mac_addresses: List[str],
+    attributes: Optional[List[str]],
+    from_: datetime,
+    to: datetime,
+) -> bool:
+    """True when the window cache holds nothing of the range, so a windowed read would
+    query all of it anyway."""
+
+    start, end = to_epoch(from_), to_epoch(to)
+    return window_cache.gaps((table_path, product_type), mac_addresses, attributes, start, end) == [(start, end)]
+
+
+async def _fetch_page(
+    params: HistoryTable,
+    agg_table: Optional[str],
+    warehouse_id: str,
+    limit: int,
+    cursor: Optional[pagination.Cursor],
+    fingerprint: str,
+) -> Tuple[Dict[str, Dict[str, List[Dict[str, Any]]]], Optional[pagination.Cursor]]:
+    """Up to `limit` windows of one device in (source, attribute, start_timestamp) order,
+    and the cursor of the following page, or None on the last page. The cursor must
+    already be checked to belong to this query."""
+
+    sources = _sources_for(params.product_type, params.attributes)
+
+    if cursor is not None:
+        names = list(sources)
+        sources = {source: sources[source] for source in names[names.index(cursor.source):]}
+
+    grouped: Dict[str, Dict[str, List[Dict[str, Any]]]] = {}
+    remaining = limit
+
+    for i, (source, source_attributes) in enumerate(sources.items()):
+        if remaining == 0:
+            return grouped, pagination.Cursor(source, None, None, fingerprint)
+
+        after = None
+        if i == 0 and cursor is not None and cursor.attribute is not None:
+            after = (cursor.attribute, cursor.start)
+
+        key = SOURCES[source]["key"]
+        # One row past the page tells whether this source continues on the next one.
+        q, args = _build_query(
+            source, _table_path(source, agg_table), [params.mac_address], params.product_type,
+            source_attributes, params.from_, params.to, limit=remaining + 1, after=after
+        )
 
-            q = AGG_QUERY_NO_ATTR.format(table_path=table_path1)
+        try:
+            rows: List[Dict[str, Any]] = await aquery(q, warehouse_id, args)
+        except WAREHOUSE_UNAVAILABLE:
+            raise
+        except Exception as e:
+            logger.error("%s page query failed: %s", source, e)
+            raise HTTPException(status_code=500, detail=f"Error while reading database: {e}")
 
-            params1 = (
-                params.mac_address,
-                params.product_type,
-                params.to.astimezone(timezone.utc),
-                params.from_.astimezone(timezone.utc)
-            )
+        page = rows[:remaining]
+        grouped[source] = _group_rows(page, key).get(params.mac_address, {})
 
-        if common:
+        if len(rows) > remaining:
+            last = page[-1]
+            return grouped, pagination.Cursor(source, last[key], last["start_timestamp"], fingerprint)
 
-            try:
-                q_results : List[Dict[str, Any]] = query(q, warehouse_id, params1)
-            except Exception as e:
-                raise HTTPException(status_code=500, detail=f"Error while reading database: {e}")
+        remaining -= len(page)
 
-            grouped1: Dict[str, List[Dict[str, Any]]] = {}
+    return grouped, None
 
-            for row in q_results:
-                key = row["attribute"]
-                item = dict(row)
-                item.pop("attribute", None)
-                item.pop("mac_address", None)
-                grouped1.setdefault(key, []).append(item)
 
-            dictAggregations = {
-                "aggregation_level": level,
-                "attributes": grouped1
-            }
+def _downsampled(
+    source: str,
+    grouped: Dict[str, Dict[str, List[Dict[str, Any]]]],
+    max_points: Optional[int],
+    method: str,
+) -> Dict[str, Dict[str, List[Dict[str, Any]]]]:
+    """Downsample rollup and usage series. Mode windows are state intervals and are kept whole."""
 
-        else:
-            dictAggregations = {
+    if not max_points or source == "mode":
+        return grouped
+    with metrics.stage("downsample"):
+        return downsample.downsample_grouped(grouped, max_points, method)
 
-            }
-        ####
-
-        if params.attributes != None and params.attributes != [] and params.attributes != "":
-            common3 = any(att in params.attributes for att in mode_list)
-            
-            q= MODE_QUERY_WITH_ATTR.format(table_path=table_path3, in_placeholders=in_placeholders)
-            
-            params3 = (
-                params.mac_address,
-                *params.attributes,
-                params.product_type,
-                params.to.astimezone(timezone.utc),
-                params.from_.astimezone(timezone.utc)
-            )
 
-        else:
+def _aggregation_level(from_: datetime, to: datetime, max_points: Optional[int], settings: Settings):
 
-            common3 = mode_list
+    if max_points:
+        return aggregation_level_for_points(from_, to, max_points, settings.downsample_oversampling)
+    return calculate_aggregation_level(from_, to)
+
+
+def _check_max_points(max_points: Optional[int], settings: Settings) -> None:
+
+    if max_points and max_points > settings.max_points_limit:
+        raise HTTPException(
+            status_code=400, detail=f"max_points can be at most {settings.max_points_limit}"
+        )
 
-            q= MODE_QUERY_NO_ATTR.format(table_path=table_path3)
-            
-            params3 = (
-                params.mac_address,
-                params.product_type,
-                params.to.astimezone(timezone.utc),
-                params.from_.astimezone(timezone.utc)
-            )
 
-        if common3:
-            try:
-                q_results : List[Dict[str, Any]] = query(q, warehouse_id, params3)
-            except Exception as e:
-                raise HTTPException(status_code=500, detail=f"Error while reading database: {e}")
+def _device_payload(
+    product_type: str, level: Optional[str], grouped: Dict[str, Dict[str, List[Dict[str, Any]]]]
+) -> Dict[str, Any]:
+    """Shape one device's grouped rows ({source: {attribute: rows}}) for its product type."""
 
-            grouped3: Dict[str, List[Dict[str, Any]]] = {}
+    if product_type == MODE_TYPES:
+        return {
+            "attributes": grouped.get("mode", {})
+        }
 
-            for row in q_results:
-                key = row["mode_attr"]
-                item = dict(row)
-                item.pop("mac_address")
-                item.pop("mode_attr")
-                grouped3.setdefault(key, []).append(item)
+    elif product_type == MIXED_TYPES:
 
-            dictMode = {
-                    "attributes": grouped3
+        if "agg" in grouped:
+            dictAggregations = {
+                "aggregation_level": level,
+                "attributes": grouped["agg"]
             }
         else:
-            dictMode = {
-                    "attributes": {}
+            dictAggregations = {
+
             }
 
-        finalDict = {
-            mac_address:{
-                "agg_attributes": dictAggregations,
-                "mode_attributes": dictMode
+        return {
+            "agg_attributes": dictAggregations,
+            "mode_attributes": {
+                "attributes": grouped.get("mode", {})
             }
         }
 
+    return {
+        "agg_attributes": {
+            "aggregation_level": level,
+            "attributes": grouped.get("agg", {})
+        },
+        "usage_attributes": {
+            "aggregation_level": "dynamic",
+            "attributes": grouped.get("usage", {})
+        }
+    }
+
+
+def _blank_empty_sections(payload: Dict[str, Any], sections: Sequence[str]) -> Dict[str, Any]:
+
+    for mac, data in payload.items():
+        for section in sections:
+            if isinstance(data.get(section), dict) and not data[section]:
+                data[section] = {}
+            elif data[section].get("attributes", None) == {}:
+                data[section] = {}
+
+    return payload
+
+
+def _render(product_type: str, finalDict: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """Validate {mac_address: payload} for devices of one product type and dump it."""
+
+    if product_type == MODE_TYPES:
+        return ModeResponse.model_validate(finalDict).model_dump(mode="json", by_alias=True)
+
+    elif product_type == MIXED_TYPES:
         model = MixedResponse.model_validate(finalDict)
         payload = model.model_dump(by_alias=True, exclude_none=True)
+        return _blank_empty_sections(payload, ("agg_attributes", "mode_attributes"))
+
+    model = TableResponse.model_validate(finalDict)
+    payload = model.model_dump(by_alias=True, exclude_none=True)
+    return _blank_empty_sections(payload, ("agg_attributes", "usage_attributes"))
+
+
+# (product type branch, source) -> (window model, dump options) used by the buffered
+# renderer. The streaming and columnar writers derive their encoders from this so
+# every path emits the same document.
+WINDOW_MODELS = {
+    ("mode", "mode"): (ModeValueWindow, {"mode": "json"}),
+    ("mixed", "agg"): (MixedAggWindow, {"exclude_none": True}),
+    ("mixed", "mode"): (MixedModeWindow, {"exclude_none": True}),
+    ("default", "agg"): (ValueWindow, {"exclude_none": True}),
+    ("default", "usage"): (UsageAggWindow, {"exclude_none": True}),
+}
+
+STREAM_WINDOWS = {
+    branch: (TypeAdapter(List[model]), options)
+    for branch, (model, options) in WINDOW_MODELS.items()
+}
+
+# Pydantic's JSON mode writes UTC as "Z"; the python-mode dumps go through isoformat().
+COLUMNAR_WINDOWS = {
+    branch: (
+        columnar.window_fields(model),
+        not options.get("exclude_none", False),
+        "Z" if options.get("mode") == "json" else "+00:00",
+    )
+    for branch, (model, options) in WINDOW_MODELS.items()
+}
 
-        for mac, data in payload.items():
-            if isinstance(data.get("agg_attributes"), dict) and not data["agg_attributes"]:
-                data["agg_attributes"] = {}
-            elif data["agg_attributes"].get("attributes", None) == {}:
-                data["agg_attributes"] = {}
 
-            if isinstance(data.get("mode_attributes"), dict) and not data["mode_attributes"]:
-                data["mode_attributes"] = {}
-            elif data["mode_attributes"].get("attributes", None) == {}:
-                data["mode_attributes"] = {}
+def _branch(product_type: str) -> str:
+    if product_type == MODE_TYPES:
+        return "mode"
+    if product_type == MIXED_TYPES:
+        return "mixed"
+    return "default"
 
-        return payload
 
-    else:
+def _sections(product_type: str, level: Optional[str]) -> List[Tuple[Optional[str], str, Dict[str, Any], str]]:
+    """(section name, source, header, empty value) of one device document, in order.
 
-        env_table, level = calculate_aggregation_level(from_, to)
-        TABLE = os.getenv(env_table)
-        table_path = f"{DBPATH}.{TABLE}"
+    The mode-only document has no named sections: its single section is the device itself.
+    """
 
-        common = []
-        common2 = []
+    if product_type == MODE_TYPES:
+        return [(None, "mode", {}, '{"attributes":{}}')]
 
-        if params.attributes != None and params.attributes != [] and params.attributes != "":
+    second = "mode" if product_type == MIXED_TYPES else "usage"
+    return [
+        ("agg_attributes", "agg", {"aggregation_level": level}, "{}"),
+        (
+            f"{second}_attributes", second,
+            {} if second == "mode" else {"aggregation_level": "dynamic"}, "{}"
+        ),
+    ]
 
-            common = any(att in params.attributes for att in agg_list)
-            common2 = any(att in params.attributes for att in usage_list)
 
-            q = AGG_QUERY_WITH_ATTR.format(table_path=table_path, in_placeholders=in_placeholders)
+def _encode_windows(adapter: TypeAdapter, options: Dict[str, Any], rows: List[Dict[str, Any]]) -> str:
+    """JSON for a run of windows, without the enclosing brackets."""
 
-            params1 = (
-                params.mac_address,
-                *params.attributes,
-                params.product_type,
-                params.to.astimezone(timezone.utc),
-                params.from_.astimezone(timezone.utc)
-            )
+    windows = adapter.dump_python(adapter.validate_python(rows), by_alias=True, **options)
+    return json.dumps(jsonable_encoder(windows))[1:-1]
 
-        else:
 
-            common = usage_list
-            common2 = agg_list
-            
-            q = AGG_QUERY_NO_ATTR.format(table_path=table_path)
+async def _stream_section(
+    source: str,
+    attributes: Optional[List[str]],
+    header: Dict[str, Any],
+    empty: str,
+    params: HistoryTable,
+    agg_table: Optional[str],
+    warehouse_id: str,
+    chunk_size: int,
+) -> AsyncIterator[bytes]:
+    """Stream one {..header, "attributes": {attr: [windows]}} section, or `empty` when there are no rows."""
 
-            params1 = (
-                params.mac_address,
-                params.product_type,
-                params.to.astimezone(timezone.utc),
-                params.from_.astimezone(timezone.utc)
-            )
+    key = SOURCES[source]["key"]
+    adapter, options = STREAM_WINDOWS[(_branch(params.product_type), source)]
 
-        if common:
-            try:
-                q_results : List[Dict[str, Any]] = query(q, warehouse_id, params1)
-            except Exception as e:
-                raise HTTPException(status_code=500, detail=f"Error while reading database: {e}")
+    q, args = _build_query(
+        source, _table_path(source, agg_table), [params.mac_address],
+        params.product_type, attributes, params.from_, params.to, stream=True
+    )
 
-            grouped1: Dict[str, List[Dict[str, Any]]] = {}
+    opening = json.dumps(header)[:-1] + ("," if header else "") + '"attributes":{'
+    current = None
 
-            for row in q_results:
-                key = row["attribute"]
-                item = dict(row)
-                item.pop("attribute", None)
-                item.pop("mac_address", None)
-                grouped1.setdefault(key, []).append(item)
+    async for rows in astream(q, warehouse_id, args, chunk_size=chunk_size):
+        parts = []
 
-            dictAggregations = {
-                "aggregation_level": level,
-                "attributes": grouped1
-            }
+        for attr, items in groupby(rows, key=itemgetter(key)):
+            items = [
+                {k: v for k, v in row.items() if k != key and k != "mac_address"}
+                for row in items
+            ]
 
-        else:
-            dictAggregations = {
-                "aggregation_level": level,
-                "attributes": {}
-            }
+            if current is None:
+                parts.append(opening + json.dumps(attr) + ":[")
+            elif attr != current:
+                parts.append("]," + json.dumps(attr) + ":[")
+            else:
+                parts.append(",")
+
+            parts.append(_encode_windows(adapter, options, items))
+            current = attr
+
+        yield "".join(parts).encode()
 
-        table_path = f"{DBPATH}.{USAGETABLE}"
+    yield empty.encode() if current is None else b"]}}"
 
-        if params.attributes != None and params.attributes != [] and params.attributes != "":
 
-            common = any(att in params.attributes for att in agg_list)
-            common2 = any(att in params.attributes for att in usage_list)
+async def _stream_history(
+    params: HistoryTable,
+    level: Optional[str],
+    agg_table: Optional[str],
+    warehouse_id: str,
+    chunk_size: int,
+) -> AsyncIterator[bytes]:
+    """Same document as the buffered /deviceHistory response, written section by section."""
 
-            q = USAGE_QUERY_WITH_ATTR.format(table_path=table_path, in_placeholders=in_placeholders)
+    sources = _sources_for(params.product_type, params.attributes)
+    sections = _sections(params.product_type, level)
+    named = sections[0][0] is not None
 
-            params2 = (
-                params.mac_address,
-                *params.attributes,
-                params.product_type,
-                params.to.astimezone(timezone.utc),
-                params.from_.astimezone(timezone.utc)
+    try:
+        yield ("{" + json.dumps(str(params.mac_address)) + ":" + ("{" if named else "")).encode()
+
+        for i, (section, source, header, empty) in enumerate(sections):
+            if section is not None:
+                yield (("," if i else "") + json.dumps(section) + ":").encode()
+
+            if source not in sources:
+                yield empty.encode()
+                continue
+
+            async for chunk in _stream_section(
+                source, sources[source], header, empty, params, agg_table, warehouse_id, chunk_size
+            ):
+                yield chunk
+
+        yield b"}}" if named else b"}"
+
+    except Exception as e:
+        # Headers are already sent; the truncated body is the only error signal left.
+        logger.error("Streaming deviceHistory for %s failed: %s", params.mac_address, e)
+        raise
+
+
+async def _fetch_arrow(source: str, q: str, args: Sequence[Any], warehouse_id: str):
+
+    try:
+        return await aquery(q, warehouse_id, args, as_arrow=True)
+    except WAREHOUSE_UNAVAILABLE:
+        raise
+    except Exception as e:
+        logger.error("%s query failed: %s", source, e)
+        raise HTTPException(status_code=500, detail=f"Error while reading database: {e}")
+
+
+def _plan_arrow_fetches(
+    params: HistoryTable, agg_table: Optional[str], level: Optional[str], warehouse_id: str
+) -> Dict[str, Awaitable[Any]]:
+
+    fetches = {}
+    cache = get_result_cache()
+
+    for source, source_attributes in _sources_for(params.product_type, params.attributes).items():
+        table_path = _table_path(source, agg_table)
+        source_level = level if source == "agg" else None
+
+        q, args = _build_query(
+            source, table_path, [params.mac_address], params.product_type,
+            source_attributes, params.from_, params.to
+        )
+
+        cache_key = None
+        if cache is not None:
+            cache_key = cache.make_key(
+                table_path, [params.mac_address], params.product_type, source_attributes,
+                params.from_, params.to, source_level, variant="arrow"
             )
-        else:
 
-            common = usage_list
-            common1 = agg_list
-            
-            q = USAGE_QUERY_NO_ATTR.format(table_path=table_path)
+        fetches[source] = _fetch_cached(
+            cache_key, source_level, partial(_fetch_arrow, source, q, args, warehouse_id)
+        )
+
+    return fetches
+
 
-            params2 = (
-                params.mac_address,
-                params.product_type,
-                params.to.astimezone(timezone.utc),
-                params.from_.astimezone(timezone.utc)
+def _render_columnar(params: HistoryTable, level: Optional[str], tables: Dict[str, Any]) -> str:
+    """Build the /deviceHistory document straight from Arrow columns, no per-row dicts."""
+
+    branch = _branch(params.product_type)
+    sections = _sections(params.product_type, level)
+    mac_address = str(params.mac_address)
+
+    parts = []
+    for section, source, header, empty in sections:
+        attributes = None
+
+        if source in tables:
+            table = tables[source]
+            fields, keep_nulls, tz_suffix = COLUMNAR_WINDOWS[(branch, source)]
+            encoded = columnar.encode_windows(table, fields, keep_nulls, tz_suffix)
+            attributes = columnar.group_encoded(table, SOURCES[source]["key"], encoded).get(mac_address)
+
+        body = columnar.section_json(header, attributes, empty)
+        parts.append(body if section is None else json.dumps(section) + ":" + body)
+
+    if sections[0][0] is None:
+        return "{" + json.dumps(mac_address) + ":" + parts[0] + "}"
+
+    return "{" + json.dumps(mac_address) + ":{" + ",".join(parts) + "}}"
+
+
+def _render_fast(product_type: str, finalDict: Dict[str, Dict[str, Any]]) -> bytes:
+    """Same document as _render(), encoded straight from the trusted rows without a
+    validate/dump round-trip."""
+
+    if product_type == MODE_TYPES:
+        return serialization.dumps(finalDict, utc_z=True)
+
+    return serialization.dumps(serialization.shape_sections(finalDict))
+
+
+def _respond(by_type: Dict[str, Dict[str, Dict[str, Any]]], settings: Settings, fmt: str = "json") -> bytes:
+    """Encode {product_type: {mac_address: payload}} as one JSON or MessagePack document."""
+
+    with metrics.stage("serialize"):
+        if fmt == "msgpack":
+            return _encode_msgpack(by_type, settings)
+        return _encode(by_type, settings)
+
+
+def _encode_msgpack(by_type: Dict[str, Dict[str, Dict[str, Any]]], settings: Settings) -> bytes:
+    """The document _encode() writes, packed from the payloads instead of its JSON."""
+
+    if settings.fast_serialization:
+        return formats.to_msgpack(*(
+            (finalDict, True) if product_type == MODE_TYPES else (serialization.shape_sections(finalDict), False)
+            for product_type, finalDict in by_type.items() if finalDict
+        ))
+
+    return formats.to_msgpack(*((_render(product_type, finalDict), False) for product_type, finalDict in by_type.items()))
+
+
+def _encode(by_type: Dict[str, Dict[str, Dict[str, Any]]], settings: Settings) -> bytes:
+
+    if settings.fast_serialization and serialization.available():
+        parts = [_render_fast(product_type, finalDict)[1:-1] for product_type, finalDict in by_type.items() if finalDict]
+        return b"{" + b",".join(parts) + b"}"
+
+    payload: Dict[str, Any] = {}
+    for product_type, finalDict in by_type.items():
+        payload.update(_render(product_type, finalDict))
+
+    # Byte-for-byte what JSONResponse would have rendered from the dict.
+    return json.dumps(
+        jsonable_encoder(payload), ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def _negotiate(request: Request, requested: Optional[str], allowed: Sequence[str] = tuple(formats.FORMATS)) -> str:
+
+    fmt = formats.negotiate_format(requested, request.headers.get("accept"), allowed)
+    if fmt is None:
+        raise HTTPException(
+            status_code=406,
+            detail=f"Supported formats: {', '.join(f for f in allowed if formats.supported(f))}",
+        )
+    return fmt
+
+
+def _payload_body(payload: Dict[str, Any], fmt: str) -> bytes:
+    """JSON or MessagePack of a plain response payload."""
+
+    if fmt == "msgpack":
+        return formats.to_msgpack((payload, False))
+    return json.dumps(
+        jsonable_encoder(payload), ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def _encoded_response(request: Request, body: bytes, fmt: str) -> Response:
+    """Send a JSON or MessagePack body, compressed when the client accepts it."""
+
+    media_type = formats.MSGPACK if fmt == "msgpack" else formats.JSON
+
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    encoding = formats.negotiate_encoding(request.headers.get("accept-encoding"), len(body))
+    if encoding is not None:
+        with metrics.stage("compress"):
+            body = formats.compress(body, encoding)
+        headers["Content-Encoding"] = encoding
+
+    return Response(content=body, media_type=media_type, headers=headers)
+
+
+async def _device_watermarks(
+    table_paths: Sequence[str], mac_address: str, product_type: str, warehouse_id: str, cached_only: bool = False
+) -> Optional[Dict[str, Optional[datetime]]]:
+    """Newest end_timestamp of a device in each table, read at most once per watermark_ttl_seconds.
+    With cached_only nothing is read: None unless every watermark is cached."""
+
+    cache = get_watermark_cache()
+
+    if cached_only:
+        values = {}
+        for table_path in table_paths:
+            found, values[table_path] = cache.get((table_path, mac_address, product_type))
+            if not found:
+                return None
+        return values
+
+    async def watermark(table_path: str) -> Optional[datetime]:
+        key = (table_path, mac_address, product_type)
+        found, value = cache.get(key)
+        if not found:
+            rows = await aquery(query_builder.build(WATERMARK_QUERY, table_path), warehouse_id, (mac_address, product_type))
+            value = rows[0]["watermark"] if rows else None
+            cache.set(key, value)
+        return value
+
+    values = await asyncio.gather(*(watermark(table_path) for table_path in table_paths))
+    return dict(zip(table_paths, values))
+
+
+def _is_conditional(request: Request) -> bool:
+    return "if-none-match" in request.headers or "if-modified-since" in request.headers
+
+
+async def _history_validators(
+    request: Request, params: HistoryTable, level: Optional[str], agg_table: Optional[str], fmt: str, warehouse_id: str, settings: Settings
+) -> Optional[Dict[str, str]]:
+    """ETag, Last-Modified and Cache-Control of a deviceHistory response, computed without
+    reading its rows.
+
+    The validator includes the device's newest end_timestamp in each table the response
+    reads, and changes whenever new windows of that device land. A response is only final,
+    and marked immutable with the request alone as its validator, once its last bucket
+    closed window_cache_settle_seconds ago and every table already holds later windows of
+    the device: usage and mode windows vary in length and are written when they close.
+
+    Unconditional requests only get an ETag when the watermarks are cached or
+    etag_unconditional_requests is set, so plain reads cost no extra statements.
+    None when the watermarks cannot be read.
+    """
+
+    key = (
+        request.url.path,
+        sorted(request.query_params.multi_items()),
+        params.product_type,
+        level,
+        fmt,
+    )
+    cache_control = f"public, max-age={int(ttl_for(level))}"
+
+    table_paths = sorted({_table_path(source, agg_table) for source in _sources_for(params.product_type, params.attributes)})
+    cached_only = not (_is_conditional(request) or settings.etag_unconditional_requests)
+    try:
+        with metrics.stage("validate"):
+            watermarks = await _device_watermarks(
+                table_paths, params.mac_address, params.product_type, warehouse_id, cached_only=cached_only
             )
+    except Exception as e:
+        logger.warning("Reading table watermarks failed, responding without validators: %s", e)
+        return None
+
+    if watermarks is None:
+        return {"Cache-Control": cache_control}
+
+    _, end = normalize_window(params.from_, params.to, level)
+    if level is not None and bucket_seconds(level) is None:
+        end += 7 * 86400  # weekly rows are not epoch-aligned; the last may end a week after `to`
+    settled_at = end + settings.window_cache_settle_seconds
+
+    if settled_at <= time.time() and all(
+        watermark is not None and to_epoch(watermark) >= settled_at for watermark in watermarks.values()
+    ):
+        return {
+            "ETag": conditional.etag(*key),
+            "Last-Modified": conditional.http_date(from_epoch(settled_at)),
+            "Cache-Control": f"public, max-age={settings.immutable_max_age_seconds}, immutable",
+        }
 
-        if common2:
-            try:
-                q_results : List[Dict[str, Any]] = query(q, warehouse_id, params2)
-            except Exception as e:
-                raise HTTPException(status_code=500, detail=f"Error while reading database: {e}")
+    headers = {
+        "ETag": conditional.etag(*key, watermarks),
+        "Cache-Control": cache_control,
+    }
+    known = [watermark for watermark in watermarks.values() if watermark is not None]
+    if known:
+        headers["Last-Modified"] = conditional.http_date(max(known))
+    return headers
 
-            grouped2: Dict[str, List[Dict[str, Any]]] = {}
 
-            for row in q_results:
-                key = row["attribute"]
-                item = dict(row)
-                item.pop("attribute", None)
-                item.pop("mac_address", None)
-                grouped2.setdefault(key, []).append(item)
+def _not_modified(request: Request, validators: Optional[Dict[str, str]]) -> Optional[Response]:
+    if validators is None or "ETag" not in validators or not conditional.not_modified(
+        request.headers.get("if-none-match"),
+        request.headers.get("if-modified-since"),
+        validators["ETag"],
+        validators.get("Last-Modified"),
+    ):
+        return None
+    return Response(status_code=304, headers={**validators, "Vary": "Accept, Accept-Encoding"})
 
-            dictUsage = {
-                "aggregation_level": "dynamic",
-                "attributes": grouped2
-            }
 
-        else:
-            dictUsage = {
-                "aggregation_level": "dynamic",
-                "attributes": {}
-            }
-        
-        mac_address = str(mac_address)
+def _with_validators(response: Response, validators: Optional[Dict[str, str]]) -> Response:
+    if validators is not None:
+        response.headers.update(validators)
+    return response
+
+
+async def _resolve_product_types(mac_addresses: List[str], warehouse_id: str) -> Dict[str, str]:
+    """Product types of MACs requested without one; 404 naming any the warehouse does not know."""
+
+    with metrics.stage("resolve_product_type"):
+        resolved = await product_types.resolve(mac_addresses, warehouse_id)
+
+    unknown = [mac for mac, product_type in resolved.items() if product_type is None]
+    if unknown:
+        raise HTTPException(
+            status_code=404,
+            detail=f"No product_type known for: {', '.join(unknown)}; pass product_type explicitly",
+        )
+    return resolved
+
+
+def _require_warehouse(settings: Settings) -> str:
+
+    warehouse_id = settings.databricks_warehouse_id
+    if not warehouse_id:
+        raise ConfigurationError(
+            message="SQL warehouse ID not configured",
+            details={"setting": "databricks_warehouse_id"},
+        )
+    return warehouse_id
+
+
+# The fast paths return pre-encoded bytes, so the schema is published here instead
+# of through response_model (which would re-validate every row).
+HISTORY_RESPONSES = {200: {"model": Union[TableResponse, MixedResponse, ModeResponse]}}
+
+
+@router.get("/deviceHistory", responses=HISTORY_RESPONSES)
+async def table(
+    request: Request,
+    mac_address: str = Query(..., description="MAC Address of device"),
+    product_type: Optional[str] = Query(None, description="Device type, ex: heatpumpWaterHeaterGen5, econetControlCenter; looked up from the MAC address when omitted"),
+    from_: datetime = Query(..., alias="from", description="start date, ej. 2025-09-01T00:00:00Z"),
+    to: datetime = Query(..., description="end date, ej. 2025-09-01T00:00:00Z"),
+    attributes: Optional[List[str]] = Query(None, description="One or more attributes, ex: LOHTRTMP, UPHTRTMP"),
+    stream: bool = Query(False, description="Stream the JSON body while it is read from the warehouse. Bypasses the result caches; errors after the first byte truncate the body."),
+    format_: Optional[str] = Query(None, alias="format", description="json, arrow, parquet or msgpack; overrides the Accept header"),
+    max_points: Optional[int] = Query(None, ge=2, description="Downsample every series to at most this many windows, reading the finest rollup that fits the budget"),
+    downsample_method: Literal["minmax", "lttb"] = Query("minmax", alias="downsample", description="minmax merges windows per bucket keeping min/max/median; lttb keeps the most significant windows"),
+    limit: Optional[int] = Query(None, ge=1, description="Page size in windows; enables keyset pagination (default_limit when only a cursor is given)"),
+    cursor: Optional[str] = Query(None, description="Continuation token from the X-Next-Cursor header of the previous page"),
+    settings: Settings = Depends(get_settings),
+):
+
+    #if not is_valid_mac_address(mac_address):
+    #    raise HTTPException(status_code=422, detail="Invalid MAC address format")
+    
+    if from_ > to:
+        raise HTTPException(status_code=400, detail="The FROM date must be earlier than TO date")
+
+    warehouse_id = _require_warehouse(settings)
+
+    if not product_type:
+        product_type = (await _resolve_product_types([mac_address], warehouse_id))[mac_address]
+
+    params = HistoryTable(
+        from_=from_,
+        to=to,
+        mac_address=mac_address,
+        attributes=attributes,
+        product_type=product_type,
+    )
+
+    paged = limit is not None or cursor is not None
+
+    if stream:
+        allowed = ("json",)
+    elif paged:
+        allowed = ("json", "msgpack")
+    else:
+        allowed = tuple(formats.FORMATS)
+    fmt = _negotiate(request, format_, allowed=allowed)
+
+    _check_max_points(max_points, settings)
+    if stream and max_points:
+        raise HTTPException(status_code=400, detail="max_points cannot be combined with stream")
+    if paged and (stream or max_points):
+        raise HTTPException(status_code=400, detail="limit and cursor cannot be combined with stream or max_points")
+
+    mac_address = str(mac_address)
+
+    level = None
+    TABLE = None
+    if params.product_type != MODE_TYPES:
+        env_table, level = _aggregation_level(from_, to, max_points, settings)
+        TABLE = os.getenv(env_table)
+    metrics.label(product_type=params.product_type, level=level)
+
+    if paged:
+        page_size = limit or settings.default_limit
+        if page_size > settings.max_limit:
+            raise HTTPException(status_code=400, detail=f"limit can be at most {settings.max_limit}")
+
+        try:
+            after = pagination.decode_cursor(cursor) if cursor else None
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+        fingerprint = pagination.query_fingerprint(
+            mac_address, params.product_type, params.attributes, params.from_, params.to, level
+        )
+        if after is not None and (
+            after.fingerprint != fingerprint or after.source not in _sources_for(params.product_type, params.attributes)
+        ):
+            raise HTTPException(status_code=400, detail="The cursor does not belong to this query")
+
+    # Only once every parameter is known to be valid: a bad request is a 400, not a 304.
+    validators = None
+    if settings.conditional_requests and not stream:
+        validators = await _history_validators(request, params, level, TABLE, fmt, warehouse_id, settings)
+        unchanged = _not_modified(request, validators)
+        if unchanged is not None:
+            return unchanged
+
+    if paged:
+        grouped, next_cursor = await _fetch_page(params, TABLE, warehouse_id, page_size, after, fingerprint)
 
         finalDict = {
-            mac_address:{
-                "agg_attributes": dictAggregations,
-                "usage_attributes": dictUsage
-            }
+            mac_address: _device_payload(params.product_type, level, grouped)
         }
+        response = _encoded_response(request, _respond({params.product_type: finalDict}, settings, fmt), fmt)
+
+        if next_cursor is not None:
+            token = pagination.encode_cursor(next_cursor)
+            response.headers["X-Next-Cursor"] = token
+            response.headers["Link"] = f'<{request.url.include_query_params(cursor=token)}>; rel="next"'
+        return _with_validators(response, validators)
+
+    if stream:
+        return StreamingResponse(
+            _stream_history(params, level, TABLE, warehouse_id, settings.stream_chunk_size),
+            media_type="application/json",
+        )
 
-        model = TableResponse.model_validate(finalDict)
-        payload = model.model_dump(by_alias=True, exclude_none=True)
+    if fmt in ("arrow", "parquet"):
+        if max_points:
+            results = await _gather(await _plan_fetches(
+                params.product_type, [params.mac_address], params.attributes, params.from_, params.to, TABLE, level, warehouse_id
+            ))
+            tables = {
+                source: formats.grouped_table(
+                    _downsampled(source, rows, max_points, downsample_method), SOURCES[source]["key"]
+                )
+                for source, rows in results.items()
+            }
+        else:
+            tables = await _gather(_plan_arrow_fetches(params, TABLE, level, warehouse_id))
+        table = formats.history_table(tables, {
+            "mac_address": mac_address,
+            "product_type": params.product_type,
+            "aggregation_level": level,
+        })
+        with metrics.stage("serialize"):
+            content = formats.to_arrow_ipc(table) if fmt == "arrow" else formats.to_parquet(table)
+        return _with_validators(Response(
+            content=content,
+            media_type=formats.FORMATS[fmt][0],
+            headers={"Vary": "Accept"},
+        ), validators)
+
+    if fmt == "json" and settings.columnar_responses and columnar.available() and not max_points:
+        tables = await _gather(_plan_arrow_fetches(params, TABLE, level, warehouse_id))
+        with metrics.stage("serialize"):
+            body = _render_columnar(params, level, tables).encode()
+        return _with_validators(_encoded_response(request, body, fmt), validators)
+
+    results = await _gather(await _plan_fetches(
+        params.product_type, [params.mac_address], params.attributes, params.from_, params.to, TABLE, level, warehouse_id
+    ))
+
+    grouped = {
+        source: _downsampled(source, rows, max_points, downsample_method).get(params.mac_address, {})
+        for source, rows in results.items()
+    }
+
+    finalDict = {
+        mac_address: _device_payload(params.product_type, level, grouped)
+    }
+
+    return _with_validators(
+        _encoded_response(request, _respond({params.product_type: finalDict}, settings, fmt), fmt), validators
+    )
+
+
+@router.post("/deviceHistory/batch", responses=HISTORY_RESPONSES)
+async def table_batch(
+    body: BatchHistoryTable,
+    request: Request,
+    format_: Optional[str] = Query(None, alias="format", description="json or msgpack; overrides the Accept header"),
+    settings: Settings = Depends(get_settings),
+):
+    """History for many devices at once: one IN (...) query per table and product type."""
 
-        for mac, data in payload.items():
-            if isinstance(data.get("agg_attributes"), dict) and not data["agg_attributes"]:
-                data["agg_attributes"] = {}
-            elif data["agg_attributes"].get("attributes", None) == {}:
-                data["agg_attributes"] = {}
+    if body.from_ > body.to:
+        raise HTTPException(status_code=400, detail="The FROM date must be earlier than TO date")
+
+    if len(body.mac_addresses) > settings.max_batch_devices:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {settings.max_batch_devices} MAC addresses can be requested at once",
+        )
+
+    warehouse_id = _require_warehouse(settings)
+
+    fmt = _negotiate(request, format_, allowed=("json", "msgpack"))
+
+    _check_max_points(body.max_points, settings)
+
+    env_table, level = _aggregation_level(body.from_, body.to, body.max_points, settings)
+    metrics.label(level=level)
+    TABLE = os.getenv(env_table)
+
+    device_types = {mac: body.product_type_of(mac) for mac in dict.fromkeys(body.mac_addresses)}
+    unresolved = [mac for mac, product_type in device_types.items() if not product_type]
+    if unresolved:
+        device_types.update(await _resolve_product_types(unresolved, warehouse_id))
+
+    by_type: Dict[str, List[str]] = {}
+    for mac, product_type in device_types.items():
+        by_type.setdefault(product_type, []).append(mac)
+
+    fetches = {}
+    for product_type, macs in by_type.items():
+        for source, fetch in (await _plan_fetches(
+            product_type, macs, body.attributes, body.from_, body.to, TABLE, level, warehouse_id
+        )).items():
+            fetches[(product_type, source)] = fetch
+
+    results = await _gather(fetches)
+    results = {
+        (product_type, source): _downsampled(source, rows, body.max_points, body.downsample)
+        for (product_type, source), rows in results.items()
+    }
+
+    rendered: Dict[str, Dict[str, Dict[str, Any]]] = {}
+
+    for product_type, macs in by_type.items():
+        finalDict = {}
+        for mac in macs:
+            grouped = {
+                source: rows.get(mac, {})
+                for (group, source), rows in results.items()
+                if group == product_type
+            }
+            finalDict[mac] = _device_payload(
+                product_type, None if product_type == MODE_TYPES else level, grouped
+            )
+        rendered[product_type] = finalDict
+
+    return _encoded_response(request, _respond(rendered, settings, fmt), fmt)
+
+
+@router.get("/fleetHistory", responses={200: {"model": FleetResponse}})
+async def fleet(
+    request: Request,
+    product_type: str = Query(..., description="Device type, ex: heatpumpWaterHeaterGen5, econetControlCenter"),
+    attributes: List[str] = Query(..., description="One or more rollup attributes, ex: TEMP_OUT"),
+    from_: datetime = Query(..., alias="from", description="start date, ej. 2025-09-01T00:00:00Z"),
+    to: datetime = Query(..., description="end date, ej. 2025-09-01T00:00:00Z"),
+    mac_addresses: Optional[List[str]] = Query(None, alias="mac_address", description="Restrict the fleet to these devices; every device of the product type when omitted"),
+    format_: Optional[str] = Query(None, alias="format", description="json or msgpack; overrides the Accept header"),
+    settings: Settings = Depends(get_settings),
+):
+    """Cohort series for a product type: per rollup window, the min, quartiles, max and
+    mean of every device's window, computed by the warehouse."""
+
+    if from_ > to:
+        raise HTTPException(status_code=400, detail="The FROM date must be earlier than TO date")
+
+    if product_type == MODE_TYPES:
+        raise HTTPException(status_code=400, detail=f"{product_type} has no rollup attributes to aggregate")
+
+    if mac_addresses and len(mac_addresses) > settings.max_fleet_devices:
+        raise HTTPException(
+            status_code=400,
+            detail=f"A fleet can be restricted to at most {settings.max_fleet_devices} MAC addresses",
+        )
+
+    rollup_attributes = get_attribute_registry().split(attributes, ["agg"]).get("agg")
+    if not rollup_attributes:
+        raise HTTPException(status_code=400, detail="None of the attributes are held by the rollup tables")
+
+    warehouse_id = _require_warehouse(settings)
+
+    fmt = _negotiate(request, format_, allowed=("json", "msgpack"))
+
+    env_table, level = calculate_aggregation_level(from_, to)
+    metrics.label(product_type=product_type, level=level)
+    table_path = _table_path("agg", os.getenv(env_table))
+    mac_addresses = list(dict.fromkeys(mac_addresses)) if mac_addresses else None
+
+    q, args = _build_fleet_query(table_path, mac_addresses, product_type, rollup_attributes, from_, to)
+
+    cache = get_result_cache()
+    cache_key = None
+    if cache is not None:
+        cache_key = cache.make_key(
+            table_path, mac_addresses or [], product_type, rollup_attributes, from_, to, level, variant="fleet"
+        )
+
+    # Rows carry no MAC; grouped under None like a single device.
+    grouped = await _fetch_cached(
+        cache_key, level, partial(_fetch_grouped, "fleet", q, args, "attribute", warehouse_id)
+    )
 
-            if isinstance(data.get("usage_attributes"), dict) and not data["usage_attributes"]:
-                data["usage_attributes"] = {}
-            elif data["usage_attributes"].get("attributes", None) == {}:
-                data["usage_attributes"] = {}
+    payload = {
+        "product_type": product_type,
+        "aggregation_level": level,
+        "attributes": grouped.get(None, {}),
+    }
+    with metrics.stage("serialize"):
+        body = _payload_body(payload, fmt)
 
-        return payload
+    return _encoded_response(request, body, fmt)
@@ -1,10 +1,29 @@
 from datetime import datetime, timezone
 from typing import Dict
 from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from config.settings import get_settings
+from services.cache.devices import get_device_directory
+from services.db.connector import get_breaker, get_pool
+from services.db.warmup import readiness
 
 router = APIRouter()
 
 @router.get("/healthcheck")
 async def healthcheck() -> Dict[str, str]:
     """Return the API status."""
-    return {"status": "OK", "timestamp": datetime.now(timezone.utc).isoformat()}
\ No newline at end of file
+    return {"status": "OK", "timestamp": datetime.now(timezone.utc).isoformat()}
+
+@router.get("/readiness")
+async def readiness_check() -> JSONResponse:
+    """Whether the warehouse answers quickly; 503 until the warm-up probe has succeeded."""
+    body = readiness.snapshot()
+    warehouse_id = get_settings().databricks_warehouse_id
+    if warehouse_id:
+        body["pool"] = get_pool(warehouse_id).status()
+        body["circuit"] = get_breaker(warehouse_id).state
+    directory = get_device_directory()
+    if directory is not None:
+        body["product_types"] = directory.status()
+    body["timestamp"] = datetime.now(timezone.utc).isoformat()
+    return JSONResponse(body, status_code=200 if readiness.ready else 503)
@@ -0,0 +1,133 @@
+import os
+import time
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from config.settings import Settings, get_settings
+from errors.exceptions import ServiceUnavailableError
+from models.tables import LatestResponse
+from services import metrics
+from services.cache.latest import LatestIndex, get_latest_index
+from services.db.connector import aquery, run_blocking
+from .db import DBPATH, MODETABLE, USAGETABLE, _encoded_response, _negotiate, _payload_body
+from .utils.queries import LATEST_AGG_QUERY, LATEST_USAGE_QUERY, LATEST_MODE_QUERY
+
+router = APIRouter(tags=["tables"])
+
+logger = logging.getLogger(__name__)
+
+# Tables the index is refreshed from: template, table and the column rows are keyed by.
+# Rollups are read from the finest table, the first to receive new windows.
+LATEST_SOURCES = {
+    "agg": (LATEST_AGG_QUERY, os.getenv("DATABRICKS_TABLE_1MIN"), "attribute"),
+    "usage": (LATEST_USAGE_QUERY, USAGETABLE, "attribute"),
+    "mode": (LATEST_MODE_QUERY, MODETABLE, "mode_attr"),
+}
+
+
+async def refresh_source(index: LatestIndex, source: str, warehouse_id: str) -> int:
+    """Read rows newer than the source's watermark (less the overlap) into the index."""
+
+    settings = get_settings()
+    template, table, key = LATEST_SOURCES[source]
+
+    watermark = index.watermark(source)
+    if watermark is None:
+        since = datetime.now(timezone.utc) - timedelta(seconds=settings.latest_lookback_seconds)
+    else:
+        since = watermark - timedelta(seconds=settings.latest_overlap_seconds)
+
+    rows = await aquery(template.format(table_path=f"{DBPATH}.{table}"), warehouse_id, (since,))
+    stored = await run_blocking(index.update, source, key, rows)
+
+    # By the clock, not the watermark, so one device's future rows cannot evict the others.
+    await run_blocking(index.evict, source, datetime.now(timezone.utc) - timedelta(seconds=settings.latest_lookback_seconds))
+
+    return stored
+
+
+async def refresh(index: LatestIndex, warehouse_id: str) -> None:
+    """One refresh of every source. The index counts as refreshed only when all succeed,
+    so its age bounds the staleness of every window it serves."""
+
+    started = time.time()
+    sources = [source for source, (_, table, _) in LATEST_SOURCES.items() if table]
+
+    with metrics.stage("latest_refresh"):
+        results = await asyncio.gather(
+            *(refresh_source(index, source, warehouse_id) for source in sources), return_exceptions=True
+        )
+
+    failed = {source: e for source, e in zip(sources, results) if isinstance(e, BaseException)}
+    for source, e in failed.items():
+        if isinstance(e, asyncio.CancelledError):
+            raise e
+        logger.warning("Latest-value refresh of %s failed: %s", source, e)
+
+    if not failed:
+        index.mark_refreshed(started)
+
+
+async def run(warehouse_id: Optional[str]) -> None:
+    """Refresh the index every latest_refresh_seconds; the lifespan runs this as a background task."""
+
+    index = get_latest_index()
+    if index is None or not warehouse_id:
+        return
+
+    settings = get_settings()
+    while True:
+        await refresh(index, warehouse_id)
+        await asyncio.sleep(settings.latest_refresh_seconds)
+
+
+@router.get("/latest", responses={200: {"model": LatestResponse}})
+async def latest(
+    request: Request,
+    mac_addresses: List[str] = Query(..., alias="mac_address", description="One or more MAC addresses"),
+    attributes: Optional[List[str]] = Query(None, description="Only these attributes; every attribute when omitted"),
+    format_: Optional[str] = Query(None, alias="format", description="json or msgpack; overrides the Accept header"),
+    settings: Settings = Depends(get_settings),
+):
+    """Most recent window of each attribute per device, served from memory. Devices with
+    no window within latest_lookback_seconds are left out."""
+
+    index = get_latest_index()
+    if index is None:
+        raise HTTPException(status_code=404, detail="The latest-value index is disabled")
+
+    fmt = _negotiate(request, format_, allowed=("json", "msgpack"))
+
+    age = index.age()
+    if age is None or age > settings.latest_max_staleness_seconds:
+        raise ServiceUnavailableError(
+            message="The latest-value index is not up to date",
+            details={"age_seconds": None if age is None else round(age, 1), "retry_after": settings.latest_refresh_seconds},
+        )
+
+    wanted = set(attributes) if attributes else None
+    devices: Dict[str, Dict[str, Any]] = {}
+    for mac in dict.fromkeys(mac_addresses):
+        device = index.get(mac)
+        if device is None:
+            continue
+
+        entry: Dict[str, Any] = {"product_type": device["product_type"]}
+        for source in LATEST_SOURCES:
+            windows = device.get(source, {})
+            if wanted is not None:
+                windows = {attribute: window for attribute, window in windows.items() if attribute in wanted}
+            if windows:
+                entry[f"{source}_attributes"] = windows
+        devices[mac] = entry
+
+    payload = {
+        "refreshed_at": datetime.fromtimestamp(index.refreshed_at, tz=timezone.utc),
+        "devices": devices,
+    }
+    with metrics.stage("serialize"):
+        body = _payload_body(payload, fmt)
+
+    return _encoded_response(request, body, fmt)
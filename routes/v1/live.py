@@ -0,0 +1,286 @@
+import os
+import json
+import asyncio
+import logging
+import contextvars
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+from fastapi import APIRouter, Depends, Query, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from config.settings import Settings, get_settings
+from errors.exceptions import ServiceUnavailableError
+from services import metrics
+from services.db.connector import aquery
+from .db import SOURCES, _build_query, _group_rows, _require_warehouse, _resolve_product_types, _sources_for, _table_path
+
+router = APIRouter(tags=["tables"])
+
+logger = logging.getLogger(__name__)
+
+# Live reads use the finest rollup, the first to receive new windows.
+LIVE_TABLE = os.getenv("DATABRICKS_TABLE_1MIN")
+
+# Upper bound of the read window: anything that has ended after the watermark.
+HORIZON = timedelta(days=1)
+
+# {source: {attribute: [window, ...]}}
+Sections = Dict[str, Dict[str, List[Dict[str, Any]]]]
+
+
+class TailGroup:
+    """One watched device. A single poller reads the windows newer than what it already
+    sent and fans them out to every subscriber's queue, so the warehouse sees one read per
+    device and interval however many clients are watching."""
+
+    def __init__(self, mac_address: str, product_type: str):
+        self.mac_address = mac_address
+        self.product_type = product_type
+        self.subscribers: Set[asyncio.Queue] = set()
+        # source -> attribute -> end_timestamp of the newest window sent
+        self.watermarks: Dict[str, Dict[str, datetime]] = {}
+        # source -> attribute -> newest window, replayed to clients joining later
+        self.latest: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self.task: Optional[asyncio.Task] = None
+
+    def since(self, source: str, default: datetime, overlap: timedelta) -> datetime:
+        watermarks = self.watermarks.get(source)
+        if not watermarks:
+            return default
+        return max(watermarks.values()) - overlap
+
+    def accept(self, source: str, windows_by_attribute: Dict[str, List[Dict[str, Any]]]) -> Dict[str, List[Dict[str, Any]]]:
+        """Keep the windows not sent yet, advancing the watermarks past them."""
+
+        watermarks = self.watermarks.setdefault(source, {})
+        latest = self.latest.setdefault(source, {})
+        fresh: Dict[str, List[Dict[str, Any]]] = {}
+
+        for attribute, windows in windows_by_attribute.items():
+            sent = watermarks.get(attribute)
+            new = [window for window in windows if sent is None or window["end_timestamp"] > sent]
+            if new:
+                fresh[attribute] = new
+                newest = max(new, key=lambda window: window["end_timestamp"])
+                watermarks[attribute] = newest["end_timestamp"]
+                latest[attribute] = newest
+        return fresh
+
+    def snapshot(self) -> Sections:
+        return {source: {attribute: [window] for attribute, window in windows.items()} for source, windows in self.latest.items()}
+
+    def publish(self, event: str, payload: Any) -> None:
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait((event, payload))
+            except asyncio.QueueFull:
+                # Too far behind: drop what is queued and tell the stream to close.
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+                self.subscribers.discard(queue)
+
+
+class Subscription:
+    """One client's place in a group; released exactly once however its stream ends."""
+
+    def __init__(self, hub: "TailHub", group: TailGroup, queue: asyncio.Queue):
+        self.hub = hub
+        self.group = group
+        self.queue = queue
+        self.released = False
+
+    def release(self) -> None:
+        if not self.released:
+            self.released = True
+            self.hub.unsubscribe(self.group, self.queue)
+
+
+class TailHub:
+    """Live subscriptions grouped by device. Runs on the event loop only, so needs no lock:
+    checking the limit and taking a slot happen without an await in between."""
+
+    def __init__(self):
+        self.groups: Dict[Tuple[str, str], TailGroup] = {}
+        self.subscribers = 0
+
+    def subscribe(self, mac_address: str, product_type: str, warehouse_id: str) -> Subscription:
+        settings = get_settings()
+        if self.subscribers >= settings.live_max_subscribers:
+            raise ServiceUnavailableError(
+                message="Too many live streams are open",
+                details={"max_subscribers": settings.live_max_subscribers, "retry_after": settings.live_poll_seconds},
+            )
+
+        key = (mac_address, product_type)
+        group = self.groups.get(key)
+        if group is None:
+            group = self.groups[key] = TailGroup(mac_address, product_type)
+            # A fresh context, so the poller is not bound by the first subscriber's request deadline.
+            group.task = asyncio.create_task(poll(group, warehouse_id), context=contextvars.Context())
+
+        queue: asyncio.Queue = asyncio.Queue(maxsize=settings.live_queue_size)
+        group.subscribers.add(queue)
+        self.subscribers += 1
+        return Subscription(self, group, queue)
+
+    def unsubscribe(self, group: TailGroup, queue: asyncio.Queue) -> None:
+        group.subscribers.discard(queue)
+        self.subscribers -= 1
+        if not group.subscribers and self.groups.get((group.mac_address, group.product_type)) is group:
+            del self.groups[(group.mac_address, group.product_type)]
+            group.task.cancel()
+
+    async def close(self) -> None:
+        tasks = [group.task for group in self.groups.values()]
+        self.groups.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+hub = TailHub()
+
+
+async def read_new(group: TailGroup, source: str, warehouse_id: str) -> Dict[str, List[Dict[str, Any]]]:
+    settings = get_settings()
+    now = datetime.now(timezone.utc)
+
+    since = group.since(
+        source,
+        now - timedelta(seconds=settings.live_lookback_seconds),
+        timedelta(seconds=settings.live_overlap_seconds),
+    )
+    q, args = _build_query(
+        source, _table_path(source, LIVE_TABLE), [group.mac_address], group.product_type, None, since, now + HORIZON
+    )
+    rows = await aquery(q, warehouse_id, args)
+    return _group_rows(rows, SOURCES[source]["key"]).get(group.mac_address, {})
+
+
+async def poll(group: TailGroup, warehouse_id: str) -> None:
+    """Read and publish a group's new windows every live_poll_seconds until its last
+    subscriber leaves."""
+
+    settings = get_settings()
+    sources = list(_sources_for(group.product_type, None))
+
+    while True:
+        results = await asyncio.gather(
+            *(read_new(group, source, warehouse_id) for source in sources), return_exceptions=True
+        )
+
+        sections: Sections = {}
+        for source, result in zip(sources, results):
+            if isinstance(result, asyncio.CancelledError):
+                raise result
+            if isinstance(result, BaseException):
+                logger.warning("Live read of %s for %s failed: %s", source, group.mac_address, result)
+                group.publish("error", {"source": source, "message": str(result)})
+                continue
+            fresh = group.accept(source, result)
+            if fresh:
+                sections[source] = fresh
+
+        if sections:
+            group.publish("windows", sections)
+
+        await asyncio.sleep(settings.live_poll_seconds)
+
+
+def _sse(event: str, payload: Any) -> str:
+    data = json.dumps(jsonable_encoder(payload), ensure_ascii=False, allow_nan=False, separators=(",", ":"))
+    return f"event: {event}\ndata: {data}\n\n"
+
+
+def _windows_payload(group: TailGroup, sections: Sections, wanted: Optional[Set[str]]) -> Optional[Dict[str, Any]]:
+    payload: Dict[str, Any] = {}
+    for source, windows_by_attribute in sections.items():
+        if wanted is not None:
+            windows_by_attribute = {a: w for a, w in windows_by_attribute.items() if a in wanted}
+        if windows_by_attribute:
+            payload[f"{source}_attributes"] = windows_by_attribute
+    if not payload:
+        return None
+    return {"mac_address": group.mac_address, "product_type": group.product_type, **payload}
+
+
+async def _events(request: Request, subscription: Subscription, wanted: Optional[Set[str]]) -> AsyncIterator[str]:
+    settings = get_settings()
+    group, queue = subscription.group, subscription.queue
+
+    try:
+        snapshot = _windows_payload(group, group.snapshot(), wanted)
+        if snapshot is not None:
+            yield _sse("snapshot", snapshot)
+
+        while True:
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout=settings.live_heartbeat_seconds)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    return
+                yield ": keep-alive\n\n"
+                continue
+
+            if item is None:
+                yield _sse("overflow", {"message": "Client fell behind; reconnect to resume"})
+                return
+
+            event, payload = item
+            if event == "windows":
+                payload = _windows_payload(group, payload, wanted)
+                if payload is None:
+                    continue
+            yield _sse(event, payload)
+    finally:
+        subscription.release()
+
+
+class _LiveResponse(StreamingResponse):
+    """Releases the subscription even when the stream never starts, e.g. when the client
+    disconnects before the first event."""
+
+    def __init__(self, subscription: Subscription, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.subscription = subscription
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.subscription.release()
+
+
+@router.get("/deviceHistory/live")
+async def live(
+    request: Request,
+    mac_address: str = Query(..., description="MAC Address of device"),
+    product_type: Optional[str] = Query(None, description="Device type; looked up from the MAC address when omitted"),
+    attributes: Optional[List[str]] = Query(None, description="Only these attributes; every attribute when omitted"),
+    settings: Settings = Depends(get_settings),
+):
+    """Server-Sent Events stream of a device's new windows as they land. A `snapshot` event
+    with the newest window per attribute comes first when the device is already watched,
+    then a `windows` event per read that found any; `error` reports a failed read, which is
+    retried on the next interval."""
+
+    warehouse_id = _require_warehouse(settings)
+
+    if not product_type:
+        product_type = (await _resolve_product_types([mac_address], warehouse_id))[mac_address]
+    metrics.label(product_type=product_type)
+
+    # The slot is taken here, not when the stream starts, so concurrent requests cannot
+    # all pass the limit.
+    subscription = hub.subscribe(mac_address, product_type, warehouse_id)
+    try:
+        return _LiveResponse(
+            subscription,
+            _events(request, subscription, set(attributes) if attributes else None),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+    except BaseException:
+        subscription.release()
+        raise
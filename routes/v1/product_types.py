@@ -0,0 +1,104 @@
+import os
+import time
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+from config.settings import get_settings
+from services import metrics
+from services.cache.devices import DeviceDirectory, get_device_directory
+from services.db.connector import aquery, run_blocking
+from .utils import query_builder
+from .utils.queries import PRODUCT_TYPES_QUERY, PRODUCT_TYPES_MACS_QUERY
+
+logger = logging.getLogger(__name__)
+
+DBPATH = f"{os.getenv('DATABRICKS_CATALOG')}.{os.getenv('DATABRICKS_SCHEMA')}"
+MODETABLE = os.getenv("DATABRICKS_TABLE_MODE")
+
+# The startup load and lookups of unknown MACs read the daily rollup, which covers a
+# year in few rows; increments read the 1-minute rollup, where new devices appear first.
+BULK_TABLE = os.getenv("DATABRICKS_TABLE_1DAY")
+RECENT_TABLE = os.getenv("DATABRICKS_TABLE_1MIN")
+
+# How far back a lookup reads the 1-minute rollup for MACs the daily rollup does not
+# hold: the current day, which is not rolled up yet.
+RECENT_LOOKBACK = timedelta(days=1)
+
+
+async def _read(table: str, mac_addresses: List[str], since: datetime, warehouse_id: str):
+    macs = query_builder.canonical(mac_addresses)
+    q = query_builder.build(
+        PRODUCT_TYPES_MACS_QUERY if macs else PRODUCT_TYPES_QUERY,
+        f"{DBPATH}.{table}", f"{DBPATH}.{MODETABLE}", macs=len(macs),
+    )
+    return await aquery(q, warehouse_id, (*macs, since, *macs, since))
+
+
+async def refresh(directory: DeviceDirectory, warehouse_id: str) -> None:
+    """Load every device seen within product_type_lookback_seconds on the first call, then
+    only devices seen since the previous refresh (less one interval, for late rows)."""
+
+    settings = get_settings()
+    started = time.time()
+
+    watermark = directory.watermark
+    if watermark is None:
+        table = BULK_TABLE
+        since = datetime.now(timezone.utc) - timedelta(seconds=settings.product_type_lookback_seconds)
+    else:
+        table = RECENT_TABLE
+        since = watermark - timedelta(seconds=settings.product_type_refresh_seconds)
+
+    with metrics.stage("product_type_refresh"):
+        rows = await _read(table, [], since, warehouse_id)
+    changed = await run_blocking(directory.update, rows)
+    directory.mark_refreshed(started)
+
+    if changed:
+        logger.info("Product type directory: %d devices added or changed", changed)
+
+
+async def run(warehouse_id: Optional[str]) -> None:
+    """Refresh the directory every product_type_refresh_seconds; the lifespan runs this as a background task."""
+
+    directory = get_device_directory()
+    if directory is None or not warehouse_id:
+        return
+
+    settings = get_settings()
+    while True:
+        try:
+            await refresh(directory, warehouse_id)
+        except Exception as e:
+            logger.warning("Product type directory refresh failed: %s", e)
+        await asyncio.sleep(settings.product_type_refresh_seconds)
+
+
+async def resolve(mac_addresses: List[str], warehouse_id: str) -> Dict[str, Optional[str]]:
+    """Product type of each MAC, None for MACs the warehouse has no rows for. MACs the
+    directory does not hold yet are looked up together, in the daily rollup and then,
+    for any it does not hold, in the last day of the 1-minute rollup."""
+
+    directory = get_device_directory()
+    found = directory.lookup(mac_addresses) if directory else {}
+
+    missing = [mac for mac in dict.fromkeys(mac_addresses) if mac not in found]
+    if missing:
+        settings = get_settings()
+        now = datetime.now(timezone.utc)
+        rows = await _read(BULK_TABLE, missing, now - timedelta(seconds=settings.product_type_lookback_seconds), warehouse_id)
+
+        # Devices first seen today are only in the 1-minute rollup.
+        seen = {row["mac_address"] for row in rows}
+        unseen = [mac for mac in missing if mac not in seen]
+        if unseen:
+            recent = max(RECENT_LOOKBACK, timedelta(seconds=settings.product_type_refresh_seconds))
+            rows = [*rows, *await _read(RECENT_TABLE, unseen, now - recent, warehouse_id)]
+
+        found.update({row["mac_address"]: row["product_type"] for row in rows})
+        if directory:
+            directory.update(rows, advance=False)
+            directory.mark_unknown(mac for mac in missing if mac not in found)
+
+    return {mac: found.get(mac) for mac in mac_addresses}
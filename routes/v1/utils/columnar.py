@@ -0,0 +1,109 @@
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple, Type
+from pydantic import BaseModel
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:  # pyarrow is optional; the columnar path is disabled without it
+    pa = None
+    pc = None
+
+
+def available() -> bool:
+    return pa is not None
+
+
+def window_fields(model: Type[BaseModel]) -> List[Tuple[str, bool]]:
+    """(output key, is_timestamp) for every field of a window model, in model order."""
+
+    fields = []
+    for name, field in model.model_fields.items():
+        is_timestamp = datetime in (field.annotation, *getattr(field.annotation, "__args__", ()))
+        fields.append((field.alias or name, is_timestamp))
+    return fields
+
+
+def _json_values(column: "pa.ChunkedArray", is_timestamp: bool, tz_suffix: str) -> "pa.ChunkedArray":
+
+    if is_timestamp:
+        if not pa.types.is_timestamp(column.type):
+            column = pc.cast(column, pa.timestamp("us", tz="UTC"))
+        seconds = pc.cast(column, pa.timestamp("s", tz="UTC"), safe=False)
+        text = pc.strftime(seconds, format="%Y-%m-%dT%H:%M:%S")
+        return pc.binary_join_element_wise('"', text, tz_suffix + '"', "")
+
+    if pa.types.is_floating(column.type):
+        # NaN and infinity have no JSON spelling; they become null, as in the orjson path.
+        column = pc.if_else(pc.is_finite(column), column, pa.scalar(None, column.type))
+    elif pa.types.is_string(column.type) or pa.types.is_large_string(column.type):
+        # No Arrow kernel escapes JSON strings; text columns are rare enough to quote in Python.
+        return pa.chunked_array(
+            [pa.array([None if v is None else json.dumps(v) for v in column.to_pylist()], pa.string())]
+        )
+
+    return pc.cast(column, pa.string())
+
+
+def encode_windows(
+    table: "pa.Table", fields: List[Tuple[str, bool]], keep_nulls: bool, tz_suffix: str
+) -> "pa.ChunkedArray":
+    """One JSON object string per row, built with vectorized Arrow kernels."""
+
+    fragments = []
+
+    for key, is_timestamp in fields:
+        if key not in table.column_names:
+            if keep_nulls:
+                fragments.append(f',"{key}":null')
+            continue
+
+        values = _json_values(table[key], is_timestamp, tz_suffix)
+        fragment = pc.binary_join_element_wise(f',"{key}":', values, "")
+
+        if keep_nulls:
+            fragment = pc.coalesce(fragment, f',"{key}":null')
+        else:
+            fragment = pc.coalesce(fragment, "")
+
+        fragments.append(fragment)
+
+    joined = pc.binary_join_element_wise(*fragments, "")
+    return pc.binary_join_element_wise("{", pc.utf8_slice_codeunits(joined, 1), "}", "")
+
+
+def group_encoded(
+    table: "pa.Table", key: str, encoded: "pa.ChunkedArray"
+) -> Dict[str, Dict[str, str]]:
+    """{mac_address: {attribute: "[...]"}} with each window list already JSON-encoded.
+
+    Rows keep their query order within a group.
+    """
+
+    if table.num_rows == 0:
+        return {}
+
+    frame = pa.table({"mac_address": table["mac_address"], key: table[key], "json": encoded})
+    groups = pa.TableGroupBy(frame, ["mac_address", key], use_threads=False).aggregate([("json", "list")])
+    arrays = pc.binary_join_element_wise("[", pc.binary_join(groups["json_list"], ","), "]", "")
+
+    grouped: Dict[str, Dict[str, str]] = {}
+    for mac, attr, text in zip(
+        groups["mac_address"].to_pylist(), groups[key].to_pylist(), arrays.to_pylist()
+    ):
+        grouped.setdefault(mac, {})[attr] = text
+
+    return grouped
+
+
+def attributes_json(attributes: Dict[str, str]) -> str:
+    return "{" + ",".join(json.dumps(attr) + ":" + text for attr, text in attributes.items()) + "}"
+
+
+def section_json(header: Dict[str, Any], attributes: Optional[Dict[str, str]], empty: str = "{}") -> str:
+    if not attributes:
+        return empty
+
+    head = json.dumps(header)[:-1] + ("," if header else "")
+    return head + '"attributes":' + attributes_json(attributes) + "}"
@@ -0,0 +1,50 @@
+import hashlib
+import json
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Optional
+
+
+def etag(*parts: Any) -> str:
+    """Weak validator over everything that determines a body. Weak, because the same
+    content is sent with different Content-Encodings."""
+
+    digest = hashlib.sha256(json.dumps(parts, default=str).encode()).hexdigest()[:32]
+    return f'W/"{digest}"'
+
+
+def http_date(value: datetime) -> str:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+
+def _parse_http_date(value: str) -> Optional[datetime]:
+    try:
+        parsed = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def _opaque(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def not_modified(if_none_match: Optional[str], if_modified_since: Optional[str], tag: str, last_modified: Optional[str]) -> bool:
+    """Whether a GET with these conditional headers can be answered 304 (RFC 9110 13.2.2):
+    If-None-Match, compared weakly, takes precedence over If-Modified-Since."""
+
+    if if_none_match is not None:
+        candidates = [c for c in if_none_match.split(",") if c.strip()]
+        return any(c.strip() == "*" or _opaque(c) == _opaque(tag) for c in candidates)
+
+    if if_modified_since is not None and last_modified is not None:
+        since = _parse_http_date(if_modified_since)
+        modified = _parse_http_date(last_modified)
+        return since is not None and modified is not None and modified <= since
+
+    return False
@@ -0,0 +1,155 @@
+from datetime import timezone
+from typing import Any, Dict, List
+import numpy as np
+
+MINMAX = "minmax"
+LTTB = "lttb"
+
+# How each value column of a window is combined when buckets are merged.
+REDUCERS = {
+    "min_val": "min",
+    "max_val": "max",
+    "median_val": "median",
+    "consumption": "sum",
+}
+
+# Column LTTB keeps the visual shape of, by preference.
+LTTB_VALUES = ("median_val", "consumption", "max_val")
+
+
+def _epochs(windows: List[Dict[str, Any]], key: str) -> np.ndarray:
+    values = []
+    for window in windows:
+        value = window[key]
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        values.append(value.timestamp())
+    return np.asarray(values, dtype=np.float64)
+
+
+def _column(windows: List[Dict[str, Any]], key: str) -> np.ndarray:
+    return np.asarray(
+        [np.nan if window.get(key) is None else window[key] for window in windows], dtype=np.float64
+    )
+
+
+def _bucket_ids(windows: List[Dict[str, Any]], max_points: int) -> np.ndarray:
+    """Equal-width time buckets over the span of the windows."""
+
+    starts = _epochs(windows, "start_timestamp")
+    span = starts[-1] - starts[0]
+    if span <= 0:
+        return np.zeros(len(windows), dtype=np.int64)
+    ids = ((starts - starts[0]) * max_points // span).astype(np.int64)
+    return np.minimum(ids, max_points - 1)
+
+
+def _median(values: np.ndarray, ids: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """Per-bucket median ignoring NaN, from one sort by (bucket, value)."""
+
+    order = np.lexsort((values, ids))
+    ordered = values[order]
+    valid = np.add.reduceat(~np.isnan(values), offsets)
+    low = ordered[offsets + np.maximum(valid - 1, 0) // 2]
+    high = ordered[offsets + np.maximum(valid, 1) // 2]
+    return np.where(valid > 0, (low + high) / 2, np.nan)
+
+
+def _reduce(values: np.ndarray, how: str, offsets: np.ndarray, ids: np.ndarray) -> np.ndarray:
+
+    if how == "median":
+        return _median(values, ids, offsets)
+
+    counts = np.add.reduceat(~np.isnan(values), offsets)
+    if how == "min":
+        reduced = np.fmin.reduceat(values, offsets)
+    elif how == "max":
+        reduced = np.fmax.reduceat(values, offsets)
+    else:
+        reduced = np.add.reduceat(np.nan_to_num(values), offsets)
+    return np.where(counts > 0, reduced, np.nan)
+
+
+def minmax_buckets(windows: List[Dict[str, Any]], max_points: int) -> List[Dict[str, Any]]:
+    """Merge time-ordered windows into at most max_points buckets that keep the
+    extremes: min of minimums, max of maximums, median of medians, total consumption."""
+
+    if len(windows) <= max_points:
+        return windows
+
+    ids = _bucket_ids(windows, max_points)
+    offsets = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+    lasts = np.r_[offsets[1:], len(windows)] - 1
+
+    columns = {}
+    for key in windows[0]:
+        how = REDUCERS.get(key)
+        if how is not None:
+            reduced = _reduce(_column(windows, key), how, offsets, ids)
+            columns[key] = [None if np.isnan(v) else v for v in reduced.tolist()]
+
+    merged = []
+    for i, (first, last) in enumerate(zip(offsets.tolist(), lasts.tolist())):
+        window = dict(windows[first])
+        window["end_timestamp"] = windows[last]["end_timestamp"]
+        for key, values in columns.items():
+            window[key] = values[i]
+        merged.append(window)
+
+    return merged
+
+
+def lttb(windows: List[Dict[str, Any]], max_points: int) -> List[Dict[str, Any]]:
+    """Largest-Triangle-Three-Buckets: keep the max_points windows that best preserve
+    the shape of the series. Windows are returned unchanged, not merged."""
+
+    if len(windows) <= max_points:
+        return windows
+    if max_points < 3:
+        return [windows[0], windows[-1]][:max_points]
+
+    value_key = next((key for key in LTTB_VALUES if key in windows[0]), None)
+    if value_key is None:
+        return minmax_buckets(windows, max_points)
+
+    x = _epochs(windows, "start_timestamp")
+    y = _column(windows, value_key)
+    y = np.where(np.isnan(y), np.nanmean(y) if not np.isnan(y).all() else 0.0, y)
+
+    # First and last points are fixed; the rest are split into max_points - 2 buckets.
+    edges = np.linspace(1, len(windows) - 1, max_points - 1).astype(np.int64)
+    selected = [0]
+    previous = 0
+
+    for i in range(max_points - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else len(windows)
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+
+        area = np.abs(
+            (x[previous] - avg_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (avg_y - y[previous])
+        )
+        previous = start + int(np.argmax(area))
+        selected.append(previous)
+
+    selected.append(len(windows) - 1)
+    return [windows[i] for i in selected]
+
+
+def downsample(windows: List[Dict[str, Any]], max_points: int, method: str = MINMAX) -> List[Dict[str, Any]]:
+    if method == LTTB:
+        return lttb(windows, max_points)
+    return minmax_buckets(windows, max_points)
+
+
+def downsample_grouped(
+    grouped: Dict[str, Dict[str, List[Dict[str, Any]]]], max_points: int, method: str = MINMAX
+) -> Dict[str, Dict[str, List[Dict[str, Any]]]]:
+    """Downsample every {mac: {attribute: windows}} series; the input is left untouched."""
+
+    return {
+        mac: {attr: downsample(windows, max_points, method) for attr, windows in attrs.items()}
+        for mac, attrs in grouped.items()
+    }
@@ -0,0 +1,180 @@
+import gzip
+import io
+from datetime import datetime
+from decimal import Decimal
+from functools import partial
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+except ImportError:  # the Arrow and Parquet formats need pyarrow
+    pa = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+JSON = "application/json"
+ARROW = "application/vnd.apache.arrow.stream"
+PARQUET = "application/vnd.apache.parquet"
+MSGPACK = "application/msgpack"
+
+# ?format= values and the media types that select them through Accept.
+FORMATS = {
+    "json": (JSON, ("application/json",)),
+    "arrow": (ARROW, ("application/vnd.apache.arrow.stream", "application/vnd.apache.arrow.file")),
+    "parquet": (PARQUET, ("application/vnd.apache.parquet", "application/x-parquet")),
+    "msgpack": (MSGPACK, ("application/msgpack", "application/x-msgpack")),
+}
+
+# Bodies smaller than this are not worth compressing.
+MIN_COMPRESS_SIZE = 1024
+
+
+def supported(fmt: str) -> bool:
+    if fmt in ("arrow", "parquet"):
+        return pa is not None
+    if fmt == "msgpack":
+        return msgpack is not None
+    return fmt == "json"
+
+
+def negotiate_format(requested: Optional[str], accept: Optional[str], allowed: Sequence[str] = tuple(FORMATS)) -> Optional[str]:
+    """Pick a response format from ?format= or the Accept header. None only for a ?format=
+    that is not allowed or available; an Accept header naming nothing we can send gets JSON."""
+
+    if requested:
+        return requested if requested in allowed and supported(requested) else None
+
+    if not accept:
+        return "json"
+
+    ranked = []
+    for position, item in enumerate(accept.split(",")):
+        media, _, params = item.strip().partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        ranked.append((-quality, position, media.strip().lower()))
+
+    for negative_quality, _, media in sorted(ranked):
+        if negative_quality >= 0:
+            break
+        if media in ("*/*", "application/*"):
+            return "json"
+        for fmt in allowed:
+            if media in FORMATS[fmt][1] and supported(fmt):
+                return fmt
+
+    return "json"
+
+
+def negotiate_encoding(accept_encoding: Optional[str], size: int) -> Optional[str]:
+    if size < MIN_COMPRESS_SIZE or not accept_encoding:
+        return None
+
+    offered = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        offered[coding.strip().lower()] = quality
+
+    if zstandard is not None and offered.get("zstd", 0) > 0:
+        return "zstd"
+    if offered.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=3).compress(body)
+    return gzip.compress(body, compresslevel=5)
+
+
+def grouped_table(grouped: Dict[str, Dict[str, list]], key: str) -> "pa.Table":
+    """Rows of a {mac: {attribute: windows}} result as an Arrow table."""
+
+    rows = [
+        {"mac_address": mac, key: attr, **window}
+        for mac, attrs in grouped.items()
+        for attr, windows in attrs.items()
+        for window in windows
+    ]
+    return pa.Table.from_pylist(rows)
+
+
+def history_table(sections: Dict[str, "pa.Table"], metadata: Dict[str, str]) -> "pa.Table":
+    """One long table for a device history: a `section` column (agg, usage or mode),
+    `attribute` for the attribute or mode attribute, and the union of window columns."""
+
+    tables = []
+    for section, table in sections.items():
+        if "mode_attr" in table.column_names:
+            table = table.rename_columns(
+                ["attribute" if name == "mode_attr" else name for name in table.column_names]
+            )
+        section_column = pa.array([section] * table.num_rows, pa.string())
+        tables.append(table.add_column(0, "section", section_column))
+
+    if not tables:
+        table = pa.table({"section": pa.array([], pa.string())})
+    else:
+        table = pa.concat_tables(tables, promote_options="permissive")
+
+    return table.replace_schema_metadata({k: v for k, v in metadata.items() if v is not None})
+
+
+def to_arrow_ipc(table: "pa.Table") -> bytes:
+    sink = io.BytesIO()
+    options = pa.ipc.IpcWriteOptions(compression="zstd")
+    with pa.ipc.new_stream(sink, table.schema, options=options) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+def to_parquet(table: "pa.Table") -> bytes:
+    sink = io.BytesIO()
+    pq.write_table(table, sink, compression="zstd")
+    return sink.getvalue()
+
+
+def _msgpack_default(utc_z: bool, value: Any) -> Any:
+    if isinstance(value, datetime):
+        text = value.isoformat()
+        return text[:-6] + "Z" if utc_z and text.endswith("+00:00") else text
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Type is not MessagePack serializable: {type(value).__name__}")
+
+
+def to_msgpack(*parts: Tuple[Dict[str, Any], bool]) -> bytes:
+    """One MessagePack map holding the entries of every (payload, utc_z) part, packed
+    straight from the payloads. Datetimes become the strings the JSON body carries:
+    "Z" for UTC where utc_z is set (pydantic's JSON mode), isoformat() otherwise."""
+
+    chunks = [msgpack.Packer().pack_map_header(sum(len(payload) for payload, _ in parts))]
+    for payload, utc_z in parts:
+        packer = msgpack.Packer(default=partial(_msgpack_default, utc_z))
+        for key, value in payload.items():
+            chunks.append(packer.pack(key))
+            chunks.append(packer.pack(value))
+    return b"".join(chunks)
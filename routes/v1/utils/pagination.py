@@ -0,0 +1,52 @@
+import base64
+import hashlib
+import json
+from datetime import datetime
+from typing import Any, Iterable, NamedTuple, Optional
+
+
+class Cursor(NamedTuple):
+    """Where the next page resumes: the source being read and the last (attribute,
+    start_timestamp) already returned from it, or None to start the source from the top."""
+
+    source: str
+    attribute: Optional[str]
+    start: Optional[datetime]
+    fingerprint: str
+
+
+def fingerprint(*parts: Any) -> str:
+    """Short digest of the query a cursor belongs to, so it cannot be replayed on another."""
+
+    return hashlib.sha256(json.dumps(parts, default=str).encode()).hexdigest()[:16]
+
+
+def query_fingerprint(
+    mac_address: str, product_type: str, attributes: Optional[Iterable[str]], from_: datetime, to: datetime, level: Optional[str]
+) -> str:
+    return fingerprint(
+        mac_address, product_type, sorted(attributes or []), from_.isoformat(), to.isoformat(), level
+    )
+
+
+def encode_cursor(cursor: Cursor) -> str:
+    payload = {
+        "s": cursor.source,
+        "a": cursor.attribute,
+        "t": cursor.start.isoformat() if cursor.start is not None else None,
+        "q": cursor.fingerprint,
+    }
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token: str) -> Cursor:
+    """Raises ValueError for anything that is not a cursor issued by encode_cursor."""
+
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        payload = json.loads(raw)
+        start = datetime.fromisoformat(payload["t"]) if payload["t"] is not None else None
+        return Cursor(payload["s"], payload["a"], start, payload["q"])
+    except (ValueError, TypeError, KeyError) as e:
+        raise ValueError("Malformed cursor") from e
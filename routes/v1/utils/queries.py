@@ -118,4 +118,210 @@ WHERE
   AND start_timestamp < ?
   AND end_timestamp > ?
   ORDER BY start_timestamp
-"""
\ No newline at end of file
+"""
+# Multi-device variants: same projection and predicates, matching a set of MACs at once.
+AGG_BATCH_QUERY_WITH_ATTR = AGG_QUERY_WITH_ATTR.replace("mac_address = ?", "mac_address IN ({mac_placeholders})")
+AGG_BATCH_QUERY_NO_ATTR = AGG_QUERY_NO_ATTR.replace("mac_address = ?", "mac_address IN ({mac_placeholders})")
+USAGE_BATCH_QUERY_WITH_ATTR = USAGE_QUERY_WITH_ATTR.replace("mac_address = ?", "mac_address IN ({mac_placeholders})")
+USAGE_BATCH_QUERY_NO_ATTR = USAGE_QUERY_NO_ATTR.replace("mac_address = ?", "mac_address IN ({mac_placeholders})")
+MODE_BATCH_QUERY_WITH_ATTR = MODE_QUERY_WITH_ATTR.replace("mac_address = ?", "mac_address IN ({mac_placeholders})")
+MODE_BATCH_QUERY_NO_ATTR = MODE_QUERY_NO_ATTR.replace("mac_address = ?", "mac_address IN ({mac_placeholders})")
+# Keyset pages: rows ordered by (attribute, start_timestamp), resuming after the last
+# row of the previous page via {seek} (SEEK_PREDICATE or empty) instead of an OFFSET.
+SEEK_PREDICATE = "AND ({key} > ? OR ({key} = ? AND start_timestamp > ?))"
+AGG_PAGE_QUERY_WITH_ATTR = AGG_QUERY_WITH_ATTR.replace("ORDER BY start_timestamp", "{seek}\n  ORDER BY attribute, start_timestamp\n  LIMIT {limit}")
+AGG_PAGE_QUERY_NO_ATTR = AGG_QUERY_NO_ATTR.replace("ORDER BY start_timestamp", "{seek}\n  ORDER BY attribute, start_timestamp\n  LIMIT {limit}")
+USAGE_PAGE_QUERY_WITH_ATTR = USAGE_QUERY_WITH_ATTR.replace("ORDER BY start_timestamp", "{seek}\n  ORDER BY attribute, start_timestamp\n  LIMIT {limit}")
+USAGE_PAGE_QUERY_NO_ATTR = USAGE_QUERY_NO_ATTR.replace("ORDER BY start_timestamp", "{seek}\n  ORDER BY attribute, start_timestamp\n  LIMIT {limit}")
+MODE_PAGE_QUERY_WITH_ATTR = MODE_QUERY_WITH_ATTR.replace("ORDER BY start_timestamp", "{seek}\n  ORDER BY mode_attr, start_timestamp\n  LIMIT {limit}")
+MODE_PAGE_QUERY_NO_ATTR = MODE_QUERY_NO_ATTR.replace("ORDER BY start_timestamp", "{seek}\n  ORDER BY mode_attr, start_timestamp\n  LIMIT {limit}")
+# Streamed reads: rows grouped by attribute, so each section is written out in one pass.
+AGG_STREAM_QUERY_WITH_ATTR = AGG_QUERY_WITH_ATTR.replace("ORDER BY start_timestamp", "ORDER BY attribute, start_timestamp")
+AGG_STREAM_QUERY_NO_ATTR = AGG_QUERY_NO_ATTR.replace("ORDER BY start_timestamp", "ORDER BY attribute, start_timestamp")
+USAGE_STREAM_QUERY_WITH_ATTR = USAGE_QUERY_WITH_ATTR.replace("ORDER BY start_timestamp", "ORDER BY attribute, start_timestamp")
+USAGE_STREAM_QUERY_NO_ATTR = USAGE_QUERY_NO_ATTR.replace("ORDER BY start_timestamp", "ORDER BY attribute, start_timestamp")
+MODE_STREAM_QUERY_WITH_ATTR = MODE_QUERY_WITH_ATTR.replace("ORDER BY start_timestamp", "ORDER BY mode_attr, start_timestamp")
+MODE_STREAM_QUERY_NO_ATTR = MODE_QUERY_NO_ATTR.replace("ORDER BY start_timestamp", "ORDER BY mode_attr, start_timestamp")
+# Combined reads: both tables of a product type in one statement. `source` tells the
+# rows apart and columns the other table lacks are NULL; the WHERE parameters repeat
+# once per branch.
+AGG_USAGE_QUERY_WITH_ATTR = """
+SELECT
+  'agg' AS source,
+  mac_address,
+  attribute,
+  start_timestamp,
+  end_timestamp,
+  min_val,
+  max_val,
+  median_val,
+  CAST(NULL AS DOUBLE) AS consumption
+FROM {agg_table_path}
+WHERE
+  mac_address = ?
+  AND attribute IN ({in_placeholders})
+  AND product_type = ?
+  AND start_timestamp < ?
+  AND end_timestamp > ?
+UNION ALL
+SELECT
+  'usage' AS source,
+  mac_address,
+  attribute,
+  start_timestamp,
+  end_timestamp,
+  min_val,
+  max_val,
+  CAST(NULL AS DOUBLE) AS median_val,
+  consumption
+FROM {other_table_path}
+WHERE
+  mac_address = ?
+  AND attribute IN ({other_in_placeholders})
+  AND product_type = ?
+  AND start_timestamp < ?
+  AND end_timestamp > ?
+  ORDER BY start_timestamp
+"""
+AGG_USAGE_QUERY_NO_ATTR = AGG_USAGE_QUERY_WITH_ATTR.replace("\n  AND attribute IN ({in_placeholders})", "").replace("\n  AND attribute IN ({other_in_placeholders})", "")
+AGG_MODE_QUERY_WITH_ATTR = """
+SELECT
+  'agg' AS source,
+  mac_address,
+  attribute,
+  start_timestamp,
+  end_timestamp,
+  min_val,
+  max_val,
+  median_val,
+  CAST(NULL AS INT) AS mode_value,
+  CAST(NULL AS INT) AS window_duration_S,
+  CAST(NULL AS DOUBLE) AS HEATSETP_min,
+  CAST(NULL AS DOUBLE) AS HEATSETP_max,
+  CAST(NULL AS DOUBLE) AS HEATSETP_median,
+  CAST(NULL AS DOUBLE) AS COOLSETP_min,
+  CAST(NULL AS DOUBLE) AS COOLSETP_max,
+  CAST(NULL AS DOUBLE) AS COOLSETP_median,
+  CAST(NULL AS DOUBLE) AS SPT_min,
+  CAST(NULL AS DOUBLE) AS SPT_max,
+  CAST(NULL AS DOUBLE) AS SPT_median
+FROM {agg_table_path}
+WHERE
+  mac_address = ?
+  AND attribute IN ({in_placeholders})
+  AND product_type = ?
+  AND start_timestamp < ?
+  AND end_timestamp > ?
+UNION ALL
+SELECT
+  'mode' AS source,
+  mac_address,
+  mode_attr AS attribute,
+  start_timestamp,
+  end_timestamp,
+  CAST(NULL AS DOUBLE) AS min_val,
+  CAST(NULL AS DOUBLE) AS max_val,
+  CAST(NULL AS DOUBLE) AS median_val,
+  mode_value,
+  window_duration_S,
+  HEATSETP_min,
+  HEATSETP_max,
+  HEATSETP_median,
+  COOLSETP_min,
+  COOLSETP_max,
+  COOLSETP_median,
+  SPT_min,
+  SPT_max,
+  SPT_median
+FROM {other_table_path}
+WHERE
+  mac_address = ?
+  AND mode_attr IN ({other_in_placeholders})
+  AND product_type = ?
+  AND start_timestamp < ?
+  AND end_timestamp > ?
+  ORDER BY start_timestamp
+"""
+AGG_MODE_QUERY_NO_ATTR = AGG_MODE_QUERY_WITH_ATTR.replace("\n  AND attribute IN ({in_placeholders})", "").replace("\n  AND mode_attr IN ({other_in_placeholders})", "")
+AGG_USAGE_BATCH_QUERY_WITH_ATTR = AGG_USAGE_QUERY_WITH_ATTR.replace("mac_address = ?", "mac_address IN ({mac_placeholders})")
+AGG_USAGE_BATCH_QUERY_NO_ATTR = AGG_USAGE_QUERY_NO_ATTR.replace("mac_address = ?", "mac_address IN ({mac_placeholders})")
+AGG_MODE_BATCH_QUERY_WITH_ATTR = AGG_MODE_QUERY_WITH_ATTR.replace("mac_address = ?", "mac_address IN ({mac_placeholders})")
+AGG_MODE_BATCH_QUERY_NO_ATTR = AGG_MODE_QUERY_NO_ATTR.replace("mac_address = ?", "mac_address IN ({mac_placeholders})")
+# Fleet aggregates: every device of a product type (or the listed MACs) reduced to one
+# series per attribute, per rollup window, inside the warehouse. Spread is taken over
+# the devices' window medians; min/max over their window extremes.
+FLEET_QUERY = """
+SELECT
+  attribute,
+  start_timestamp,
+  end_timestamp,
+  MIN(min_val) AS min_val,
+  PERCENTILE_APPROX(median_val, 0.25) AS p25_val,
+  PERCENTILE_APPROX(median_val, 0.5) AS median_val,
+  PERCENTILE_APPROX(median_val, 0.75) AS p75_val,
+  MAX(max_val) AS max_val,
+  AVG(median_val) AS mean_val,
+  COUNT(DISTINCT mac_address) AS devices
+FROM {table_path}
+WHERE
+  attribute IN ({in_placeholders})
+  AND product_type = ?
+  AND start_timestamp < ?
+  AND end_timestamp > ?
+  GROUP BY attribute, start_timestamp, end_timestamp
+  ORDER BY attribute, start_timestamp
+"""
+FLEET_MACS_QUERY = FLEET_QUERY.replace("WHERE\n  attribute IN", "WHERE\n  mac_address IN ({mac_placeholders})\n  AND attribute IN")
+# Latest-value index refresh: the most recent row per device and attribute among rows
+# ending after the index's watermark, across every device.
+LATEST_AGG_QUERY = """
+SELECT mac_address, product_type, attribute, start_timestamp, end_timestamp, min_val, max_val, median_val
+FROM (
+  SELECT
+    mac_address, product_type, attribute, start_timestamp, end_timestamp, min_val, max_val, median_val,
+    ROW_NUMBER() OVER (PARTITION BY mac_address, attribute ORDER BY end_timestamp DESC) AS recency
+  FROM {table_path}
+  WHERE end_timestamp > ?
+) AS recent
+WHERE recency = 1
+"""
+LATEST_USAGE_QUERY = LATEST_AGG_QUERY.replace("median_val", "consumption")
+LATEST_MODE_QUERY = """
+SELECT
+  mac_address, product_type, mode_attr, mode_value, start_timestamp, end_timestamp, window_duration_S,
+  HEATSETP_min, HEATSETP_max, HEATSETP_median, COOLSETP_min, COOLSETP_max, COOLSETP_median,
+  SPT_min, SPT_max, SPT_median
+FROM (
+  SELECT
+    *,
+    ROW_NUMBER() OVER (PARTITION BY mac_address, mode_attr ORDER BY end_timestamp DESC) AS recency
+  FROM {table_path}
+  WHERE end_timestamp > ?
+) AS recent
+WHERE recency = 1
+"""
+# Product type directory: the product type each device last reported, from a rollup
+# table and the mode table (zone controllers only write the latter).
+PRODUCT_TYPES_QUERY = """
+SELECT mac_address, product_type, end_timestamp
+FROM (
+  SELECT
+    mac_address, product_type, end_timestamp,
+    ROW_NUMBER() OVER (PARTITION BY mac_address ORDER BY end_timestamp DESC) AS recency
+  FROM (
+    SELECT mac_address, product_type, end_timestamp FROM {table_path} WHERE end_timestamp > ?
+    UNION ALL
+    SELECT mac_address, product_type, end_timestamp FROM {other_table_path} WHERE end_timestamp > ?
+  ) AS seen
+) AS recent
+WHERE recency = 1
+"""
+PRODUCT_TYPES_MACS_QUERY = PRODUCT_TYPES_QUERY.replace("WHERE end_timestamp > ?", "WHERE mac_address IN ({mac_placeholders}) AND end_timestamp > ?")
+# Newest window of one device in a table, the validator of responses over windows still open.
+WATERMARK_QUERY = """
+SELECT MAX(end_timestamp) AS watermark
+FROM {table_path}
+WHERE
+  mac_address = ?
+  AND product_type = ?
+"""
@@ -0,0 +1,58 @@
+from functools import lru_cache
+from typing import Any, Iterable, Optional, Tuple
+
+# IN (...) lists are padded with NULLs up to one of these sizes, so a request for 3 or
+# for 4 attributes sends the warehouse the same statement text. NULL never matches.
+ARITY_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+
+def arity(count: int) -> int:
+    """Smallest bucket holding `count` values; beyond the last, the next multiple of it."""
+
+    for size in ARITY_BUCKETS:
+        if count <= size:
+            return size
+    largest = ARITY_BUCKETS[-1]
+    return -(-count // largest) * largest
+
+
+def canonical(values: Optional[Iterable[str]]) -> Tuple[Any, ...]:
+    """Distinct values in sorted order, padded with None to their arity bucket."""
+
+    if not values:
+        return ()
+    distinct = sorted(set(values))
+    return (*distinct, *([None] * (arity(len(distinct)) - len(distinct))))
+
+
+@lru_cache(maxsize=None)
+def placeholders(count: int) -> str:
+    return ",".join(["?"] * count)
+
+
+@lru_cache(maxsize=1024)
+def build(
+    template: str,
+    table_path: str,
+    other_table_path: str = "",
+    macs: int = 1,
+    attributes: int = 0,
+    other_attributes: int = 0,
+    seek: str = "",
+    limit: Optional[int] = None,
+) -> str:
+    """Render a template from queries.py once per (template, tables, arities, page shape).
+
+    Counts are the already padded lengths of the parameter lists.
+    """
+
+    return template.format(
+        table_path=table_path,
+        agg_table_path=table_path,
+        other_table_path=other_table_path,
+        mac_placeholders=placeholders(macs),
+        in_placeholders=placeholders(attributes),
+        other_in_placeholders=placeholders(other_attributes),
+        seek=seek,
+        limit=limit,
+    )
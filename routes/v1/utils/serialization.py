@@ -0,0 +1,55 @@
+from decimal import Decimal
+from typing import Any, Dict, List
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; callers fall back to the pydantic round-trip
+    orjson = None
+
+
+def available() -> bool:
+    return orjson is not None
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def _drop_nulls(windows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [
+        window if None not in window.values() else {k: v for k, v in window.items() if v is not None}
+        for window in windows
+    ]
+
+
+def shape_sections(finalDict: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Apply what model_dump(exclude_none=True) plus the empty-section blanking would do
+    to a {mac: {section: {..., "attributes": {...}}}} payload built from trusted rows."""
+
+    shaped: Dict[str, Dict[str, Any]] = {}
+
+    for mac, payload in finalDict.items():
+        device = {}
+
+        for section, body in payload.items():
+            attributes = body.get("attributes")
+            if not attributes:
+                device[section] = {}
+                continue
+
+            out = {k: v for k, v in body.items() if k != "attributes" and v is not None}
+            out["attributes"] = {attr: _drop_nulls(windows) for attr, windows in attributes.items()}
+            device[section] = out
+
+        shaped[mac] = device
+
+    return shaped
+
+
+def dumps(data: Any, utc_z: bool = False) -> bytes:
+    """Encode a response payload. utc_z matches pydantic's JSON mode ("Z"); otherwise
+    datetimes keep isoformat()'s "+00:00" like the python-mode dumps do."""
+
+    return orjson.dumps(data, default=_default, option=orjson.OPT_UTC_Z if utc_z else 0)
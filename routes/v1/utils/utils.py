@@ -1,5 +1,17 @@
+import os
 import re
 
+# (row length in seconds, table env var, level) of every rollup table, finest first.
+ROLLUPS = (
+    (60, "DATABRICKS_TABLE_1MIN", "1 Minute"),
+    (300, "DATABRICKS_TABLE_5MIN", "5 Minutes"),
+    (900, "DATABRICKS_TABLE_15MIN", "15 Minutes"),
+    (3600, "DATABRICKS_TABLE_1HOUR", "1 Hour"),
+    (21600, "DATABRICKS_TABLE_6HOUR", "6 Hours"),
+    (86400, "DATABRICKS_TABLE_1DAY", "1 Day"),
+    (604800, "DATABRICKS_TABLE_1WEEK", "1 Week"),
+)
+
 def calculate_aggregation_level(start_date, end_date):
 
     minutes = (end_date-start_date).total_seconds() / 60
@@ -17,6 +29,18 @@ def calculate_aggregation_level(start_date, end_date):
         if minutes <= limit:
             return table, level
 
+def aggregation_level_for_points(start_date, end_date, max_points, oversampling=4):
+    """Finest configured rollup whose row count per attribute stays within
+    max_points * oversampling; the rows are downsampled to max_points afterwards."""
+
+    seconds = (end_date-start_date).total_seconds()
+
+    for step, table, level in ROLLUPS:
+        if seconds / step <= max_points * oversampling and os.getenv(table):
+            return table, level
+
+    return ROLLUPS[-1][1], ROLLUPS[-1][2]
+
 def is_valid_mac_address(mac_address: str) -> bool:
     mac_pattern = re.compile(r"^([0-9A-Fa-f]{2}[:-]){5}([0-9A-Fa-f]{2})$")
     return bool(mac_pattern.match(mac_address))
\ No newline at end of file
@@ -0,0 +1,189 @@
+import os
+import pickle
+import sqlite3
+import stat
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+from errors.exceptions import ConfigurationError
+
+
+class CacheBackend:
+    """Storage behind ResultCache. Values are evicted by TTL, then least-recently-used
+    first once either ``max_entries`` or the total ``weight`` budget is exceeded."""
+
+    # Whether get/set do I/O, so async callers must run them off the event loop.
+    blocking = False
+
+    def get(self, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, ttl: float, weight: int = 1) -> None:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+
+class MemoryBackend(CacheBackend):
+    """Per-process LRU dict. Values are shared by reference and must not be mutated."""
+
+    def __init__(self, max_entries: int = 1024, max_weight: int = 1_000_000):
+        self._max_entries = max_entries
+        self._max_weight = max_weight
+        self._data: "OrderedDict[str, Tuple[Any, float, int]]" = OrderedDict()
+        self._weight = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+
+            value, expires_at, weight = entry
+            if expires_at <= time.monotonic():
+                self._pop(key)
+                return None
+
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: float, weight: int = 1) -> None:
+        if weight > self._max_weight:
+            return
+
+        with self._lock:
+            self._pop(key)
+            self._data[key] = (value, time.monotonic() + ttl, weight)
+            self._weight += weight
+
+            while len(self._data) > self._max_entries or self._weight > self._max_weight:
+                oldest = next(iter(self._data))
+                self._pop(oldest)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._pop(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._weight = 0
+
+    def _pop(self, key: str) -> None:
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self._weight -= entry[2]
+
+
+def _private(path: str, kind: int) -> None:
+    """Refuse a path another user owns or may write to: loading a cached value unpickles it."""
+
+    info = os.lstat(path)
+    if stat.S_IFMT(info.st_mode) != kind or info.st_uid != os.geteuid() or info.st_mode & 0o022:
+        raise ConfigurationError(
+            message="Result cache path must be owned by this service and writable by it alone",
+            details={"setting": "result_cache_path", "path": path},
+        )
+
+
+class SqliteBackend(CacheBackend):
+    """Pickled values in a local sqlite file, shared by every worker on the host. The file
+    and its directory, created with mode 0700, must belong to the service."""
+
+    blocking = True
+
+    def __init__(self, path: str, max_entries: int = 1024, max_weight: int = 1_000_000):
+        self._path = path
+        self._max_entries = max_entries
+        self._max_weight = max_weight
+        self._local = threading.local()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        _private(directory, stat.S_IFDIR)
+        if os.path.lexists(path):
+            _private(path, stat.S_IFREG)
+
+        with self._conn() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS result_cache (
+                  key TEXT PRIMARY KEY,
+                  value BLOB NOT NULL,
+                  expires_at REAL NOT NULL,
+                  accessed_at REAL NOT NULL,
+                  weight INTEGER NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS result_cache_accessed ON result_cache (accessed_at)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self._path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT value FROM result_cache WHERE key = ? AND expires_at > ?", (key, now)
+        ).fetchone()
+        if row is None:
+            return None
+
+        conn.execute("UPDATE result_cache SET accessed_at = ? WHERE key = ?", (now, key))
+        return pickle.loads(row[0])
+
+    def set(self, key: str, value: Any, ttl: float, weight: int = 1) -> None:
+        if weight > self._max_weight:
+            return
+
+        now = time.time()
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        conn = self._conn()
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO result_cache (key, value, expires_at, accessed_at, weight) VALUES (?, ?, ?, ?, ?)",
+                (key, blob, now + ttl, now, weight),
+            )
+            conn.execute("DELETE FROM result_cache WHERE expires_at <= ?", (now,))
+            self._evict(conn)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        entries, weight = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(weight), 0) FROM result_cache"
+        ).fetchone()
+
+        if entries <= self._max_entries and weight <= self._max_weight:
+            return
+
+        for key, row_weight in conn.execute(
+            "SELECT key, weight FROM result_cache ORDER BY accessed_at"
+        ).fetchall():
+            if entries <= self._max_entries and weight <= self._max_weight:
+                break
+            conn.execute("DELETE FROM result_cache WHERE key = ?", (key,))
+            entries -= 1
+            weight -= row_weight
+
+    def delete(self, key: str) -> None:
+        self._conn().execute("DELETE FROM result_cache WHERE key = ?", (key,))
+
+    def clear(self) -> None:
+        self._conn().execute("DELETE FROM result_cache")
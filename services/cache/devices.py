@@ -0,0 +1,85 @@
+import threading
+import time
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional
+from config.settings import get_settings
+
+
+class DeviceDirectory:
+    """Product type each MAC address last reported, loaded in bulk and kept current by
+    incremental reads. MACs the warehouse did not know are remembered for a while too,
+    so a client repeating an unknown MAC does not cost a lookup per request."""
+
+    def __init__(self, negative_ttl: float):
+        self._product_types: Dict[str, str] = {}
+        self._last_seen: Dict[str, datetime] = {}
+        self._unknown: Dict[str, float] = {}
+        self._watermark: Optional[datetime] = None
+        self.negative_ttl = negative_ttl
+        self.refreshed_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def watermark(self) -> Optional[datetime]:
+        """Latest end_timestamp seen by a refresh."""
+        with self._lock:
+            return self._watermark
+
+    def update(self, rows: List[Dict[str, Any]], advance: bool = True) -> int:
+        """Record the product type of each row's MAC unless a later one is known; returns
+        how many changed. Point lookups pass advance=False, as they say nothing about
+        devices they did not ask for."""
+
+        changed = 0
+        with self._lock:
+            for row in rows:
+                mac = row["mac_address"]
+                seen = row["end_timestamp"]
+                self._unknown.pop(mac, None)
+
+                last = self._last_seen.get(mac)
+                if last is None or seen >= last:
+                    if self._product_types.get(mac) != row["product_type"]:
+                        changed += 1
+                    self._product_types[mac] = row["product_type"]
+                    self._last_seen[mac] = seen
+
+                if advance and (self._watermark is None or seen > self._watermark):
+                    self._watermark = seen
+        return changed
+
+    def mark_unknown(self, mac_addresses: Iterable[str]) -> None:
+        expires = time.monotonic() + self.negative_ttl
+        with self._lock:
+            for mac in mac_addresses:
+                self._unknown[mac] = expires
+
+    def lookup(self, mac_addresses: Iterable[str]) -> Dict[str, Optional[str]]:
+        """{mac: product type} for known MACs, {mac: None} for recently unknown ones;
+        MACs never looked up are left out."""
+
+        now = time.monotonic()
+        found: Dict[str, Optional[str]] = {}
+        with self._lock:
+            for mac in mac_addresses:
+                if mac in self._product_types:
+                    found[mac] = self._product_types[mac]
+                elif self._unknown.get(mac, 0) > now:
+                    found[mac] = None
+        return found
+
+    def mark_refreshed(self, at: float) -> None:
+        self.refreshed_at = at
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"devices": len(self._product_types), "refreshed_at": self.refreshed_at}
+
+
+@lru_cache(maxsize=1)
+def get_device_directory() -> Optional[DeviceDirectory]:
+    settings = get_settings()
+    if not settings.product_type_cache_enabled:
+        return None
+    return DeviceDirectory(negative_ttl=settings.product_type_refresh_seconds)
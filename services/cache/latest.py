@@ -0,0 +1,121 @@
+import threading
+import time
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+from config.settings import get_settings
+
+# Columns that address a row in the index rather than describe its window.
+ADDRESS_COLUMNS = ("mac_address", "product_type")
+
+
+def _utc(value: datetime) -> datetime:
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+class LatestIndex:
+    """Most recent window per (MAC, source, attribute), kept current by periodic bulk
+    reads. Rows are shared by reference and must not be mutated."""
+
+    def __init__(self):
+        # mac -> source -> attribute -> window
+        self._devices: Dict[str, Dict[str, Dict[str, Dict[str, Any]]]] = {}
+        self._product_types: Dict[str, str] = {}
+        self._watermarks: Dict[str, datetime] = {}
+        self.refreshed_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def watermark(self, source: str) -> Optional[datetime]:
+        """Latest end_timestamp indexed for a source, never past the time it was indexed."""
+        with self._lock:
+            return self._watermarks.get(source)
+
+    def update(self, source: str, key: str, rows: List[Dict[str, Any]]) -> int:
+        """Index every row at least as recent as the one held; returns how many were.
+
+        A row from a device with a clock running ahead is indexed, but moves the watermark
+        no further than now: the next refresh would otherwise skip every other device's
+        late rows."""
+
+        stored = 0
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            watermark = self._watermarks.get(source)
+
+            for row in rows:
+                mac = row["mac_address"]
+                attribute = row[key]
+                end = row["end_timestamp"]
+
+                windows = self._devices.setdefault(mac, {}).setdefault(source, {})
+                current = windows.get(attribute)
+                if current is None or end >= current["end_timestamp"]:
+                    windows[attribute] = {
+                        column: value for column, value in row.items()
+                        if column != key and column not in ADDRESS_COLUMNS
+                    }
+                    stored += 1
+
+                if row.get("product_type"):
+                    self._product_types[mac] = row["product_type"]
+                end = min(_utc(end), now)
+                if watermark is None or end > watermark:
+                    watermark = end
+
+            if watermark is not None:
+                self._watermarks[source] = watermark
+
+        return stored
+
+    def evict(self, source: str, before: datetime) -> int:
+        """Drop windows of a source that ended before `before`; returns how many."""
+
+        before = _utc(before)
+        evicted = 0
+        with self._lock:
+            for mac in list(self._devices):
+                sources = self._devices[mac]
+                windows = sources.get(source, {})
+                for attribute in [a for a, window in windows.items() if _utc(window["end_timestamp"]) < before]:
+                    del windows[attribute]
+                    evicted += 1
+                if not windows:
+                    sources.pop(source, None)
+                if not sources:
+                    del self._devices[mac]
+                    self._product_types.pop(mac, None)
+        return evicted
+
+    def get(self, mac_address: str) -> Optional[Dict[str, Any]]:
+        """{"product_type": ..., source: {attribute: window}} or None for an unknown MAC."""
+
+        with self._lock:
+            sources = self._devices.get(mac_address)
+            if sources is None:
+                return None
+            device: Dict[str, Any] = {source: dict(windows) for source, windows in sources.items()}
+            device["product_type"] = self._product_types.get(mac_address)
+            return device
+
+    def mark_refreshed(self, at: float) -> None:
+        self.refreshed_at = at
+
+    def age(self) -> Optional[float]:
+        """Seconds since the start of the last complete refresh."""
+        if self.refreshed_at is None:
+            return None
+        return time.time() - self.refreshed_at
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "devices": len(self._devices),
+                "windows": sum(len(w) for sources in self._devices.values() for w in sources.values()),
+            }
+
+
+@lru_cache(maxsize=1)
+def get_latest_index() -> Optional[LatestIndex]:
+    if not get_settings().latest_index_enabled:
+        return None
+    return LatestIndex()
@@ -0,0 +1,131 @@
+import hashlib
+import logging
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Any, Iterable, Optional
+from config.settings import get_settings
+from services import metrics
+from services.db.connector import run_blocking
+from .backends import CacheBackend, MemoryBackend, SqliteBackend
+
+logger = logging.getLogger(__name__)
+
+# aggregation level -> (bucket width in seconds, TTL in seconds). Rollup rows are
+# aligned to their bucket, so widening from/to to the enclosing bucket boundaries
+# selects exactly the same rows and lets nearby windows share an entry.
+LEVEL_POLICY = {
+    "1 Minute": (60, 30),
+    "5 Minutes": (300, 120),
+    "15 Minutes": (900, 300),
+    "1 Hour": (3600, 900),
+    "6 Hours": (21600, 3600),
+    "1 Day": (86400, 10800),
+    "1 Week": (None, 21600),
+}
+
+# Usage and mode tables hold variable-length windows.
+DYNAMIC_TTL = 60
+
+
+def _epoch(value: datetime) -> int:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp())
+
+
+def normalize_window(from_: datetime, to: datetime, level: Optional[str]):
+    bucket, _ = LEVEL_POLICY.get(level, (None, DYNAMIC_TTL))
+    start, end = _epoch(from_), _epoch(to)
+
+    if bucket:
+        start -= start % bucket
+        end += -end % bucket
+
+    return start, end
+
+
+def bucket_seconds(level: Optional[str]) -> Optional[int]:
+    return LEVEL_POLICY.get(level, (None, DYNAMIC_TTL))[0]
+
+
+def ttl_for(level: Optional[str]) -> float:
+    return LEVEL_POLICY.get(level, (None, DYNAMIC_TTL))[1]
+
+
+class ResultCache:
+
+    def __init__(self, backend: CacheBackend):
+        self.backend = backend
+
+    def make_key(
+        self,
+        table_path: str,
+        mac_addresses: Iterable[str],
+        product_type: str,
+        attributes: Optional[Iterable[str]],
+        from_: datetime,
+        to: datetime,
+        level: Optional[str],
+        variant: str = "",
+    ) -> str:
+        start, end = normalize_window(from_, to, level)
+        raw = "|".join((
+            variant,
+            table_path,
+            ",".join(sorted(mac_addresses)),
+            product_type,
+            ",".join(sorted(set(attributes or ()))),
+            str(start),
+            str(end),
+        ))
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            logger.warning("Result cache read failed: %s", e)
+            value = None
+
+        metrics.CACHE_LOOKUPS.inc(cache="result", result="miss" if value is None else "hit")
+        return value
+
+    def set(self, key: str, value: Any, level: Optional[str], weight: int = 1) -> None:
+        try:
+            self.backend.set(key, value, ttl_for(level), weight)
+        except Exception as e:
+            logger.warning("Result cache write failed: %s", e)
+
+    async def aget(self, key: str) -> Optional[Any]:
+        """get() for async callers: on the DB executor when the backend does I/O."""
+        if self.backend.blocking:
+            return await run_blocking(self.get, key)
+        return self.get(key)
+
+    async def aset(self, key: str, value: Any, level: Optional[str], weight: int = 1) -> None:
+        if self.backend.blocking:
+            await run_blocking(self.set, key, value, level, weight)
+        else:
+            self.set(key, value, level, weight)
+
+
+@lru_cache(maxsize=1)
+def get_result_cache() -> Optional[ResultCache]:
+    settings = get_settings()
+
+    if not settings.result_cache_enabled:
+        return None
+
+    if settings.result_cache_backend == "sqlite":
+        backend = SqliteBackend(
+            settings.result_cache_path,
+            max_entries=settings.result_cache_max_entries,
+            max_weight=settings.result_cache_max_rows,
+        )
+    else:
+        backend = MemoryBackend(
+            max_entries=settings.result_cache_max_entries,
+            max_weight=settings.result_cache_max_rows,
+        )
+
+    return ResultCache(backend)
@@ -0,0 +1,43 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from functools import lru_cache
+from typing import Hashable, Optional, Tuple
+from config.settings import get_settings
+
+# Devices whose watermarks are held at once; the least recently read go first.
+MAX_ENTRIES = 10_000
+
+
+class WatermarkCache:
+    """Newest end_timestamp of a device in a table, reused for `ttl` seconds so validating
+    requests costs at most one short statement per device, table and interval."""
+
+    def __init__(self, ttl: float, max_entries: int = MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._values: "OrderedDict[Hashable, Tuple[float, Optional[datetime]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Tuple[bool, Optional[datetime]]:
+        """(found, watermark); a device with no rows has a watermark of None."""
+
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                return False, None
+            self._values.move_to_end(key)
+            return True, entry[1]
+
+    def set(self, key: Hashable, watermark: Optional[datetime]) -> None:
+        with self._lock:
+            self._values[key] = (time.monotonic(), watermark)
+            self._values.move_to_end(key)
+            while len(self._values) > self.max_entries:
+                self._values.popitem(last=False)
+
+
+@lru_cache(maxsize=1)
+def get_watermark_cache() -> WatermarkCache:
+    return WatermarkCache(get_settings().watermark_ttl_seconds)
@@ -0,0 +1,202 @@
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from config.settings import get_settings
+
+Interval = Tuple[float, float]
+Grouped = Dict[str, Dict[str, List[Dict[str, Any]]]]
+
+# Coverage recorded by a query that was not filtered on attributes.
+ALL_ATTRIBUTES = "*"
+
+
+def to_epoch(value: datetime) -> float:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def from_epoch(value: float) -> datetime:
+    return datetime.fromtimestamp(value, tz=timezone.utc)
+
+
+def _merge(intervals: List[Interval], new: Interval) -> List[Interval]:
+    start, end = new
+    merged = []
+
+    for a, b in intervals:
+        if b < start or a > end:
+            merged.append((a, b))
+        else:
+            start, end = min(a, start), max(b, end)
+
+    merged.append((start, end))
+    merged.sort()
+    return merged
+
+
+def _subtract(start: float, end: float, covered: Iterable[Interval]) -> List[Interval]:
+    gaps = []
+    cursor = start
+
+    for a, b in sorted(covered):
+        if b <= cursor:
+            continue
+        if a >= end:
+            break
+        if a > cursor:
+            gaps.append((cursor, a))
+        cursor = max(cursor, b)
+
+    if cursor < end:
+        gaps.append((cursor, end))
+
+    return gaps
+
+
+class _DeviceSegments:
+    """Fetched rows and covered [start, end) intervals of one (table, product_type, MAC)."""
+
+    __slots__ = ("coverage", "rows", "size")
+
+    def __init__(self):
+        self.coverage: Dict[str, List[Interval]] = {}
+        self.rows: Dict[str, Dict[float, Dict[str, Any]]] = {}
+        self.size = 0
+
+    def covered(self, attribute: str) -> List[Interval]:
+        return self.coverage.get(attribute, []) + self.coverage.get(ALL_ATTRIBUTES, [])
+
+
+class WindowCache:
+    """Remembers which time ranges of a rollup table were already read per device and
+    attribute, so a sliding window only queries the ranges it has not seen.
+
+    Only ranges that end before ``settled_until`` are recorded as covered: rows of
+    buckets that may still be rewritten are always fetched again.
+    """
+
+    def __init__(self, max_rows: int = 1_000_000, max_gaps: int = 4):
+        self._max_rows = max_rows
+        self._max_gaps = max_gaps
+        self._devices: "OrderedDict[Tuple[str, str, str], _DeviceSegments]" = OrderedDict()
+        self._rows = 0
+        self._lock = threading.Lock()
+
+    def gaps(
+        self,
+        table: Tuple[str, str],
+        mac_addresses: Iterable[str],
+        attributes: Optional[Iterable[str]],
+        start: float,
+        end: float,
+    ) -> List[Interval]:
+        """Ranges of [start, end) missing for at least one (MAC, attribute)."""
+
+        needed: List[Interval] = []
+
+        with self._lock:
+            for mac in mac_addresses:
+                device = self._devices.get((*table, mac))
+                for attribute in attributes or (ALL_ATTRIBUTES,):
+                    covered = device.covered(attribute) if device else []
+                    for gap in _subtract(start, end, covered):
+                        needed = _merge(needed, gap)
+
+        if len(needed) > self._max_gaps:
+            return [(needed[0][0], needed[-1][1])]
+
+        return needed
+
+    def fill(
+        self,
+        table: Tuple[str, str],
+        mac_addresses: List[str],
+        attributes: Optional[List[str]],
+        start: float,
+        end: float,
+        fetched: List[Tuple[Interval, Grouped]],
+        settled_until: float,
+    ) -> Optional[Grouped]:
+        """Store freshly fetched gaps and return the stitched {mac: {attribute: rows}}
+        for [start, end), or None if cached segments were evicted in the meantime."""
+
+        attribute_keys = attributes or [ALL_ATTRIBUTES]
+        fetched_ranges = [gap for gap, _ in fetched]
+
+        with self._lock:
+            for (gap_start, gap_end), grouped in fetched:
+                for mac in mac_addresses:
+                    device = self._device(table, mac)
+
+                    for attribute, rows in grouped.get(mac, {}).items():
+                        stored = device.rows.setdefault(attribute, {})
+                        for row in rows:
+                            row_start = to_epoch(row["start_timestamp"])
+                            if row_start not in stored:
+                                device.size += 1
+                                self._rows += 1
+                            stored[row_start] = row
+
+                    settled_end = min(gap_end, settled_until)
+                    if settled_end > gap_start:
+                        for attribute in attribute_keys:
+                            device.coverage[attribute] = _merge(
+                                device.coverage.get(attribute, []), (gap_start, settled_end)
+                            )
+
+            result: Grouped = {}
+
+            for mac in mac_addresses:
+                device = self._devices.get((*table, mac))
+
+                for attribute in attribute_keys:
+                    covered = (device.covered(attribute) if device else []) + fetched_ranges
+                    if _subtract(start, end, covered):
+                        return None
+
+                if device is None:
+                    continue
+
+                names = attributes if attributes else list(device.rows)
+                for attribute in names:
+                    rows = [
+                        row for row_start, row in sorted(device.rows.get(attribute, {}).items())
+                        if row_start < end and to_epoch(row["end_timestamp"]) > start
+                    ]
+                    if rows:
+                        result.setdefault(mac, {})[attribute] = rows
+
+            self._evict()
+
+        return result
+
+    def clear(self) -> None:
+        with self._lock:
+            self._devices.clear()
+            self._rows = 0
+
+    def _device(self, table: Tuple[str, str], mac: str) -> _DeviceSegments:
+        key = (*table, mac)
+        device = self._devices.get(key)
+        if device is None:
+            device = self._devices[key] = _DeviceSegments()
+        self._devices.move_to_end(key)
+        return device
+
+    def _evict(self) -> None:
+        while self._rows > self._max_rows and self._devices:
+            _, device = self._devices.popitem(last=False)
+            self._rows -= device.size
+
+
+@lru_cache(maxsize=1)
+def get_window_cache() -> Optional[WindowCache]:
+    settings = get_settings()
+
+    if not settings.window_cache_enabled:
+        return None
+
+    return WindowCache(max_rows=settings.window_cache_max_rows)
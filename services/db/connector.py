@@ -1,17 +1,48 @@
-from functools import lru_cache
-from typing import Dict, List, Optional, Union, Any, Sequence
+import asyncio
+import contextvars
+import re
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+from typing import AsyncIterator, Dict, List, Optional, Tuple, Union, Any, Sequence
 import pandas as pd
 from databricks import sql
+from databricks.sql import exc as sql_exc
 from databricks.sdk.core import Config
+from config.settings import get_settings
+from errors.exceptions import BaseAppException, ConfigurationError, DeadlineExceededError, ServiceUnavailableError
+from services import metrics
+from .pool import ConnectionPool
+from .resilience import NO_RETRY, CircuitBreaker, RetryPolicy, current_deadline
+import threading
 import time
 import logging
 
 logger = logging.getLogger(__name__)
 
-cfg = Config()
 
-QUERY_TIMEOUT_SECONDS = 60
+@lru_cache(maxsize=1)
+def get_config() -> Config:
+    # Resolved on first connect rather than at import, so that modules importing the
+    # connector (benchmarks, tooling) do not need Databricks credentials.
+    return Config()
+
+# Connector errors a later attempt can get past: a dropped session or cursor, or a
+# network/HTTP failure the connector already gave up retrying on its own.
+TRANSIENT_ERRORS = (
+    sql_exc.SessionAlreadyClosedError,
+    sql_exc.CursorAlreadyClosedError,
+    sql_exc.MaxRetryDurationError,
+    sql_exc.InvalidServerResponseError,
+    ConnectionError,
+)
+
+# Connector errors that must not be replayed, whatever their message says.
+PERMANENT_ERRORS = (
+    sql_exc.NonRecoverableNetworkError,
+    sql_exc.UnsafeToRetryError,
+)
 
+# Warehouse states reported only in the message of a generic server error.
 MARKERS = {
     "INVALID_STATE",
     "Invalid SessionHandle",
@@ -23,9 +54,42 @@ MARKERS = {
     "SERVICE_UNAVAILABLE",
 }
 
-@lru_cache(maxsize=1)
-def get_connection(warehouse_id: str):
+# Blocking databricks-sql calls are pushed onto this bounded pool so that the
+# event loop never waits on the warehouse.
+_executor = ThreadPoolExecutor(
+    max_workers=get_settings().db_executor_workers,
+    thread_name_prefix="dbsql",
+)
+
+# Server-side cancels are sent from their own threads: the executor may be saturated
+# by the very statements being cancelled.
+_cancel_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="dbsql-cancel")
+
+_pools: Dict[str, ConnectionPool] = {}
+_breakers: Dict[str, CircuitBreaker] = {}
+
+# Executions shared by identical concurrent aquery() calls, keyed by event loop,
+# warehouse, statement, parameters and result shape.
+_in_flight: Dict[Tuple[Any, ...], "_Flight"] = {}
+_pools_lock = threading.Lock()
+
+
+def _connect(warehouse_id: str):
+    """Open a DBAPI connection on the configured backend. Connections need only what the
+    pool and _execute use: cursor() (a context manager with execute, fetchall, fetchmany,
+    fetchall_arrow, description, cancel and close), close() and `open`."""
 
+    backend = get_settings().warehouse_backend
+    if backend == "fake":
+        from . import fake
+        return fake.connect(warehouse_id)
+    if backend != "databricks":
+        raise ConfigurationError(
+            message=f"Unknown warehouse backend: {backend}",
+            details={"setting": "warehouse_backend", "supported": ["databricks", "fake"]},
+        )
+
+    cfg = get_config()
     http_path = f"/sql/1.0/warehouses/{warehouse_id}"
     return sql.connect(
         server_hostname=cfg.host,
@@ -34,70 +98,525 @@ def get_connection(warehouse_id: str):
     )
 
 
+def get_pool(warehouse_id: str) -> ConnectionPool:
+    pool = _pools.get(warehouse_id)
+    if pool is not None:
+        return pool
+
+    with _pools_lock:
+        pool = _pools.get(warehouse_id)
+        if pool is None:
+            settings = get_settings()
+            pool = ConnectionPool(
+                partial(_connect, warehouse_id),
+                pool_size=settings.db_pool_size,
+                max_overflow=settings.db_max_overflow,
+                timeout=settings.db_pool_timeout,
+                recycle=settings.db_pool_recycle_interval,
+                pre_ping_after=settings.db_pool_pre_ping_interval,
+                is_disconnect=is_transient_session_error,
+            )
+            _pools[warehouse_id] = pool
+        return pool
+
+
+def get_breaker(warehouse_id: str) -> CircuitBreaker:
+    breaker = _breakers.get(warehouse_id)
+    if breaker is not None:
+        return breaker
+
+    with _pools_lock:
+        breaker = _breakers.get(warehouse_id)
+        if breaker is None:
+            settings = get_settings()
+            breaker = CircuitBreaker(
+                threshold=settings.db_breaker_threshold,
+                cooldown=settings.db_breaker_cooldown_seconds,
+            )
+            _breakers[warehouse_id] = breaker
+        return breaker
+
+
+@lru_cache(maxsize=1)
+def default_retry_policy() -> RetryPolicy:
+    settings = get_settings()
+    return RetryPolicy(settings.db_retry_backoff_initial, settings.db_retry_backoff_max)
+
+
+def _pool_metrics() -> List[str]:
+    """Pool sizes and circuit state per warehouse, read at scrape time."""
+
+    statuses = {warehouse_id: pool.status() for warehouse_id, pool in list(_pools.items())}
+    lines = []
+    for name in ("open", "idle", "checked_out", "capacity"):
+        metric = f"cx_dva_db_pool_{name}"
+        lines += [f"# HELP {metric} Pooled warehouse connections: {name}", f"# TYPE {metric} gauge"]
+        for warehouse_id, status in statuses.items():
+            lines.append(f'{metric}{{warehouse="{warehouse_id}"}} {status[name]}')
+
+    lines += [
+        "# HELP cx_dva_db_circuit_open Whether statements to the warehouse currently fail fast",
+        "# TYPE cx_dva_db_circuit_open gauge",
+    ]
+    for warehouse_id, breaker in list(_breakers.items()):
+        lines.append(f'cx_dva_db_circuit_open{{warehouse="{warehouse_id}"}} {int(breaker.state == CircuitBreaker.OPEN)}')
+    return lines
+
+
+metrics.registry.collector(_pool_metrics)
+
+
 def close_connections():
-    get_connection.cache_clear()
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+
+    for pool in pools:
+        pool.dispose()
+
+
+async def run_blocking(fn, *args: Any) -> Any:
+    """Run a blocking call on the DB executor."""
+
+    return await asyncio.get_running_loop().run_in_executor(
+        _executor, contextvars.copy_context().run, partial(fn, *args)
+    )
+
+
+def shutdown_executor():
+    _executor.shutdown(wait=False, cancel_futures=True)
+    _cancel_executor.shutdown(wait=False, cancel_futures=True)
 
 def is_transient_session_error(e: Exception) -> bool:
+    if isinstance(e, PERMANENT_ERRORS):
+        return False
+    if isinstance(e, TRANSIENT_ERRORS):
+        return True
     msg = str(e)
     return any(m in msg for m in MARKERS)
 
 
+class _Statement:
+    """The cursor of one execution, so that another thread can cancel it on the warehouse."""
+
+    __slots__ = ("cursor", "cancelled", "_lock")
+
+    def __init__(self):
+        self.cursor = None
+        self.cancelled = False
+        self._lock = threading.Lock()
+
+    def attach(self, cursor) -> None:
+        with self._lock:
+            if self.cancelled:
+                raise InterruptedError("Statement cancelled before it was sent")
+            self.cursor = cursor
+
+    def cancel(self) -> None:
+        with self._lock:
+            self.cancelled = True
+            cursor = self.cursor
+
+        if cursor is not None:
+            try:
+                cursor.cancel()
+            except Exception as e:
+                logger.warning("Cancelling a warehouse statement failed: %s", e)
+
+
+def _cancel(statement: _Statement, warehouse_id: str, reason: str) -> None:
+    metrics.CANCELLED_STATEMENTS.inc(warehouse=warehouse_id, reason=reason)
+    try:
+        _cancel_executor.submit(statement.cancel)
+    except RuntimeError:
+        # Shutting down; nothing is left to cancel it from.
+        pass
+
+
+_FROM_TABLE = re.compile(r"\bFROM\s+([\w.`]+)", re.IGNORECASE)
+
+
+@lru_cache(maxsize=1024)
+def _tables_of(sql_query: str) -> str:
+    """Metric label naming the tables a statement reads, without catalog and schema."""
+
+    return "+".join(match.rsplit(".", 1)[-1].strip("`") for match in _FROM_TABLE.findall(sql_query))
+
+
+def _execute(
+    sql_query: str, warehouse_id: str, params: Optional[Sequence[Any]], as_dict: bool, as_arrow: bool = False,
+    statement: Optional[_Statement] = None,
+) -> Union[List[Dict], pd.DataFrame, "pyarrow.Table"]:
+
+    table = _tables_of(sql_query)
+    checkout_started = time.monotonic()
+
+    with get_pool(warehouse_id).connection() as conn, conn.cursor() as cursor:
+        metrics.record("checkout", time.monotonic() - checkout_started, table)
+        if statement is not None:
+            statement.attach(cursor)
+
+        with metrics.stage("execute", table):
+            if params is None:
+                cursor.execute(sql_query)
+            else:
+                cursor.execute(sql_query, params)
+
+        with metrics.stage("fetch", table):
+            if as_arrow:
+                return cursor.fetchall_arrow()
+
+            result = cursor.fetchall()
+            columns = [col[0] for col in cursor.description]
+
+            if as_dict:
+                return [dict(zip(columns, row)) for row in result]
+
+            else:
+                return pd.DataFrame(result, columns=columns)
+
+
+def _deadline_for(timeout: Optional[float]) -> float:
+    """When a call must be done: its own timeout, or query_timeout_seconds, bounded by the
+    deadline of the request it runs for."""
+
+    own = time.monotonic() + (timeout if timeout is not None else get_settings().query_timeout_seconds)
+    ambient = current_deadline()
+    return own if ambient is None else min(own, ambient)
+
+
+def _deadline_exceeded(warehouse_id: str, cause: Optional[Exception] = None) -> DeadlineExceededError:
+    details = {"warehouse_id": warehouse_id}
+    if cause is not None:
+        details["last_error"] = str(cause)
+    return DeadlineExceededError(message="Query deadline exceeded", details=details)
+
+
+def _admission_wait(breaker: CircuitBreaker, warehouse_id: str, until: float, retry: RetryPolicy) -> float:
+    """0 when a statement may run now, else how long to wait for the circuit to half-open.
+    Raises instead when the caller fails fast or cannot wait that long."""
+
+    if breaker.admit():
+        return 0.0
+
+    retry_after = breaker.retry_after()
+    if retry.wait_when_open and time.monotonic() + retry_after < until:
+        return max(retry_after, 0.05)
+
+    metrics.BREAKER_REJECTIONS.inc(warehouse=warehouse_id)
+    raise ServiceUnavailableError(
+        message="The SQL warehouse is unavailable",
+        details={"warehouse_id": warehouse_id, "retry_after": round(retry_after, 1)},
+    )
+
+
+def _settle(breaker: CircuitBreaker, e: Optional[Exception]) -> None:
+    """Report an attempt's outcome to the circuit. Errors of our own making (pool
+    timeouts) say nothing about the warehouse and are not counted either way."""
+
+    if e is None:
+        breaker.success()
+    elif is_transient_session_error(e) or isinstance(e, DeadlineExceededError):
+        breaker.failure()
+    elif not isinstance(e, BaseAppException):
+        breaker.success()
+
+
+def _retry_delay(e: Exception, attempt: int, until: float, retry: RetryPolicy) -> Optional[float]:
+    """Seconds to back off before the next attempt, or None to give up."""
+
+    if not is_transient_session_error(e) or not retry.allows(attempt):
+        return None
+
+    delay = retry.delay(attempt)
+    if time.monotonic() + delay >= until:
+        logger.error("Deadline reached waiting for the warehouse to be ready. Last error: %s", e)
+        return None
+
+    return delay
+
+
 def query(
-    sql_query: str, warehouse_id: str, params: Optional[Sequence[Any]] = None, *, as_dict: bool = True, wait_until_ready: bool = True, max_wait_seconds: float = 300.0, backoff_initial: float = 0.8, backoff_max: float = 5.0,
-) -> Union[List[Dict], pd.DataFrame]:
+    sql_query: str, warehouse_id: str, params: Optional[Sequence[Any]] = None, *, as_dict: bool = True, as_arrow: bool = False, retry: Optional[RetryPolicy] = None, timeout: Optional[float] = None,
+) -> Union[List[Dict], pd.DataFrame, "pyarrow.Table"]:
+    """Run a statement, retrying transient errors per `retry` until the deadline.
+
+    The statement is cancelled on the warehouse if it is still running at the deadline.
+    """
 
-    start = time.monotonic()
+    retry = retry or default_retry_policy()
+    breaker = get_breaker(warehouse_id)
+    until = _deadline_for(timeout)
     attempt = 0
 
     while True:
-        attempt +=1
+        attempt += 1
 
-        if time.monotonic() - start > QUERY_TIMEOUT_SECONDS:
-            raise TimeoutError("Query execution exceeded timeout limit")
+        wait = _admission_wait(breaker, warehouse_id, until, retry)
+        if wait:
+            time.sleep(wait)
+            continue
+
+        remaining = until - time.monotonic()
+        if remaining <= 0:
+            raise _deadline_exceeded(warehouse_id)
+
+        statement = _Statement()
+        timer = threading.Timer(remaining, statement.cancel)
+        timer.daemon = True
+        timer.start()
 
         try:
+            result = _execute(sql_query, warehouse_id, params, as_dict, as_arrow, statement)
+
+        except Exception as e:
+            if statement.cancelled:
+                metrics.CANCELLED_STATEMENTS.inc(warehouse=warehouse_id, reason="deadline")
+                e = _deadline_exceeded(warehouse_id, e)
+            _settle(breaker, e)
+
+            delay = _retry_delay(e, attempt, until, retry)
+            if delay is None:
+                if isinstance(e, DeadlineExceededError):
+                    raise e
+                raise
+
+            metrics.QUERY_RETRIES.inc(warehouse=warehouse_id)
+            time.sleep(delay)
+            continue
+
+        finally:
+            timer.cancel()
+
+        _settle(breaker, None)
+        return result
+
+
+class _Flight:
+    """One in-flight execution and the number of callers still waiting for it."""
+
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: "asyncio.Task"):
+        self.task = task
+        self.waiters = 0
+
+
+async def aquery(
+    sql_query: str, warehouse_id: str, params: Optional[Sequence[Any]] = None, *, as_dict: bool = True, as_arrow: bool = False, retry: Optional[RetryPolicy] = None, timeout: Optional[float] = None,
+) -> Union[List[Dict], pd.DataFrame, "pyarrow.Table"]:
+    """Async counterpart of query(): runs on the DB executor and backs off with asyncio.sleep.
+
+    as_arrow=True returns the result as a pyarrow.Table (fetchall_arrow) instead of rows.
+    Identical concurrent calls share one execution and receive the same result object,
+    which callers must treat as read-only. A shared execution runs under the deadline of
+    the caller that started it. Cancelling the last waiting caller cancels the statement
+    on the warehouse.
+    """
+
+    run = partial(
+        _aquery, sql_query, warehouse_id, params, as_dict=as_dict, as_arrow=as_arrow,
+        retry=retry or default_retry_policy(), timeout=timeout,
+    )
+
+    if not get_settings().single_flight:
+        return await run()
+
+    key = (
+        id(asyncio.get_running_loop()), warehouse_id, sql_query,
+        None if params is None else tuple(params), as_dict, as_arrow,
+    )
+    try:
+        hash(key)
+    except TypeError:
+        return await run()
+
+    flight = _in_flight.get(key)
+    if flight is None:
+        flight = _in_flight[key] = _Flight(asyncio.ensure_future(run()))
+        flight.task.add_done_callback(partial(_land, key))
+    else:
+        metrics.COALESCED_QUERIES.inc(warehouse=warehouse_id)
+
+    flight.waiters += 1
+    try:
+        return await asyncio.shield(flight.task)
+    except asyncio.CancelledError:
+        # The last caller to give up cancels the execution itself.
+        if flight.waiters == 1 and not flight.task.done():
+            flight.task.cancel()
+        raise
+    finally:
+        flight.waiters -= 1
+
 
-            conn = get_connection(warehouse_id)
+def _land(key: Tuple[Any, ...], task: "asyncio.Task") -> None:
 
-            with conn.cursor() as cursor:
+    flight = _in_flight.get(key)
+    if flight is not None and flight.task is task:
+        del _in_flight[key]
 
-                if params is None:
-                    cursor.execute(sql_query)
-                else:
-                    cursor.execute(sql_query, params)
+    # Retrieve the error so an execution nobody waits for anymore is not reported as unhandled.
+    if not task.cancelled():
+        task.exception()
 
-                result = cursor.fetchall()
-                columns = [col[0] for col in cursor.description]
 
-                if as_dict:
-                    return [dict(zip(columns, row)) for row in result]
-            
-                else:
-                    return pd.DataFrame(result, columns=columns)
+async def _aquery(
+    sql_query: str, warehouse_id: str, params: Optional[Sequence[Any]], *, as_dict: bool, as_arrow: bool, retry: RetryPolicy, timeout: Optional[float],
+) -> Union[List[Dict], pd.DataFrame, "pyarrow.Table"]:
+
+    loop = asyncio.get_running_loop()
+    breaker = get_breaker(warehouse_id)
+    until = _deadline_for(timeout)
+    attempt = 0
+
+    while True:
+        attempt += 1
+
+        wait = _admission_wait(breaker, warehouse_id, until, retry)
+        if wait:
+            await asyncio.sleep(wait)
+            continue
+
+        remaining = until - time.monotonic()
+        if remaining <= 0:
+            raise _deadline_exceeded(warehouse_id)
+
+        statement = _Statement()
+        execution = loop.run_in_executor(
+            _executor, contextvars.copy_context().run,
+            partial(_execute, sql_query, warehouse_id, params, as_dict, as_arrow, statement)
+        )
+
+        try:
+            result = await asyncio.wait_for(execution, remaining)
+
+        except asyncio.TimeoutError:
+            _cancel(statement, warehouse_id, "deadline")
+            e = _deadline_exceeded(warehouse_id)
+            _settle(breaker, e)
+            raise e
+
+        except asyncio.CancelledError:
+            # The client went away or a sibling fetch failed: stop the warehouse work too.
+            _cancel(statement, warehouse_id, "cancelled")
+            raise
 
         except Exception as e:
-            if not wait_until_ready or not is_transient_session_error(e):
-                raise
-                
-            elapsed = time.monotonic() - start
-            if elapsed >= max_wait_seconds:
-                logger.error(
-                    "Timeour expired (%.1fs) waiting for the warehouse to be ready. Last error: %s",
-                    elapsed, e
-                )
+            _settle(breaker, e)
+
+            delay = _retry_delay(e, attempt, until, retry)
+            if delay is None:
                 raise
 
-            
+            metrics.QUERY_RETRIES.inc(warehouse=warehouse_id)
+            await asyncio.sleep(delay)
+            continue
+
+        _settle(breaker, None)
+        return result
+
+
+def _open_cursor(conn, sql_query: str, params: Optional[Sequence[Any]], statement: _Statement):
+
+    cursor = conn.cursor()
+    try:
+        statement.attach(cursor)
+        if params is None:
+            cursor.execute(sql_query)
+        else:
+            cursor.execute(sql_query, params)
+    except Exception:
+        cursor.close()
+        raise
+
+    return cursor
+
+
+async def astream(
+    sql_query: str, warehouse_id: str, params: Optional[Sequence[Any]] = None, *, chunk_size: int = 5000,
+) -> AsyncIterator[List[Dict]]:
+    """Yield the result in lists of at most chunk_size row dicts.
+
+    One pooled connection is held until the iteration finishes. Nothing is retried:
+    once rows have been handed out a transient error cannot be replayed transparently.
+    An open circuit fails the stream before it starts, and the checkout, opening the
+    cursor and every fetch are bounded by the request's deadline (or query_timeout_seconds).
+    """
+
+    loop = asyncio.get_running_loop()
+    breaker = get_breaker(warehouse_id)
+    until = _deadline_for(None)
+    _admission_wait(breaker, warehouse_id, until, NO_RETRY)
+
+    pool = get_pool(warehouse_id)
+    statement = _Statement()
+    conn = None
+    cursor = None
+
+    def late(release, future) -> None:
+        if not future.cancelled() and future.exception() is None:
+            _executor.submit(release, future.result())
+
+    async def bounded(fn, *args, release=None):
+        """Run fn on the executor until the deadline. `release` gets a result that only
+        arrives after the wait was given up."""
+
+        remaining = until - time.monotonic()
+        if remaining <= 0:
+            _cancel(statement, warehouse_id, "deadline")
+            raise _deadline_exceeded(warehouse_id)
+        future = loop.run_in_executor(_executor, partial(fn, *args))
+        abandoned = True
+        try:
+            result = await asyncio.wait_for(asyncio.shield(future) if release else future, remaining)
+            abandoned = False
+            return result
+        except asyncio.TimeoutError:
+            _cancel(statement, warehouse_id, "deadline")
+            raise _deadline_exceeded(warehouse_id)
+        finally:
+            if release and abandoned:
+                future.add_done_callback(partial(late, release))
+
+    try:
+        conn = await bounded(pool.checkout, release=pool.checkin)
+        cursor = await bounded(_open_cursor, conn, sql_query, params, statement)
+        _settle(breaker, None)
+        columns = [col[0] for col in cursor.description]
+
+        while True:
+            rows = await bounded(cursor.fetchmany, chunk_size)
+            if not rows:
+                break
+            yield [dict(zip(columns, row)) for row in rows]
+
+    except BaseException as e:
+        # A stream cancelled or timed out mid-fetch may still have that fetch running on
+        # this connection, so it is never handed back out.
+        cancelled = isinstance(e, asyncio.CancelledError)
+        if conn is not None and (
+            cancelled or isinstance(e, DeadlineExceededError) or (isinstance(e, Exception) and is_transient_session_error(e))
+        ):
+            pool.invalidate(conn)
+        if cancelled:
+            _cancel(statement, warehouse_id, "cancelled")
+        elif isinstance(e, Exception):
+            _settle(breaker, e)
+        raise
+
+    finally:
+        def _release():
+            try:
+                if cursor is not None:
+                    cursor.close()
+            except Exception:
+                pass
+            finally:
+                pool.checkin(conn)
+
+        if conn is not None:
             try:
-                try:
-                    conn.close()
-                except Exception:
-                    pass
-                close_connections()
-                conn = get_connection(warehouse_id)
-            except Exception as rexc:
-                logger.error("Failed recreating the connection: %s", rexc)
-
-            sleep_s = min(backoff_initial * (2 ** (attempt - 1)), backoff_max)
-            time.sleep(sleep_s)
-            continue
\ No newline at end of file
+                _executor.submit(_release)
+            except RuntimeError:
+                _release()
@@ -0,0 +1,286 @@
+"""Local stand-in for the SQL warehouse, selected with WAREHOUSE_BACKEND=fake.
+
+A sqlite file is seeded with synthetic rows for every configured rcs_da_* rollup table,
+the usage table and the mode table, ending at the time the process first connects.
+Connections and cursors implement the subset of the databricks-sql API the connector
+and pool use, so everything above them (pool, retries, caches, routes) runs unchanged.
+"""
+import math
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+from databricks.sql import exc as sql_exc
+from config.attributes import DEFAULT_ATTRIBUTES
+from config.settings import get_settings
+
+# Sources each product type reads, as in the history routes.
+PRODUCT_TYPES = {
+    "heatpumpWaterHeaterGen5": ("agg", "usage"),
+    "econetControlCenter": ("agg", "mode"),
+    "econetZoneController": ("mode",),
+}
+
+# (table env var, row length in seconds, seconds of history seeded).
+ROLLUP_TABLES = (
+    ("DATABRICKS_TABLE_1MIN", 60, 2 * 86400),
+    ("DATABRICKS_TABLE_5MIN", 300, 10 * 86400),
+    ("DATABRICKS_TABLE_15MIN", 900, 30 * 86400),
+    ("DATABRICKS_TABLE_1HOUR", 3600, 60 * 86400),
+    ("DATABRICKS_TABLE_6HOUR", 21600, 365 * 86400),
+    ("DATABRICKS_TABLE_1DAY", 86400, 730 * 86400),
+    ("DATABRICKS_TABLE_1WEEK", 604800, 730 * 86400),
+)
+USAGE_SPAN = (3600, 60 * 86400)
+MODE_SPAN = (7200, 60 * 86400)
+
+AGG_ATTRIBUTES = DEFAULT_ATTRIBUTES["agg"][:4]
+USAGE_ATTRIBUTES = DEFAULT_ATTRIBUTES["usage"][:2]
+MODE_ATTRIBUTES = DEFAULT_ATTRIBUTES["mode"]
+
+# Declared type of timestamp columns; a private name so no global sqlite converter is replaced.
+TIMESTAMP = "FAKE_TIMESTAMP"
+
+sqlite3.register_converter(TIMESTAMP, lambda b: datetime.fromisoformat(b.decode()))
+
+_seed_lock = threading.Lock()
+_seeded = False
+
+
+def devices(count: Optional[int] = None) -> Dict[str, List[str]]:
+    """MAC addresses of the synthetic devices, per product type."""
+
+    count = count or get_settings().fake_warehouse_devices
+    return {
+        product_type: [f"02:00:00:00:{p:02X}:{i:02X}" for i in range(count)]
+        for p, product_type in enumerate(PRODUCT_TYPES)
+    }
+
+
+def _ts(epoch: float) -> str:
+    return datetime.fromtimestamp(epoch, tz=timezone.utc).isoformat(sep=" ")
+
+
+def _param(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.astimezone(timezone.utc).isoformat(sep=" ")
+    return value
+
+
+def _windows(step: int, span: int, now: float) -> Iterator[Tuple[int, float, float]]:
+    last_end = now - now % step
+    count = span // step
+    for i in range(count):
+        start = last_end - (count - i) * step
+        yield i, start, start + step
+
+
+def _devices_reading(source: str, count: int) -> Iterator[Tuple[str, str]]:
+    for product_type, macs in devices(count).items():
+        if source in PRODUCT_TYPES[product_type]:
+            for mac in macs:
+                yield product_type, mac
+
+
+def _rollup_rows(step: int, span: int, now: float, count: int) -> Iterator[Tuple[Any, ...]]:
+    for product_type, mac in _devices_reading("agg", count):
+        for a, attribute in enumerate(AGG_ATTRIBUTES):
+            phase = int(mac[-2:], 16) / 7 + a
+            for i, start, end in _windows(step, span, now):
+                median = 50.0 + 10.0 * math.sin(start / 86400 * 2 * math.pi + phase)
+                yield (mac, attribute, product_type, _ts(start), _ts(end), median - 2.5, median + 2.5, median)
+
+
+def _usage_rows(now: float, count: int) -> Iterator[Tuple[Any, ...]]:
+    step, span = USAGE_SPAN
+    for product_type, mac in _devices_reading("usage", count):
+        for attribute in USAGE_ATTRIBUTES:
+            for i, start, end in _windows(step, span, now):
+                consumption = 0.2 + (i % 24) / 24
+                yield (mac, attribute, product_type, _ts(start), _ts(end), 0.0, consumption * 2, consumption)
+
+
+def _mode_rows(now: float, count: int) -> Iterator[Tuple[Any, ...]]:
+    step, span = MODE_SPAN
+    for product_type, mac in _devices_reading("mode", count):
+        for m, attribute in enumerate(MODE_ATTRIBUTES):
+            for i, start, end in _windows(step, span, now):
+                yield (
+                    mac, attribute, product_type, (i + m) % 4, _ts(start), _ts(end), step,
+                    64.0, 70.0, 67.0, 72.0, 78.0, 75.0, 66.0, 74.0, 70.0,
+                )
+
+
+def seed(path: str, count: int, now: Optional[float] = None) -> None:
+    """Write a fresh fake warehouse to `path` with `count` devices per product type."""
+
+    now = now if now is not None else time.time()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    building = f"{path}.{os.getpid()}.tmp"
+    if os.path.exists(building):
+        os.remove(building)
+
+    conn = sqlite3.connect(building)
+    try:
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute("PRAGMA synchronous=OFF")
+
+        tables = [
+            (os.getenv(env), "median_val", _rollup_rows(step, span, now, count)) for env, step, span in ROLLUP_TABLES
+        ]
+        tables.append((os.getenv("DATABRICKS_TABLE_USAGE"), "consumption", _usage_rows(now, count)))
+        for table, last, rows in tables:
+            if not table:
+                continue
+            conn.execute(
+                f"CREATE TABLE {table} (mac_address TEXT, attribute TEXT, product_type TEXT, "
+                f"start_timestamp {TIMESTAMP}, end_timestamp {TIMESTAMP}, min_val REAL, max_val REAL, {last} REAL)"
+            )
+            conn.executemany(f"INSERT INTO {table} VALUES (?,?,?,?,?,?,?,?)", rows)
+            conn.execute(f"CREATE INDEX {table}_lookup ON {table} (mac_address, product_type, attribute, start_timestamp)")
+
+        mode_table = os.getenv("DATABRICKS_TABLE_MODE")
+        if mode_table:
+            conn.execute(
+                f"CREATE TABLE {mode_table} (mac_address TEXT, mode_attr TEXT, product_type TEXT, mode_value INTEGER, "
+                f"start_timestamp {TIMESTAMP}, end_timestamp {TIMESTAMP}, window_duration_S INTEGER, "
+                "HEATSETP_min REAL, HEATSETP_max REAL, HEATSETP_median REAL, "
+                "COOLSETP_min REAL, COOLSETP_max REAL, COOLSETP_median REAL, "
+                "SPT_min REAL, SPT_max REAL, SPT_median REAL)"
+            )
+            conn.executemany(f"INSERT INTO {mode_table} VALUES ({','.join(['?'] * 16)})", _mode_rows(now, count))
+            conn.execute(f"CREATE INDEX {mode_table}_lookup ON {mode_table} (mac_address, product_type, mode_attr, start_timestamp)")
+
+        conn.commit()
+    finally:
+        conn.close()
+
+    # Atomic, so connections another process still holds keep reading the old file.
+    os.replace(building, path)
+
+
+def _ensure_seeded() -> str:
+    global _seeded
+
+    settings = get_settings()
+    with _seed_lock:
+        if not _seeded:
+            seed(settings.fake_warehouse_path, settings.fake_warehouse_devices)
+            _seeded = True
+    return settings.fake_warehouse_path
+
+
+# MIN/MAX of a timestamp column lose its declared type in sqlite; the alias gets it back.
+_TIMESTAMP_AGGREGATE = re.compile(r"\b(MIN|MAX)\((\w*timestamp)\) AS (\w+)", re.IGNORECASE)
+
+
+@lru_cache(maxsize=1024)
+def _translate(sql_query: str) -> str:
+    """Drop the catalog.schema prefix, as sqlite has no three-part names, and type
+    timestamp aggregates."""
+
+    prefix = f"{os.getenv('DATABRICKS_CATALOG')}.{os.getenv('DATABRICKS_SCHEMA')}."
+    sql_query = sql_query.replace(prefix, "")
+    return _TIMESTAMP_AGGREGATE.sub(rf'\1(\2) AS "\3 [{TIMESTAMP}]"', sql_query)
+
+
+class FakeCursor:
+
+    def __init__(self, conn: "FakeConnection"):
+        self._conn = conn
+        self._cursor = conn.raw.cursor()
+        self._cancelled = threading.Event()
+        self.description = None
+
+    def __enter__(self) -> "FakeCursor":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def execute(self, sql_query: str, params: Optional[Sequence[Any]] = None) -> None:
+        settings = get_settings()
+
+        if settings.fake_warehouse_latency_ms > 0:
+            delay = settings.fake_warehouse_latency_ms / 1000 * random.uniform(0.5, 1.5)
+            if self._cancelled.wait(delay):
+                raise sql_exc.ServerOperationError("Query was cancelled")
+
+        if random.random() < settings.fake_warehouse_failure_rate:
+            raise sql_exc.ServerOperationError("[SERVICE_UNAVAILABLE] Temporarily Unavailable")
+
+        try:
+            self._cursor.execute(_translate(sql_query), [_param(p) for p in params or ()])
+        except sqlite3.OperationalError as e:
+            if self._cancelled.is_set():
+                raise sql_exc.ServerOperationError("Query was cancelled") from e
+            raise
+        self.description = self._cursor.description
+
+    def fetchall(self) -> List[Tuple[Any, ...]]:
+        return self._cursor.fetchall()
+
+    def fetchmany(self, size: int) -> List[Tuple[Any, ...]]:
+        return self._cursor.fetchmany(size)
+
+    def fetchall_arrow(self):
+        import pyarrow as pa
+
+        columns = [col[0] for col in self.description]
+        rows = self._cursor.fetchall()
+        if not rows:
+            return pa.table({column: pa.array([], pa.string()) for column in columns})
+        return pa.table({column: [row[i] for row in rows] for i, column in enumerate(columns)})
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+        self._conn.raw.interrupt()
+
+    def close(self) -> None:
+        self._cursor.close()
+
+
+class _PercentileApprox:
+    """PERCENTILE_APPROX(value, p) as Databricks computes it: the smallest value with at
+    least a fraction p of the values at or below it."""
+
+    def __init__(self):
+        self.values: List[float] = []
+        self.percentage = 0.5
+
+    def step(self, value: Optional[float], percentage: float) -> None:
+        self.percentage = percentage
+        if value is not None:
+            self.values.append(value)
+
+    def finalize(self) -> Optional[float]:
+        if not self.values:
+            return None
+        self.values.sort()
+        return self.values[max(math.ceil(self.percentage * len(self.values)) - 1, 0)]
+
+
+class FakeConnection:
+
+    def __init__(self, path: str):
+        self.raw = sqlite3.connect(
+            path, detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES, check_same_thread=False
+        )
+        self.raw.create_aggregate("PERCENTILE_APPROX", 2, _PercentileApprox)
+        self.open = True
+
+    def cursor(self) -> FakeCursor:
+        return FakeCursor(self)
+
+    def close(self) -> None:
+        self.open = False
+        self.raw.close()
+
+
+def connect(warehouse_id: str) -> FakeConnection:
+    return FakeConnection(_ensure_seeded())
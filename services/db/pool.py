@@ -0,0 +1,197 @@
+import threading
+import time
+import logging
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, Iterator, Optional
+from errors.exceptions import DatabaseError
+
+logger = logging.getLogger(__name__)
+
+
+class PooledConnection:
+    """A raw DBAPI connection plus the bookkeeping the pool needs."""
+
+    __slots__ = ("raw", "created_at", "last_used", "invalidated")
+
+    def __init__(self, raw: Any):
+        now = time.monotonic()
+        self.raw = raw
+        self.created_at = now
+        self.last_used = now
+        self.invalidated = False
+
+    def cursor(self, *args, **kwargs):
+        return self.raw.cursor(*args, **kwargs)
+
+    def close(self) -> None:
+        try:
+            self.raw.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """Thread-safe LIFO connection pool with overflow, checkout timeout and recycling.
+
+    Up to ``pool_size`` idle connections are kept; up to ``max_overflow`` extra
+    connections may be opened under load and are closed again on checkin.
+    Connections older than ``recycle`` seconds are replaced, and connections
+    idle for longer than ``pre_ping_after`` seconds are probed before reuse.
+    """
+
+    def __init__(
+        self,
+        creator: Callable[[], Any],
+        *,
+        pool_size: int = 5,
+        max_overflow: int = 10,
+        timeout: float = 10.0,
+        recycle: float = 3600.0,
+        pre_ping_after: float = 30.0,
+        is_disconnect: Optional[Callable[[Exception], bool]] = None,
+    ):
+        self._creator = creator
+        self._pool_size = max(pool_size, 1)
+        self._capacity = self._pool_size + max(max_overflow, 0)
+        self._timeout = timeout
+        self._recycle = recycle
+        self._pre_ping_after = pre_ping_after
+        self._is_disconnect = is_disconnect or (lambda e: False)
+
+        self._idle: Deque[PooledConnection] = deque()
+        self._size = 0
+        self._checked_out = 0
+        self._cond = threading.Condition()
+
+    def checkout(self) -> PooledConnection:
+        deadline = time.monotonic() + self._timeout
+
+        while True:
+            pc: Optional[PooledConnection] = None
+            create = False
+
+            with self._cond:
+                while pc is None and not create:
+                    if self._idle:
+                        pc = self._idle.pop()
+                    elif self._size < self._capacity:
+                        self._size += 1
+                        create = True
+                    else:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise DatabaseError(
+                                message="Timed out waiting for a database connection",
+                                details=self.status(),
+                            )
+                        self._cond.wait(remaining)
+                self._checked_out += 1
+
+            if create:
+                try:
+                    return PooledConnection(self._creator())
+                except Exception:
+                    self._release_slot(checked_out=True)
+                    raise
+
+            if self._is_stale(pc) or not self._ping(pc):
+                pc.close()
+                self._release_slot(checked_out=True)
+                continue
+
+            return pc
+
+    def checkin(self, pc: PooledConnection) -> None:
+        pc.last_used = time.monotonic()
+
+        if pc.invalidated:
+            pc.close()
+            self._release_slot(checked_out=True)
+            return
+
+        with self._cond:
+            self._checked_out -= 1
+            if len(self._idle) < self._pool_size:
+                self._idle.append(pc)
+                self._cond.notify()
+                return
+            self._size -= 1
+            self._cond.notify()
+
+        # Overflow connection: not worth keeping around once load drops.
+        pc.close()
+
+    def invalidate(self, pc: PooledConnection) -> None:
+        """Mark a single connection as broken so checkin discards it."""
+        pc.invalidated = True
+
+    @contextmanager
+    def connection(self) -> Iterator[PooledConnection]:
+        pc = self.checkout()
+        try:
+            yield pc
+        except Exception as e:
+            if self._is_disconnect(e):
+                self.invalidate(pc)
+            raise
+        finally:
+            self.checkin(pc)
+
+    def warm(self, count: Optional[int] = None) -> int:
+        """Open connections until `count` (pool_size by default) are idle; returns the idle count."""
+
+        held = []
+        try:
+            for _ in range(min(count or self._pool_size, self._pool_size)):
+                held.append(self.checkout())
+        finally:
+            for pc in held:
+                self.checkin(pc)
+
+        return len(self._idle)
+
+    def dispose(self) -> None:
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+
+        for pc in idle:
+            pc.close()
+
+    def status(self) -> Dict[str, int]:
+        return {
+            "pool_size": self._pool_size,
+            "capacity": self._capacity,
+            "open": self._size,
+            "idle": len(self._idle),
+            "checked_out": self._checked_out,
+        }
+
+    def _release_slot(self, checked_out: bool = False) -> None:
+        with self._cond:
+            self._size -= 1
+            if checked_out:
+                self._checked_out -= 1
+            self._cond.notify()
+
+    def _is_stale(self, pc: PooledConnection) -> bool:
+        return self._recycle > 0 and time.monotonic() - pc.created_at > self._recycle
+
+    def _ping(self, pc: PooledConnection) -> bool:
+        if time.monotonic() - pc.last_used < self._pre_ping_after:
+            return True
+
+        if getattr(pc.raw, "open", True) is False:
+            return False
+
+        try:
+            with pc.cursor() as cursor:
+                cursor.execute("SELECT 1")
+                cursor.fetchall()
+            return True
+        except Exception as e:
+            logger.warning("Discarding pooled connection that failed its health check: %s", e)
+            return False
@@ -0,0 +1,136 @@
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+
+class RetryPolicy:
+    """Backoff between attempts at a statement that failed with a transient error.
+
+    Delays double from backoff_initial up to backoff_max, and half of each delay is
+    random so that requests which failed together do not retry together. How long to
+    keep trying is bounded by the caller's deadline, not by the policy.
+    """
+
+    def __init__(
+        self,
+        backoff_initial: float = 0.8,
+        backoff_max: float = 5.0,
+        max_attempts: Optional[int] = None,
+        wait_when_open: bool = False,
+    ):
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.max_attempts = max_attempts
+        # Sleep through an open circuit instead of failing fast (warm-up probes).
+        self.wait_when_open = wait_when_open
+
+    def allows(self, attempt: int) -> bool:
+        """Whether another attempt may follow attempt number `attempt`."""
+        return self.max_attempts is None or attempt < self.max_attempts
+
+    def delay(self, attempt: int) -> float:
+        ceiling = min(self.backoff_initial * (2 ** (attempt - 1)), self.backoff_max)
+        return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+
+NO_RETRY = RetryPolicy(max_attempts=1)
+
+
+class CircuitBreaker:
+    """Fails statements fast once a warehouse keeps failing with transient errors.
+
+    After `threshold` consecutive transient failures the circuit opens and statements are
+    rejected without touching the warehouse for `cooldown` seconds. Then one trial
+    statement is let through: its success closes the circuit, its failure reopens it.
+    A trial that never reports back frees its slot after another cooldown.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, threshold: int = 5, cooldown: float = 30.0):
+        self.threshold = max(threshold, 1)
+        self.cooldown = cooldown
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_started: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return self.CLOSED
+            if time.monotonic() - self._opened_at < self.cooldown:
+                return self.OPEN
+            return self.HALF_OPEN
+
+    def retry_after(self) -> float:
+        """Seconds until a trial statement may run; 0 when the circuit is closed."""
+
+        with self._lock:
+            if self._opened_at is None:
+                return 0.0
+            now = time.monotonic()
+            reopen = self._opened_at + self.cooldown
+            if self._trial_started is not None:
+                reopen = max(reopen, self._trial_started + self.cooldown)
+            return max(reopen - now, 0.0)
+
+    def admit(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+
+            now = time.monotonic()
+            if now - self._opened_at < self.cooldown:
+                return False
+            if self._trial_started is not None and now - self._trial_started < self.cooldown:
+                return False
+
+            self._trial_started = now
+            return True
+
+    def success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_started = None
+
+    def failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._opened_at is not None or self._failures >= self.threshold:
+                self._opened_at = time.monotonic()
+                self._trial_started = None
+
+
+# Monotonic time by which the current request's warehouse work must be done. Executor
+# threads see it too, as they run in a copy of the caller's context.
+_deadline: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+
+@contextmanager
+def deadline(seconds: Optional[float]) -> Iterator[None]:
+    """Bound every statement run inside the block to `seconds` from now. A deadline set
+    inside another can only shorten it."""
+
+    if seconds is None:
+        yield
+        return
+
+    until = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(until if current is None else min(current, until))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def current_deadline() -> Optional[float]:
+    return _deadline.get()
@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+from zoneinfo import ZoneInfo
+from config.settings import get_settings
+from .connector import aquery, get_pool, run_blocking
+from .resilience import RetryPolicy
+
+logger = logging.getLogger(__name__)
+
+PROBE_QUERY = "SELECT 1"
+
+
+class Readiness:
+    """Whether the warehouse answered the latest probe, reported by /readiness."""
+
+    def __init__(self):
+        self.ready = False
+        self.status = "STARTING"
+        self.last_probe: Optional[float] = None
+        self.last_latency: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    def record(self, latency: Optional[float] = None, error: Optional[Exception] = None) -> None:
+        self.last_probe = time.time()
+        if error is None:
+            self.ready = True
+            self.status = "READY"
+            self.last_latency = latency
+            self.last_error = None
+        else:
+            self.ready = False
+            self.status = "UNAVAILABLE"
+            self.last_error = str(error)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "status": self.status,
+            "last_probe": datetime.fromtimestamp(self.last_probe, tz=timezone.utc).isoformat() if self.last_probe else None,
+            "probe_latency_ms": round(self.last_latency * 1000, 1) if self.last_latency is not None else None,
+            "error": self.last_error,
+        }
+
+
+readiness = Readiness()
+
+
+async def probe(warehouse_id: str, max_wait_seconds: float) -> float:
+    """Run the probe query, waiting for a stopped warehouse to come up; returns its latency.
+
+    Unlike requests, probes sit out an open circuit rather than failing fast, since the
+    warehouse is expected to be unavailable while it starts.
+    """
+
+    settings = get_settings()
+    retry = RetryPolicy(settings.db_retry_backoff_initial, settings.db_retry_backoff_max, wait_when_open=True)
+
+    start = time.monotonic()
+    await aquery(PROBE_QUERY, warehouse_id, retry=retry, timeout=max_wait_seconds)
+    return time.monotonic() - start
+
+
+async def warm_up(warehouse_id: str) -> None:
+    """Open the pool's idle connections and wake the warehouse before traffic arrives."""
+
+    settings = get_settings()
+    readiness.status = "WARMING"
+
+    try:
+        opened = await run_blocking(get_pool(warehouse_id).warm)
+        await probe(warehouse_id, settings.warmup_max_wait_seconds)
+        # The first statement on a woken warehouse is slow; time a second one.
+        latency = await probe(warehouse_id, settings.warmup_max_wait_seconds)
+    except Exception as e:
+        logger.error("Warehouse warm-up failed: %s", e)
+        readiness.record(error=e)
+        return
+
+    readiness.record(latency=latency)
+    logger.info("Warehouse warm: %d pooled connections, probe %.0f ms", opened, latency * 1000)
+
+
+def within_hours(now: datetime, hours: Optional[str]) -> bool:
+    """`hours` is "HH-HH" (start inclusive, end exclusive, may wrap midnight); empty means always."""
+
+    if not hours:
+        return True
+
+    start, _, end = hours.partition("-")
+    start, end = int(start), int(end)
+    if start <= end:
+        return start <= now.hour < end
+    return now.hour >= start or now.hour < end
+
+
+async def keep_alive(warehouse_id: str) -> None:
+    """Probe the warehouse periodically during business hours so it does not auto-stop and
+    pooled sessions stay fresh. Outside those hours the warehouse may suspend; probes
+    continue only while the service is not ready."""
+
+    settings = get_settings()
+    zone = ZoneInfo(settings.keepalive_timezone)
+
+    while True:
+        await asyncio.sleep(settings.keepalive_interval_seconds)
+
+        if readiness.ready and not within_hours(datetime.now(zone), settings.keepalive_hours):
+            continue
+
+        try:
+            latency = await probe(warehouse_id, settings.warmup_max_wait_seconds)
+        except Exception as e:
+            logger.warning("Warehouse keep-alive probe failed: %s", e)
+            readiness.record(error=e)
+            continue
+
+        readiness.record(latency=latency)
+
+
+async def run(warehouse_id: Optional[str]) -> None:
+    """Warm-up followed by the keep-alive loop; the lifespan runs this as a background task."""
+
+    if not warehouse_id:
+        readiness.status = "UNCONFIGURED"
+        readiness.last_error = "SQL warehouse ID not configured"
+        return
+
+    await warm_up(warehouse_id)
+    await keep_alive(warehouse_id)
@@ -0,0 +1,213 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from config.settings import get_settings
+
+# Seconds; covers a cached hit through a warehouse that is still starting.
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # label values -> (per-bucket counts, +Inf count, sum)
+        self._values: Dict[Tuple[str, ...], List] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [[0] * len(self.buckets), 0, 0.0]
+            if index < len(self.buckets):
+                counts[0][index] += 1
+            counts[1] += 1
+            counts[2] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (buckets, count, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, buckets):
+                    cumulative += bucket_count
+                    le = _labels(self.labelnames, key, 'le="%s"' % bound)
+                    lines.append(f"{self.name}_bucket{le} {cumulative}")
+                le = _labels(self.labelnames, key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{le} {count}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {total}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class Registry:
+    """In-process metrics rendered in the Prometheus text format.
+
+    Collectors are callbacks returning already formatted lines, for values such as
+    pool sizes that are read at scrape time rather than recorded.
+    """
+
+    def __init__(self):
+        self._metrics: List = []
+        self._collectors: List[Callable[[], List[str]]] = []
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Histogram:
+        metric = Histogram(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, collect: Callable[[], List[str]]) -> None:
+        self._collectors.append(collect)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collect in self._collectors:
+            lines.extend(collect())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+REQUEST_SECONDS = registry.histogram(
+    "cx_dva_request_seconds", "Request latency", ("route", "method", "status")
+)
+STAGE_SECONDS = registry.histogram(
+    "cx_dva_stage_seconds", "Time spent in each stage of a request",
+    ("route", "product_type", "level", "table", "stage"),
+)
+QUERY_RETRIES = registry.counter(
+    "cx_dva_query_retries_total", "Warehouse statements retried after a transient error", ("warehouse",)
+)
+COALESCED_QUERIES = registry.counter(
+    "cx_dva_coalesced_queries_total", "Statements served by an identical in-flight execution", ("warehouse",)
+)
+BREAKER_REJECTIONS = registry.counter(
+    "cx_dva_circuit_rejections_total", "Statements failed fast while the warehouse circuit was open", ("warehouse",)
+)
+CANCELLED_STATEMENTS = registry.counter(
+    "cx_dva_cancelled_statements_total", "Statements cancelled on the warehouse", ("warehouse", "reason")
+)
+CACHE_LOOKUPS = registry.counter(
+    "cx_dva_cache_lookups_total", "Cache lookups by cache and outcome", ("cache", "result")
+)
+
+
+class RequestTimings:
+    """Labels and accumulated stage durations of one request, shared with the DB threads."""
+
+    def __init__(self, route: str):
+        self.labels = {"route": route, "product_type": "", "level": ""}
+        self.stages: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def server_timing(self) -> str:
+        with self._lock:
+            return ", ".join(
+                f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in self.stages.items()
+            )
+
+
+_current: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+def begin(route: str) -> RequestTimings:
+    timings = RequestTimings(route)
+    _current.set(timings)
+    return timings
+
+
+def product_type_label(product_type: Optional[str]) -> str:
+    """product_type comes from the client; only known values become their own series."""
+
+    if not product_type:
+        return ""
+    return product_type if product_type in get_settings().metric_product_types else "other"
+
+
+def label(**labels: Optional[str]) -> None:
+    """Attach product_type / level to the current request's stage metrics."""
+
+    timings = _current.get()
+    if timings is not None:
+        if "product_type" in labels:
+            labels["product_type"] = product_type_label(labels["product_type"])
+        timings.labels.update({name: value or "" for name, value in labels.items()})
+
+
+def record(stage: str, seconds: float, table: str = "") -> None:
+    timings = _current.get()
+    labels = timings.labels if timings is not None else {}
+
+    STAGE_SECONDS.observe(
+        seconds,
+        route=labels.get("route", ""),
+        product_type=labels.get("product_type", ""),
+        level=labels.get("level", ""),
+        table=table,
+        stage=stage,
+    )
+
+    if timings is not None:
+        timings.add(stage, seconds)
+
+
+@contextmanager
+def stage(name: str, table: str = "") -> Iterator[None]:
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        record(name, time.monotonic() - start, table)
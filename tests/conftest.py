@@ -0,0 +1,32 @@
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Route tests run against the seeded sqlite stand-in of the warehouse. Settings are read
+# at import, so this has to happen before any module of the app is imported.
+for name, value in {
+    "WAREHOUSE_BACKEND": "fake",
+    "FAKE_WAREHOUSE_PATH": os.path.join(tempfile.gettempdir(), f"cx_dva_tests_{os.getpid()}.sqlite"),
+    "DATABRICKS_WAREHOUSE_ID": "test",
+    "DATABRICKS_CATALOG": "main",
+    "DATABRICKS_SCHEMA": "cx",
+    "DATABRICKS_TABLE_MODE": "rcs_da_mode_curated",
+    "DATABRICKS_TABLE_USAGE": "rcs_da_usage_curated",
+    "DATABRICKS_TABLE_1MIN": "rcs_da_1min_curated",
+    "DATABRICKS_TABLE_5MIN": "rcs_da_5min_curated",
+    "DATABRICKS_TABLE_15MIN": "rcs_da_15min_curated",
+    "DATABRICKS_TABLE_1HOUR": "rcs_da_1hr_curated",
+    "DATABRICKS_TABLE_6HOUR": "rcs_da_6hr_curated",
+    "DATABRICKS_TABLE_1DAY": "rcs_da_daily_curated",
+    "DATABRICKS_TABLE_1WEEK": "rcs_da_weekly_curated",
+}.items():
+    os.environ.setdefault(name, value)
+
+
+def pytest_sessionfinish(session, exitstatus):
+    try:
+        os.remove(os.environ["FAKE_WAREHOUSE_PATH"])
+    except OSError:
+        pass
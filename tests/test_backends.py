@@ -0,0 +1,36 @@
+import os
+import pytest
+
+from errors.exceptions import ConfigurationError
+from services.cache.backends import MemoryBackend, SqliteBackend
+
+
+def test_sqlite_round_trip_in_a_private_directory(tmp_path):
+    path = tmp_path / "cache" / "results.sqlite"
+    backend = SqliteBackend(str(path))
+
+    backend.set("key", {"mac": {"UPHTRTMP": [{"median_val": 1.5}]}}, ttl=60)
+
+    assert backend.get("key") == {"mac": {"UPHTRTMP": [{"median_val": 1.5}]}}
+    assert os.stat(path.parent).st_mode & 0o077 == 0
+    assert SqliteBackend.blocking and not MemoryBackend.blocking
+
+
+@pytest.mark.parametrize("mode", [0o777, 0o775])
+def test_sqlite_refuses_a_directory_others_can_write(tmp_path, mode):
+    directory = tmp_path / "shared"
+    directory.mkdir()
+    directory.chmod(mode)
+
+    with pytest.raises(ConfigurationError):
+        SqliteBackend(str(directory / "results.sqlite"))
+
+
+def test_sqlite_refuses_a_symlinked_file(tmp_path):
+    directory = tmp_path / "cache"
+    directory.mkdir(mode=0o700)
+    (tmp_path / "elsewhere.sqlite").touch()
+    (directory / "results.sqlite").symlink_to(tmp_path / "elsewhere.sqlite")
+
+    with pytest.raises(ConfigurationError):
+        SqliteBackend(str(directory / "results.sqlite"))
@@ -0,0 +1,47 @@
+import json
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+
+from routes.v1.utils import columnar
+
+FIELDS = [("start_timestamp", True), ("median_val", False), ("label", False), ("count", False)]
+
+
+def _decoded(table, keep_nulls=True):
+    return [json.loads(row) for row in columnar.encode_windows(table, FIELDS, keep_nulls, "Z").to_pylist()]
+
+
+def test_non_finite_floats_become_null():
+    table = pa.table({
+        "start_timestamp": pa.array([0, 60, 120], pa.timestamp("s", tz="UTC")),
+        "median_val": [1.5, float("nan"), float("-inf")],
+    })
+
+    rows = _decoded(table)
+
+    assert [row["median_val"] for row in rows] == [1.5, None, None]
+    assert rows[1]["start_timestamp"] == "1970-01-01T00:01:00Z"
+
+
+def test_non_finite_floats_are_omitted_without_keep_nulls():
+    table = pa.table({
+        "start_timestamp": pa.array([0], pa.timestamp("s", tz="UTC")),
+        "median_val": [float("inf")],
+    })
+
+    assert _decoded(table, keep_nulls=False) == [{"start_timestamp": "1970-01-01T00:00:00Z"}]
+
+
+def test_string_columns_are_json_quoted():
+    table = pa.table({
+        "start_timestamp": pa.array([0, 60], pa.timestamp("s", tz="UTC")),
+        "label": ['say "hi"\n', None],
+        "count": [3, None],
+    })
+
+    rows = _decoded(table)
+
+    assert rows[0]["label"] == 'say "hi"\n'
+    assert rows[0]["count"] == 3
+    assert rows[1]["label"] is None and rows[1]["count"] is None
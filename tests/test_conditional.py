@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta, timezone
+import pytest
+from fastapi.testclient import TestClient
+
+import app
+from config.settings import get_settings
+from services.cache.watermarks import get_watermark_cache
+from services.db import connector, fake
+
+URL = "/api/v1/deviceHistory"
+
+
+@pytest.fixture(scope="module")
+def client():
+    return TestClient(app.app)
+
+
+@pytest.fixture
+def watermark_reads(monkeypatch):
+    reads = []
+    execute = connector._execute
+
+    def counting(sql_query, *args, **kwargs):
+        if "AS watermark" in sql_query:
+            reads.append(sql_query)
+        return execute(sql_query, *args, **kwargs)
+
+    monkeypatch.setattr(connector, "_execute", counting)
+    get_watermark_cache()._values.clear()
+    return reads
+
+
+def _params(product_type, to):
+    return {
+        "mac_address": fake.devices()[product_type][1],
+        "product_type": product_type,
+        "from": (to - timedelta(hours=6)).isoformat(),
+        "to": to.isoformat(),
+    }
+
+
+def test_unconditional_request_reads_no_watermarks(client, watermark_reads):
+    params = _params("heatpumpWaterHeaterGen5", datetime.now(timezone.utc) - timedelta(days=1))
+
+    response = client.get(URL, params=params)
+
+    assert response.status_code == 200
+    assert "etag" not in response.headers
+    assert "immutable" not in response.headers["cache-control"]
+    assert watermark_reads == []
+
+
+def test_settled_window_is_immutable_once_every_table_has_later_rows(client, watermark_reads):
+    params = _params("heatpumpWaterHeaterGen5", datetime.now(timezone.utc) - timedelta(days=1))
+
+    response = client.get(URL, params=params, headers={"If-None-Match": 'W/"other"'})
+
+    assert response.status_code == 200
+    assert response.headers["cache-control"].endswith("immutable")
+    assert len(watermark_reads) == 2
+
+    # The watermarks are cached now: plain requests get the validator for free.
+    assert client.get(URL, params=params).headers["etag"] == response.headers["etag"]
+    assert client.get(URL, params=params, headers={"If-None-Match": response.headers["etag"]}).status_code == 304
+    assert len(watermark_reads) == 2
+
+
+def test_window_past_the_mode_watermark_is_not_immutable(client, watermark_reads, monkeypatch):
+    # Mode windows are written when they close, so a window ending now is settled by the
+    # clock alone but no mode row past its end exists yet.
+    monkeypatch.setattr(get_settings(), "window_cache_settle_seconds", 0)
+    params = _params("econetZoneController", datetime.now(timezone.utc))
+
+    response = client.get(URL, params=params, headers={"If-None-Match": 'W/"other"'})
+
+    assert response.status_code == 200
+    assert "immutable" not in response.headers["cache-control"]
+    assert response.headers["etag"]
@@ -0,0 +1,42 @@
+from datetime import datetime, timezone
+from decimal import Decimal
+import pytest
+
+from routes.v1.utils import formats
+
+
+@pytest.mark.parametrize("accept, expected", [
+    (None, "json"),
+    ("*/*", "json"),
+    ("text/plain", "json"),
+    ("text/csv", "json"),
+    ("application/msgpack", "msgpack"),
+    ("application/msgpack;q=0.5, text/csv", "msgpack"),
+    ("application/json;q=0.5, application/msgpack", "msgpack"),
+    ("application/msgpack;q=0", "json"),
+])
+def test_accept_falls_back_to_json(accept, expected):
+    assert formats.negotiate_format(None, accept, ("json", "msgpack")) == expected
+
+
+def test_accept_skips_formats_the_route_does_not_offer():
+    assert formats.negotiate_format(None, "application/vnd.apache.parquet, application/msgpack;q=0.1", ("json", "msgpack")) == "msgpack"
+    assert formats.negotiate_format(None, "application/vnd.apache.parquet", ("json",)) == "json"
+
+
+def test_only_an_explicit_format_is_refused():
+    assert formats.negotiate_format("csv", None) is None
+    assert formats.negotiate_format("arrow", "application/json", ("json", "msgpack")) is None
+    assert formats.negotiate_format("msgpack", "text/csv", ("json", "msgpack")) == "msgpack"
+
+
+def test_msgpack_carries_the_json_strings():
+    msgpack = pytest.importorskip("msgpack")
+    start = datetime(2025, 9, 1, tzinfo=timezone.utc)
+
+    body = formats.to_msgpack(({"a": [{"start_timestamp": start, "value": Decimal("1.5")}]}, False), ({"b": start}, True))
+
+    assert msgpack.unpackb(body) == {
+        "a": [{"start_timestamp": "2025-09-01T00:00:00+00:00", "value": 1.5}],
+        "b": "2025-09-01T00:00:00Z",
+    }
@@ -0,0 +1,47 @@
+from datetime import datetime, timedelta, timezone
+
+from services.cache.latest import LatestIndex
+
+MAC = "02:00:00:00:00:00"
+SKEWED = "02:00:00:00:00:01"
+
+
+def _row(mac, attribute, end):
+    return {
+        "mac_address": mac,
+        "product_type": "heatpumpWaterHeaterGen5",
+        "attribute": attribute,
+        "start_timestamp": end - timedelta(minutes=1),
+        "end_timestamp": end,
+        "median_val": 1.0,
+    }
+
+
+def test_future_rows_do_not_move_the_watermark_past_now():
+    index = LatestIndex()
+    now = datetime.now(timezone.utc)
+
+    index.update("agg", "attribute", [_row(MAC, "UPHTRTMP", now - timedelta(minutes=5)), _row(SKEWED, "UPHTRTMP", now + timedelta(days=30))])
+
+    assert index.watermark("agg") <= datetime.now(timezone.utc)
+    assert index.get(SKEWED)["agg"]["UPHTRTMP"]["end_timestamp"] == now + timedelta(days=30)
+
+
+def test_naive_timestamps_are_read_as_utc():
+    index = LatestIndex()
+    end = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(hours=1)
+
+    index.update("agg", "attribute", [_row(MAC, "UPHTRTMP", end)])
+
+    assert index.watermark("agg") == end.replace(tzinfo=timezone.utc)
+    assert index.evict("agg", datetime.now(timezone.utc) - timedelta(minutes=30)) == 1
+    assert index.get(MAC) is None
+
+
+def test_evict_keeps_windows_ending_after_the_cutoff():
+    index = LatestIndex()
+    now = datetime.now(timezone.utc)
+    index.update("agg", "attribute", [_row(MAC, "UPHTRTMP", now - timedelta(hours=7)), _row(MAC, "LOHTRTMP", now - timedelta(hours=1))])
+
+    assert index.evict("agg", now - timedelta(hours=6)) == 1
+    assert list(index.get(MAC)["agg"]) == ["LOHTRTMP"]
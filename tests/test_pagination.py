@@ -0,0 +1,99 @@
+from datetime import datetime, timedelta, timezone
+import pytest
+from fastapi.testclient import TestClient
+
+import app
+from routes.v1.utils import pagination
+from services.db import fake
+
+URL = "/api/v1/deviceHistory"
+
+
+@pytest.fixture(scope="module")
+def client():
+    return TestClient(app.app)
+
+
+def _params(product_type, hours=6, attributes=None):
+    # The fake warehouse holds history up to when it was seeded.
+    end = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0) - timedelta(days=1)
+    params = {
+        "mac_address": fake.devices()[product_type][0],
+        "product_type": product_type,
+        "from": (end - timedelta(hours=hours)).isoformat(),
+        "to": end.isoformat(),
+    }
+    if attributes:
+        params["attributes"] = attributes
+    return params
+
+
+def _windows(body):
+    """{(section, attribute): windows} of one device's response."""
+
+    sections = [(None, body)] if "attributes" in body else body.items()
+    return {
+        (section, attribute): windows
+        for section, payload in sections
+        for attribute, windows in payload.get("attributes", {}).items()
+    }
+
+
+def _walk(client, params, limit):
+    merged, pages, token = {}, 0, None
+    while True:
+        response = client.get(URL, params={**params, "limit": limit, **({"cursor": token} if token else {})})
+        assert response.status_code == 200, response.text
+        pages += 1
+        assert len(response.json()) == 1
+        for key, windows in _windows(response.json()[params["mac_address"]]).items():
+            merged.setdefault(key, []).extend(windows)
+        token = response.headers.get("x-next-cursor")
+        if token is None:
+            return merged, pages
+
+
+@pytest.mark.parametrize("product_type, attributes", [
+    ("heatpumpWaterHeaterGen5", None),
+    ("heatpumpWaterHeaterGen5", ["UPHTRTMP", "TOTALKWH"]),
+    ("econetControlCenter", None),
+    ("econetZoneController", None),
+])
+@pytest.mark.parametrize("limit", [1, 7, 200])
+def test_pages_concatenate_to_the_full_result(client, product_type, attributes, limit):
+    params = _params(product_type, attributes=attributes)
+    full = _windows(client.get(URL, params=params).json()[params["mac_address"]])
+    total = sum(map(len, full.values()))
+    assert total > 0
+
+    merged, pages = _walk(client, params, limit)
+
+    assert merged == full
+    assert pages >= -(-total // limit)
+
+
+def test_page_links_to_the_next_one(client):
+    params = _params("heatpumpWaterHeaterGen5")
+
+    response = client.get(URL, params={**params, "limit": 5})
+
+    token = response.headers["x-next-cursor"]
+    assert f"cursor={token}" in response.headers["link"]
+    assert pagination.decode_cursor(token).source == "agg"
+
+
+def test_cursor_is_rejected_on_another_query(client):
+    params = _params("heatpumpWaterHeaterGen5")
+    token = client.get(URL, params={**params, "limit": 5}).headers["x-next-cursor"]
+
+    assert client.get(URL, params={**_params("heatpumpWaterHeaterGen5", hours=7), "cursor": token}).status_code == 400
+    assert client.get(URL, params={**params, "cursor": "junk"}).status_code == 400
+
+
+def test_cursor_round_trip():
+    cursor = pagination.Cursor("agg", "UPHTRTMP", datetime(2025, 9, 1, 0, 5, tzinfo=timezone.utc), "0123456789abcdef")
+
+    assert pagination.decode_cursor(pagination.encode_cursor(cursor)) == cursor
+    assert pagination.decode_cursor(pagination.encode_cursor(cursor._replace(attribute=None, start=None))).start is None
+    with pytest.raises(ValueError):
+        pagination.decode_cursor("bm90IGEgY3Vyc29y")
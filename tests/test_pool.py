@@ -0,0 +1,115 @@
+import threading
+import time
+import pytest
+
+from errors.exceptions import DatabaseError
+from services.db.pool import ConnectionPool
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def _pool(**kwargs):
+    opened = []
+
+    def creator():
+        opened.append(FakeConnection())
+        return opened[-1]
+
+    return ConnectionPool(creator, **kwargs), opened
+
+
+def test_capacity_is_pool_size_plus_overflow():
+    pool, opened = _pool(pool_size=2, max_overflow=1, timeout=0.05)
+
+    held = [pool.checkout() for _ in range(3)]
+
+    assert len(opened) == 3
+    assert pool.status()["checked_out"] == 3
+    with pytest.raises(DatabaseError):
+        pool.checkout()
+
+    for pc in held:
+        pool.checkin(pc)
+
+    # The overflow connection is closed on checkin; pool_size stay idle.
+    assert pool.status() == {"pool_size": 2, "capacity": 3, "open": 2, "idle": 2, "checked_out": 0}
+    assert [c.closed for c in opened].count(True) == 1
+
+
+def test_checkout_times_out_after_timeout():
+    pool, _ = _pool(pool_size=1, max_overflow=0, timeout=0.2)
+    pool.checkout()
+
+    started = time.monotonic()
+    with pytest.raises(DatabaseError):
+        pool.checkout()
+
+    assert 0.15 <= time.monotonic() - started < 2
+    assert pool.status()["checked_out"] == 1
+
+
+def test_checkout_waits_for_a_checkin():
+    pool, opened = _pool(pool_size=1, max_overflow=0, timeout=5)
+    pc = pool.checkout()
+
+    threading.Timer(0.1, pool.checkin, (pc,)).start()
+
+    assert pool.checkout() is pc
+    assert len(opened) == 1
+
+
+def test_idle_connections_are_reused_lifo():
+    pool, opened = _pool(pool_size=2, max_overflow=0)
+    first, second = pool.checkout(), pool.checkout()
+    pool.checkin(first)
+    pool.checkin(second)
+
+    assert pool.checkout() is second
+    assert len(opened) == 2
+
+
+def test_invalidated_connection_is_discarded_on_checkin():
+    pool, opened = _pool(pool_size=1, max_overflow=0, timeout=0.05)
+    pc = pool.checkout()
+
+    pool.invalidate(pc)
+    pool.checkin(pc)
+
+    assert opened[0].closed
+    assert pool.status()["open"] == 0 and pool.status()["idle"] == 0
+
+    # Its slot is free again: the next checkout opens a new connection.
+    replacement = pool.checkout()
+    assert replacement is not pc and replacement.raw is opened[1]
+
+
+def test_connection_invalidates_on_disconnect_errors():
+    pool, opened = _pool(pool_size=1, max_overflow=0, is_disconnect=lambda e: isinstance(e, ConnectionError))
+
+    with pytest.raises(ValueError):
+        with pool.connection():
+            raise ValueError("bad statement")
+    assert pool.status()["idle"] == 1 and not opened[0].closed
+
+    with pytest.raises(ConnectionError):
+        with pool.connection():
+            raise ConnectionError("connection reset")
+    assert pool.status()["open"] == 0 and opened[0].closed
+
+
+def test_failed_connect_frees_its_slot():
+    def creator():
+        raise ConnectionError("warehouse unreachable")
+
+    pool = ConnectionPool(creator, pool_size=1, max_overflow=0, timeout=0.05)
+
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            pool.checkout()
+    assert pool.status()["open"] == 0 and pool.status()["checked_out"] == 0
@@ -0,0 +1,87 @@
+import pytest
+
+from services.db import resilience
+from services.db.resilience import CircuitBreaker
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(resilience.time, "monotonic", clock)
+    return clock
+
+
+def _opened(threshold=3, cooldown=30.0):
+    breaker = CircuitBreaker(threshold=threshold, cooldown=cooldown)
+    for _ in range(threshold):
+        assert breaker.admit()
+        breaker.failure()
+    return breaker
+
+
+def test_opens_after_threshold_consecutive_failures(clock):
+    breaker = CircuitBreaker(threshold=3, cooldown=30.0)
+
+    breaker.failure()
+    breaker.failure()
+    breaker.success()
+    breaker.failure()
+    breaker.failure()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.admit()
+
+    breaker.failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.admit()
+    assert breaker.retry_after() == 30.0
+
+
+def test_open_half_open_closed(clock):
+    breaker = _opened()
+
+    clock.now += 29
+    assert breaker.state == CircuitBreaker.OPEN and not breaker.admit()
+
+    clock.now += 1
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.admit()
+    # Only one trial at a time.
+    assert not breaker.admit()
+
+    breaker.success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.retry_after() == 0.0
+    assert breaker.admit() and breaker.admit()
+
+
+def test_failed_trial_reopens(clock):
+    breaker = _opened()
+
+    clock.now += 30
+    assert breaker.admit()
+    breaker.failure()
+
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.admit()
+    assert breaker.retry_after() == 30.0
+
+
+def test_lost_trial_frees_its_slot_after_a_cooldown(clock):
+    breaker = _opened()
+
+    clock.now += 30
+    assert breaker.admit()
+
+    clock.now += 10
+    assert not breaker.admit()
+    assert breaker.retry_after() == 20.0
+
+    clock.now += 20
+    assert breaker.admit()
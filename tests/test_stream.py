@@ -0,0 +1,62 @@
+import asyncio
+import time
+import pytest
+
+from errors.exceptions import DeadlineExceededError
+from services.db import connector
+from services.db.resilience import deadline
+
+WAREHOUSE = "stream-test"
+
+
+async def _drain(*args, **kwargs):
+    return [rows async for rows in connector.astream(*args, **kwargs)]
+
+
+async def _until_checked_out(pool, count):
+    # Connections go back to the pool on the executor.
+    for _ in range(50):
+        if pool.status()["checked_out"] == count:
+            return
+        await asyncio.sleep(0.02)
+
+
+def test_waiting_for_a_connection_is_bounded_by_the_deadline():
+    pool = connector.get_pool(WAREHOUSE)
+    breaker = connector.get_breaker(WAREHOUSE)
+    held = [pool.checkout() for _ in range(pool.status()["capacity"])]
+    failures = breaker._failures
+
+    async def main():
+        with deadline(0.3):
+            started = time.monotonic()
+            with pytest.raises(DeadlineExceededError):
+                await _drain("SELECT 1", WAREHOUSE)
+            assert time.monotonic() - started < 1
+
+        # The abandoned checkout gets the connection freed now and hands it straight back.
+        pool.checkin(held.pop())
+        await asyncio.sleep(0.1)
+        await _until_checked_out(pool, len(held))
+        assert pool.status()["idle"] == 1
+
+    try:
+        asyncio.run(main())
+        assert pool.status()["checked_out"] == len(held)
+        assert breaker._failures == failures + 1
+    finally:
+        for pc in held:
+            pool.checkin(pc)
+        breaker.success()
+
+
+def test_stream_reads_every_row():
+    pool = connector.get_pool(WAREHOUSE)
+
+    async def main():
+        rows = await _drain("SELECT 1 AS a UNION ALL SELECT 2", WAREHOUSE, chunk_size=1)
+        await _until_checked_out(pool, 0)
+        return rows
+
+    assert asyncio.run(main()) == [[{"a": 1}], [{"a": 2}]]
+    assert pool.status()["checked_out"] == 0
@@ -0,0 +1,84 @@
+from datetime import datetime, timezone
+
+from services.cache.windows import WindowCache, from_epoch, to_epoch
+
+TABLE = ("main.cx.rcs_da_1min_curated", "heatpumpWaterHeaterGen5")
+MAC = "02:00:00:00:00:00"
+START = to_epoch(datetime(2025, 9, 1, tzinfo=timezone.utc))
+HOUR = 3600.0
+
+
+def _rows(start, end, step=60.0):
+    t, rows = start, []
+    while t < end:
+        rows.append({"start_timestamp": from_epoch(t), "end_timestamp": from_epoch(t + step), "median_val": t})
+        t += step
+    return rows
+
+
+def _filled(*ranges, attributes=None, settled_until=float("inf")):
+    cache = WindowCache()
+    for start, end in ranges:
+        grouped = {MAC: {attribute: _rows(start, end) for attribute in attributes or ["UPHTRTMP"]}}
+        cache.fill(TABLE, [MAC], attributes, start, end, [((start, end), grouped)], settled_until)
+    return cache
+
+
+def test_empty_cache_misses_the_whole_window():
+    assert WindowCache().gaps(TABLE, [MAC], None, START, START + HOUR) == [(START, START + HOUR)]
+
+
+def test_exactly_covered_window_has_no_gaps():
+    cache = _filled((START, START + HOUR))
+
+    assert cache.gaps(TABLE, [MAC], None, START, START + HOUR) == []
+    assert cache.gaps(TABLE, [MAC], None, START + 60, START + HOUR - 60) == []
+
+
+def test_window_sliding_past_either_edge_misses_only_the_overhang():
+    cache = _filled((START, START + HOUR))
+
+    assert cache.gaps(TABLE, [MAC], None, START + 600, START + HOUR + 600) == [(START + HOUR, START + HOUR + 600)]
+    assert cache.gaps(TABLE, [MAC], None, START - 600, START + HOUR - 600) == [(START - 600, START)]
+
+
+def test_window_touching_the_coverage_misses_all_of_itself():
+    cache = _filled((START, START + HOUR))
+
+    assert cache.gaps(TABLE, [MAC], None, START + HOUR, START + 2 * HOUR) == [(START + HOUR, START + 2 * HOUR)]
+    assert cache.gaps(TABLE, [MAC], None, START - HOUR, START) == [(START - HOUR, START)]
+
+
+def test_touching_ranges_merge_into_one_coverage():
+    cache = _filled((START, START + HOUR), (START + HOUR, START + 2 * HOUR))
+
+    assert cache.gaps(TABLE, [MAC], None, START, START + 2 * HOUR) == []
+
+
+def test_hole_between_ranges_is_the_only_gap():
+    cache = _filled((START, START + HOUR), (START + 2 * HOUR, START + 3 * HOUR))
+
+    assert cache.gaps(TABLE, [MAC], None, START, START + 3 * HOUR) == [(START + HOUR, START + 2 * HOUR)]
+
+
+def test_unsettled_tail_is_not_covered():
+    cache = _filled((START, START + HOUR), settled_until=START + HOUR - 900)
+
+    assert cache.gaps(TABLE, [MAC], None, START, START + HOUR) == [(START + HOUR - 900, START + HOUR)]
+
+
+def test_coverage_is_per_mac_and_attribute():
+    cache = _filled((START, START + HOUR), attributes=["UPHTRTMP"])
+
+    assert cache.gaps(TABLE, [MAC], ["UPHTRTMP"], START, START + HOUR) == []
+    assert cache.gaps(TABLE, [MAC], ["UPHTRTMP", "LOHTRTMP"], START, START + HOUR) == [(START, START + HOUR)]
+    assert cache.gaps(TABLE, [MAC, "02:00:00:00:00:01"], ["UPHTRTMP"], START, START + HOUR) == [(START, START + HOUR)]
+
+
+def test_fill_returns_the_rows_inside_the_window():
+    cache = _filled((START, START + HOUR))
+
+    result = cache.fill(TABLE, [MAC], None, START + 600, START + 1200, [], float("inf"))
+
+    rows = result[MAC]["UPHTRTMP"]
+    assert [to_epoch(row["start_timestamp"]) for row in rows] == [START + 600 + 60 * i for i in range(10)]